@@ -1,13 +1,19 @@
 """
 A component with a large number of inputs is finite differenced.
+
+Pass 'probe' or 'declared' on the command line to use compressed finite
+difference.
 """
 
+import sys
+
 import numpy as np
 
 from openmdao.lib.optproblems.scalable import Discipline
 from openmdao.main.api import Assembly, Component, set_as_top
 
 N = 100
+BANDWIDTH = 2
 np.random.seed(12345)
 
 class Model(Assembly):
@@ -15,13 +21,16 @@ class Model(Assembly):
     def configure(self):
 
         self.add('comp', Discipline(prob_size=N))
-        self.comp.C_y = np.random.random((N, N))
+        C_y = np.random.random((N, N))
+        self.comp.C_y = np.triu(np.tril(C_y, BANDWIDTH), -BANDWIDTH)
 
 if __name__ == "__main__":
 
     from time import time
 
     top = set_as_top(Model())
+    if len(sys.argv) > 1:
+        top.driver.gradient_options.fd_coloring = sys.argv[1]
     top.run()
 
     inputs = ['comp.y_in']
@@ -29,11 +38,17 @@ if __name__ == "__main__":
     inputs = ['comp.y_in[%d, 0]'%n for n in range(N)]
     outputs = ['comp.y_out[%d, 0]'%n for n in range(N)]
 
-    t0 = time()
-    J = top.driver.workflow.calc_gradient(inputs=inputs,
-                                          outputs=outputs,
-                                          mode = 'fd')
-    print 'Time elapsed', time() - t0
+    # With 'probe', the gradients at the first two points find the sparsity
+    # pattern.
+    for i in range(3):
+        t0 = time()
+        J = top.driver.workflow.calc_gradient(inputs=inputs,
+                                              outputs=outputs,
+                                              mode = 'fd')
+        print 'Time elapsed', time() - t0
+
+        top.comp.y_in = top.comp.y_in + 0.1
+        top.run()
 
 
     # python -m cProfile -s time fd_scalable.py >z
\ No newline at end of file
@@ -111,6 +111,7 @@ Component, Driver, Variable and other plugins for OpenMDAO
       openmdao.lib.casehandlers.caseset.CaseSet = openmdao.lib.casehandlers.caseset:CaseSet
       openmdao.lib.casehandlers.jsoncase.JSONCaseRecorder = openmdao.lib.casehandlers.jsoncase:JSONCaseRecorder
       openmdao.lib.casehandlers.jsoncase.BSONCaseRecorder = openmdao.lib.casehandlers.jsoncase:BSONCaseRecorder
+      openmdao.lib.casehandlers.columncase.ColumnCaseRecorder = openmdao.lib.casehandlers.columncase:ColumnCaseRecorder
 
       [openmdao.caseiterator]
       openmdao.lib.casehandlers.listcase.ListCaseIterator = openmdao.lib.casehandlers.listcase:ListCaseIterator
@@ -15,6 +15,8 @@ from openmdao.lib.casehandlers.dumpcase import DumpCaseRecorder
 
 from openmdao.lib.casehandlers.jsoncase import JSONCaseRecorder, \
                                                BSONCaseRecorder
+from openmdao.lib.casehandlers.columncase import ColumnCaseRecorder
+from openmdao.lib.casehandlers.asynccase import AsyncCaseRecorder
 
 from openmdao.lib.casehandlers.listcase import ListCaseRecorder, \
                                                ListCaseIterator
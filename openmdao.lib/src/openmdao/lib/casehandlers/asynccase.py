@@ -0,0 +1,155 @@
+"""
+Case Recording in a background thread.
+"""
+
+import copy
+import Queue
+import sys
+import threading
+
+from numpy import ndarray
+
+from openmdao.main.interfaces import implements, ICaseRecorder
+
+# Values that can be passed to the recording thread as they are.
+_IMMUTABLE = (float, int, long, complex, bool, basestring, type(None))
+
+
+class AsyncCaseRecorder(object):
+    """
+    Passes cases on to `recorder` from a background thread, so that writing
+    the cases doesn't hold up the run being recorded. `recorder` may be any
+    case recorder.
+
+    :meth:`record` takes a snapshot of the values, copying arrays and other
+    mutable values, and puts it on a queue holding at most `max_cases`
+    cases. If the queue is full, :meth:`record` waits for the thread to
+    catch up. :meth:`startup`, :meth:`register` and :meth:`record_constants`
+    access the model, so they wait until all queued cases have been
+    recorded and then call `recorder` directly. :meth:`flush` and
+    :meth:`close` also wait for queued cases. An exception raised by
+    `recorder` in the thread is raised again by the next call.
+    """
+
+    implements(ICaseRecorder)
+
+    def __init__(self, recorder, max_cases=100):
+        self.recorder = recorder
+        self.max_cases = max_cases
+        self._queue = None
+        self._thread = None
+        self._error = None
+
+    def startup(self):
+        """ Prepare `recorder` for a new run. """
+        self._drain()
+        self.recorder.startup()
+
+    def register(self, driver, inputs, outputs):
+        """ Register names for later record call from `driver`. """
+        self._drain()
+        self.recorder.register(driver, inputs, outputs)
+
+    def record_constants(self, constants):
+        """ Record constant data. """
+        self._drain()
+        self.recorder.record_constants(constants)
+
+    def record(self, driver, inputs, outputs, exc, case_uuid, parent_uuid):
+        """ Queue the given run data for recording. """
+        self._check_error()
+        if self._thread is None:
+            self._queue = Queue.Queue(self.max_cases)
+            self._thread = threading.Thread(target=self._service_loop,
+                                            args=(self._queue,))
+            self._thread.daemon = True
+            self._thread.start()
+
+        self._queue.put((driver, _snapshot(inputs), _snapshot(outputs),
+                         exc, case_uuid, parent_uuid))
+
+    def flush(self):
+        """ Wait for queued cases to be recorded, then flush `recorder`. """
+        self._drain()
+        if hasattr(self.recorder, 'flush'):
+            self.recorder.flush()
+
+    def close(self):
+        """ Wait for queued cases to be recorded, then close `recorder`. """
+        self._stop()
+        self.recorder.close()
+        self._check_error()
+
+    def get_iterator(self):
+        """ Return the iterator of `recorder` after queued cases have been
+        recorded. """
+        self._drain()
+        return self.recorder.get_iterator()
+
+    def get_attributes(self, io_only=True):
+        """ Return attribute dictionary for GUI. """
+        attrs = {}
+        attrs['type'] = type(self).__name__
+        variables = []
+
+        attr = {}
+        attr['name'] = 'max_cases'
+        attr['type'] = type(self.max_cases).__name__
+        attr['value'] = str(self.max_cases)
+        attr['connected'] = ''
+        attr['desc'] = 'Maximum number of cases waiting to be recorded.'
+        variables.append(attr)
+
+        attrs["Inputs"] = variables
+        return attrs
+
+    def _drain(self):
+        """ Wait for queued cases to be recorded. """
+        if self._queue is not None:
+            self._queue.join()
+        self._check_error()
+
+    def _stop(self):
+        """ Wait for queued cases to be recorded and stop the thread. """
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+            self._queue = None
+
+    def _check_error(self):
+        """ Raise any exception from the thread. """
+        if self._error is not None:
+            err = self._error
+            self._error = None
+            raise err[0], err[1], err[2]
+
+    def _service_loop(self, queue):
+        """ Record queued cases until told to stop. """
+        while True:
+            args = queue.get()
+            try:
+                if args is None:
+                    return
+                if self._error is None:  # Discard cases after a failure.
+                    try:
+                        self.recorder.record(*args)
+                    except Exception:
+                        self._error = sys.exc_info()
+            finally:
+                queue.task_done()
+
+
+def _snapshot(values):
+    """ Return a copy of `values` that won't change as the run continues. """
+    result = []
+    for value in values:
+        if isinstance(value, ndarray):
+            value = value.copy()
+        elif not isinstance(value, _IMMUTABLE):
+            try:
+                value = copy.deepcopy(value)
+            except Exception:
+                pass  # Record whatever it is at the time.
+        result.append(value)
+    return result
@@ -1,7 +1,17 @@
 
+import tempfile
+
+from numpy import asarray, dtype, memmap, promote_types, zeros
+
 from openmdao.main.case import Case
 from openmdao.main.interfaces import implements, ICaseRecorder, ICaseIterator
 
+# Initial number of rows of memory-mapped storage.
+_MIN_ROWS = 1024
+
+# Number of rows read together when iterating over memory-mapped storage.
+_READ_ROWS = 4096
+
 
 class CaseArray(object):
     """A CaseRecorder/CaseIterator containing Cases having the same set of
@@ -10,7 +20,8 @@ class CaseArray(object):
 
     implements(ICaseIterator, ICaseRecorder)
 
-    def __init__(self, obj=None, parent_uuid=None, names=None):
+    def __init__(self, obj=None, parent_uuid=None, names=None,
+                 storage_dir=None):
         """
         obj: dict, Case, or None
             If obj is a dict, it is assumed to contain all var names/exprs as
@@ -31,6 +42,12 @@ class CaseArray(object):
             Names/expressions that the Cases will contain. This is useful if you
             only want this container to keep track of some subset of the
             contents of Cases that are recorded in it.
+
+        storage_dir: str (optional)
+            If given, case values are kept in memory-mapped temporary files
+            in this directory rather than in memory, along with a hash index
+            of the cases. All values must then be numeric scalars, with the
+            type of each one set by the first Case.
         """
         self._parent_uuid = parent_uuid
         self._cfg_map = {}
@@ -38,7 +55,8 @@ class CaseArray(object):
             self._names = []
         else:
             self._names = names[:]
-        self._values = []
+        self._storage_dir = storage_dir
+        self._values = self._new_values()
         if isinstance(obj, dict):
             self._add_dict_cases(obj)
         elif isinstance(obj, Case):
@@ -49,11 +67,24 @@ class CaseArray(object):
             raise TypeError("obj must be a dict, a Case, or None")
 
     def copy(self):
-        ca = CaseArray(parent_uuid=self._parent_uuid, names=self._names)
-        ca._values = self._values[:]
+        ca = CaseArray(parent_uuid=self._parent_uuid, names=self._names,
+                       storage_dir=self._storage_dir)
+        ca._values = self._copy_values()
         ca._split_idx = self._split_idx
         return ca
 
+    def _new_values(self):
+        """Return an empty container for case values."""
+        if self._storage_dir is None:
+            return []
+        return _MappedValues(self._storage_dir)
+
+    def _copy_values(self):
+        """Return a copy of the container of case values."""
+        if self._storage_dir is None:
+            return self._values[:]
+        return self._values.copy()
+
     def remove(self, case):
         """Remove the given Case from this CaseArray."""
         try:
@@ -84,7 +115,7 @@ class CaseArray(object):
                                  "from number of other values (%d) in CaseSet"
                                  % length)
             biglist.append(val)
-        self._values = []
+        self._values = self._new_values()
         if length > 0:
             idxs = range(len(self._names))
             for i in range(length):
@@ -209,16 +240,13 @@ class CaseArray(object):
             values = [case[n] for n in self._names]
         except KeyError:
             return False
-        for val in self._values:
-            if val == values:
-                return True
-        return False
+        return values in self._values
 
     def clear(self):
         """Remove all case values from this container but leave list of
         variables intact.
         """
-        self._values = []
+        self._values = self._new_values()
 
     def update(self, *case_containers):
         """Add Cases from other CaseSets or CaseArrays to this one."""
@@ -242,7 +270,8 @@ class CaseSet(CaseArray):
     input/output strings but different data.  All Cases in the set are unique.
     """
 
-    def __init__(self, obj=None, parent_uuid=None, names=None):
+    def __init__(self, obj=None, parent_uuid=None, names=None,
+                 storage_dir=None):
         """
         obj: dict, Case, or None
             If obj is a dict, it is assumed to contain all var names as keys,
@@ -263,23 +292,43 @@ class CaseSet(CaseArray):
             Names/expressions that the Cases will contain. This is useful if you
             only want this container to keep track of some subset of the
             contents of Cases that are recorded in it.
+
+        storage_dir: str (optional)
+            If given, case values are kept in memory-mapped temporary files
+            in this directory rather than in memory, along with a hash index
+            of the cases. All values must then be numeric scalars, with the
+            type of each one set by the first Case. Sets resulting from
+            operations on this one are kept in the same directory.
         """
-        self._tupset = set()
-        super(CaseSet, self).__init__(obj, parent_uuid, names)
+        if storage_dir is None:
+            self._tupset = set()
+        else:
+            self._tupset = None  # The index of the values is used instead.
+        super(CaseSet, self).__init__(obj, parent_uuid, names, storage_dir)
 
     def copy(self):
-        cs = CaseSet(parent_uuid=self._parent_uuid, names=self._names)
-        cs._values = self._values[:]
-        cs._tupset = self._tupset.copy()
+        cs = CaseSet(parent_uuid=self._parent_uuid, names=self._names,
+                     storage_dir=self._storage_dir)
+        cs._values = self._copy_values()
+        if self._tupset is not None:
+            cs._tupset = self._tupset.copy()
         cs._split_idx = self._split_idx
         return cs
 
     def _add_values(self, vals):
         tup = tuple(vals)
-        if tup not in self._tupset:
+        if self._tupset is None:
+            self._values.add(tup)
+        elif tup not in self._tupset:
             self._tupset.add(tup)
             self._values.append(tup)
 
+    def _members(self):
+        """Return the container used to check for values."""
+        if self._tupset is None:
+            return self._values
+        return self._tupset
+
     def __contains__(self, case):
         if not isinstance(case, Case):
             return False
@@ -287,14 +336,29 @@ class CaseSet(CaseArray):
             values = tuple(case[n] for n in self._names)
         except KeyError:
             return False
-        return values in self._tupset
+        return values in self._members()
 
-    def _make_case_set(self, tupset):
-        cs = CaseSet(parent_uuid=self._parent_uuid)
+    def _empty_case_set(self):
+        cs = CaseSet(parent_uuid=self._parent_uuid,
+                     storage_dir=self._storage_dir)
         cs._names = self._names[:]
+        cs._split_idx = self._split_idx
+        return cs
+
+    def _make_case_set(self, tupset):
+        cs = self._empty_case_set()
         cs._values = list(tupset)
         cs._tupset = tupset
-        cs._split_idx = self._split_idx
+        return cs
+
+    def _filtered_case_set(self, keep):
+        """Return a new CaseSet with the values in this one for which
+        `keep` returns True.
+        """
+        cs = self._empty_case_set()
+        for vals in self._values:
+            if keep(vals):
+                cs._values.append(vals)  # Already known to be unique.
         return cs
 
     def isdisjoint(self, case_set):
@@ -302,17 +366,38 @@ class CaseSet(CaseArray):
         given CaseSet.
         """
         self._check_compatability(case_set)
-        return self._tupset.isdisjoint(case_set._tupset)
+        if self._tupset is not None:
+            return self._tupset.isdisjoint(case_set._members())
+        members = case_set._members()
+        for vals in self._values:
+            if vals in members:
+                return False
+        return True
 
     def issubset(self, case_set):
         """Return True if every Case in this one is in the given CaseSet."""
         self._check_compatability(case_set)
-        return self._tupset.issubset(case_set._tupset)
+        if self._tupset is not None:
+            return self._tupset.issubset(case_set._members())
+        if len(self) > len(case_set):
+            return False
+        members = case_set._members()
+        for vals in self._values:
+            if vals not in members:
+                return False
+        return True
 
     def issuperset(self, case_set):
         """Return True if every Case in the given CaseSet is in this one."""
         self._check_compatability(case_set)
-        return self._tupset.issuperset(case_set._tupset)
+        if self._tupset is not None:
+            return self._tupset.issuperset(case_set._members())
+        if len(self) < len(case_set):
+            return False
+        for vals in case_set._values:
+            if vals not in self._values:
+                return False
+        return True
 
     def union(self, *case_sets):
         """Return a new CaseSet with Cases from this one
@@ -321,8 +406,14 @@ class CaseSet(CaseArray):
         tupsets = []
         for cset in case_sets:
             self._check_compatability(cset)
-            tupsets.append(cset._tupset)
-        return self._make_case_set(self._tupset.union(*tupsets))
+            tupsets.append(cset._members())
+        if self._tupset is not None:
+            return self._make_case_set(self._tupset.union(*tupsets))
+        cs = self.copy()
+        for cset in case_sets:
+            for vals in cset._values:
+                cs._values.add(vals)
+        return cs
 
     def intersection(self, *case_sets):
         """Return a new CaseSet with Cases that are common to this
@@ -331,8 +422,11 @@ class CaseSet(CaseArray):
         tupsets = []
         for cset in case_sets:
             self._check_compatability(cset)
-            tupsets.append(cset._tupset)
-        return self._make_case_set(self._tupset.intersection(*tupsets))
+            tupsets.append(cset._members())
+        if self._tupset is not None:
+            return self._make_case_set(self._tupset.intersection(*tupsets))
+        return self._filtered_case_set(
+                   lambda vals: all(vals in tupset for tupset in tupsets))
 
     def difference(self, *case_sets):
         """Return a new CaseSet with Cases in this that are not in the
@@ -341,26 +435,38 @@ class CaseSet(CaseArray):
         tupsets = []
         for cset in case_sets:
             self._check_compatability(cset)
-            tupsets.append(cset._tupset)
-        return self._make_case_set(self._tupset.difference(*tupsets))
+            tupsets.append(cset._members())
+        if self._tupset is not None:
+            return self._make_case_set(self._tupset.difference(*tupsets))
+        return self._filtered_case_set(
+                   lambda vals: not any(vals in tupset for tupset in tupsets))
 
     def symmetric_difference(self, case_set):
         """Return a new CaseSet with Cases in either this one or the other but
         not both.
         """
         self._check_compatability(case_set)
-        return self._make_case_set(self._tupset.symmetric_difference(case_set._tupset))
+        if self._tupset is not None:
+            return self._make_case_set(
+                       self._tupset.symmetric_difference(case_set._members()))
+        cs = self.difference(case_set)
+        for vals in case_set._values:
+            if vals not in self._values:
+                cs._values.append(vals)
+        return cs
 
     def clear(self):
         """Remove all case values from this CaseSet but leave list of
         variables intact.
         """
         super(CaseSet, self).clear()
-        self._tupset = set()
+        if self._tupset is not None:
+            self._tupset = set()
 
     def pop(self, idx=-1):
         vals = self._values.pop(idx)
-        self._tupset.remove(vals)
+        if self._tupset is not None:
+            self._tupset.remove(vals)
         return self._case_from_values(vals)
 
     def remove(self, case):
@@ -368,28 +474,30 @@ class CaseSet(CaseArray):
             values = tuple(case[n] for n in self._names)
         except KeyError:
             raise KeyError("Case to be removed is not a member of this CaseSet")
-        self._tupset.remove(values)
+        if self._tupset is None:
+            if values not in self._values:
+                raise KeyError(values)
+        else:
+            self._tupset.remove(values)
         self._values.remove(values)
 
     def __eq__(self, caseset):
         self._check_compatability(caseset)
-        return self._tupset == caseset._tupset
+        return len(self) == len(caseset) and self.issubset(caseset)
 
     def __lt__(self, caseset):
         self._check_compatability(caseset)
-        return self._tupset < caseset._tupset
+        return len(self) < len(caseset) and self.issubset(caseset)
 
     def __le__(self, caseset):
-        self._check_compatability(caseset)
-        return self._tupset <= caseset._tupset
+        return self.issubset(caseset)
 
     def __gt__(self, caseset):
         self._check_compatability(caseset)
-        return self._tupset > caseset._tupset
+        return len(self) > len(caseset) and self.issuperset(caseset)
 
     def __ge__(self, caseset):
-        self._check_compatability(caseset)
-        return self._tupset >= caseset._tupset
+        return self.issuperset(caseset)
 
     def __or__(self, caseset):
         return self.union(caseset)
@@ -401,7 +509,8 @@ class CaseSet(CaseArray):
         return self.difference(caseset)
 
 
-def caseiter_to_caseset(caseiter, varnames=None, include_errors=False):
+def caseiter_to_caseset(caseiter, varnames=None, include_errors=False,
+                        storage_dir=None):
     """
     Retrieve the values of specified variables from cases in a CaseIterator.
 
@@ -421,9 +530,13 @@ def caseiter_to_caseset(caseiter, varnames=None, include_errors=False):
     include_errors: bool (optional) [False]
         If True, include data from cases that reported an error.
 
+    storage_dir: str (optional) [None]
+        If given, the CaseSet keeps its values in memory-mapped files in this
+        directory rather than in memory. All values must be numeric scalars.
+
     """
 
-    caseset = CaseSet()
+    caseset = CaseSet(storage_dir=storage_dir)
 
     for case in caseiter:
         if include_errors is False and case.msg:
@@ -434,3 +547,239 @@ def caseiter_to_caseset(caseiter, varnames=None, include_errors=False):
             caseset.record_case(case)
     return caseset
 
+
+
+class _MappedValues(object):
+    """
+    A list of case value tuples kept in a memory-mapped temporary file in
+    `directory`. Each tuple is stored as a row of numeric fields, with the
+    field types taken from the first tuple appended and widened if a later
+    tuple needs it, for example to float for a float after ints. The rows
+    are indexed by an open addressing hash table, kept in another
+    memory-mapped file, so checking for a tuple doesn't scan the rows.
+    """
+
+    def __init__(self, directory):
+        self._directory = directory
+        self._dtype = None
+        self._floats = []
+        self._row = None
+        self._file = None
+        self._data = None
+        self._len = 0
+        self._index_file = None
+        self._index = None  # Row number + 1, 0 if unused, -1 if deleted.
+        self._used = 0      # Index slots not 0.
+
+    def _setup(self, types):
+        """ Create the files for rows of numeric `types`. """
+        self._dtype = dtype([('f%d' % i, typ) for i, typ in enumerate(types)])
+        self._floats = ['f%d' % i for i, typ in enumerate(types)
+                        if typ.kind == 'f']
+        self._row = zeros(1, dtype=self._dtype)
+        self._file = tempfile.TemporaryFile(dir=self._directory)
+        self._index_file = tempfile.TemporaryFile(dir=self._directory)
+        self._map_data(_MIN_ROWS)
+        self._map_index(_MIN_ROWS*2)
+
+    def _map_data(self, rows):
+        """ Map the data file with room for `rows` rows. """
+        self._data = None  # Release any current mapping.
+        self._data = memmap(self._file, dtype=self._dtype, mode='r+',
+                            shape=(rows,))
+
+    def _map_index(self, size):
+        """ Map an empty index with `size` slots and add the rows to it. """
+        self._index = None
+        self._index = memmap(self._index_file, dtype='<i8', mode='r+',
+                             shape=(size,))
+        self._index[:] = 0
+        self._used = 0
+        for i in range(self._len):
+            slot, row = self._find(self._data[i].tostring())
+            if row < 0:
+                self._index[slot] = i + 1
+                self._used += 1
+
+    def _key(self, values):
+        """
+        Return `values` in their stored form, or None if they can't be stored
+        exactly. Zeros are stored as positive zero, so that equal values
+        have equal keys.
+        """
+        row = self._row
+        try:
+            values = tuple(values)
+            row[0] = values
+            for name in self._floats:
+                row[name] += 0.
+            for stored, value in zip(row[0].item(), values):
+                if stored != value and (stored == stored or value == value):
+                    return None  # Not equal, and not both NaN.
+        except (TypeError, ValueError, OverflowError):
+            return None
+        return row.tostring()
+
+    def _find(self, key):
+        """
+        Return ``(slot, row)`` for `key`, where `row` is -1 if `key` isn't
+        in the index and `slot` is where it would be added.
+        """
+        index = self._index
+        mask = len(index) - 1
+        slot = hash(key) & mask
+        free = -1
+        while True:
+            entry = index[slot]
+            if entry == 0:
+                if free < 0:
+                    free = slot
+                return (free, -1)
+            elif entry < 0:
+                if free < 0:
+                    free = slot
+            elif self._data[entry-1].tostring() == key:
+                return (slot, entry-1)
+            slot = (slot + 1) & mask
+
+    def _insert(self, values, unique):
+        """
+        Append `values` as a new row, unless `unique` is True and they are
+        already present. Returns True if a row was appended.
+        """
+        if self._dtype is None:
+            self._setup(_numeric_types(values))
+
+        key = self._key(values)
+        if key is None:
+            self._widen(values)
+            key = self._key(values)
+            if key is None:
+                raise TypeError('case values %s do not match stored types %s'
+                                % (tuple(values), self._dtype))
+        slot, row = self._find(key)
+        if row >= 0 and unique:
+            return False
+
+        if self._len == len(self._data):
+            self._data.flush()
+            self._map_data(self._len * 2)
+        self._data[self._len] = self._row[0]
+        self._len += 1
+
+        if row < 0:  # Only the first of equal rows is indexed.
+            if self._index[slot] == 0:
+                self._used += 1
+            self._index[slot] = self._len
+            if self._used * 2 > len(self._index):
+                self._map_index(len(self._index) * 2)
+        return True
+
+    def _widen(self, values):
+        """ Widen the field types so that `values` can be stored, copying the
+        rows to new files. """
+        types = _numeric_types(values)
+        if len(types) != len(self._dtype):
+            return
+        types = [promote_types(self._dtype[i], typ)
+                 for i, typ in enumerate(types)]
+        if types == [self._dtype[i] for i in range(len(self._dtype))]:
+            return
+
+        old_data, count = self._data, self._len
+        size = len(self._index)
+        self._len = 0
+        self._setup(types)
+        self._map_data(len(old_data))
+        for name in self._dtype.names:
+            self._data[name][:count] = old_data[name][:count]
+        old_data = None
+        self._len = count
+        self._map_index(size)
+
+    def append(self, values):
+        """ Append `values`. """
+        self._insert(values, False)
+
+    def add(self, values):
+        """ Append `values` if they aren't already present. """
+        self._insert(values, True)
+
+    def copy(self):
+        """ Return a copy in new files in the same directory. """
+        values = _MappedValues(self._directory)
+        if self._dtype is not None:
+            values._setup([self._dtype[i] for i in range(len(self._dtype))])
+            values._map_data(len(self._data))
+            values._data[:self._len] = self._data[:self._len]
+            values._len = self._len
+            values._index = None
+            values._index = memmap(values._index_file, dtype='<i8',
+                                   mode='r+', shape=self._index.shape)
+            values._index[:] = self._index
+            values._used = self._used
+        return values
+
+    def pop(self, idx=-1):
+        """ Remove and return the values at `idx`. """
+        if idx < 0:
+            idx += self._len
+        if idx < 0 or idx >= self._len:
+            raise IndexError('pop index out of range')
+        values = self._data[idx].item()
+        if idx == self._len - 1:
+            slot, row = self._find(self._data[idx].tostring())
+            if row == idx:
+                self._index[slot] = -1
+            self._len -= 1
+        else:
+            self._data[idx:self._len-1] = self._data[idx+1:self._len]
+            self._len -= 1
+            self._map_index(len(self._index))  # Row numbers have changed.
+        return values
+
+    def remove(self, values):
+        """ Remove the first row equal to `values`. """
+        key = None if self._dtype is None else self._key(values)
+        if key is None:
+            raise ValueError('values not present')
+        slot, row = self._find(key)
+        if row < 0:
+            raise ValueError('values not present')
+        self.pop(row)
+
+    def __contains__(self, values):
+        if self._dtype is None:
+            return False
+        key = self._key(values)
+        if key is None:
+            return False
+        return self._find(key)[1] >= 0
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += self._len
+        if idx < 0 or idx >= self._len:
+            raise IndexError('index out of range')
+        return self._data[idx].item()
+
+    def __iter__(self):
+        for start in range(0, self._len, _READ_ROWS):
+            stop = min(start + _READ_ROWS, self._len)
+            for values in self._data[start:stop].tolist():
+                yield values
+
+
+def _numeric_types(values):
+    """ Return the dtypes of `values`, which must be numeric scalars. """
+    types = []
+    for value in values:
+        typ = asarray(value).dtype
+        if typ.kind not in 'biuf' or asarray(value).shape:
+            raise TypeError('memory-mapped case values must be'
+                            ' numeric scalars: %r' % (value,))
+        types.append(typ)
+    return types
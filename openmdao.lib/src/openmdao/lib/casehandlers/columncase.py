@@ -0,0 +1,364 @@
+"""
+Columnar binary Case Recording.
+"""
+
+import cStringIO
+import StringIO
+
+import bson
+
+from numpy  import array, dtype, frombuffer, ndarray
+from struct import pack, unpack
+
+from openmdao.lib.casehandlers.jsoncase import _BaseRecorder, _fixup
+
+MAGIC = 'OpenMDAO-columns-1\n'
+
+# Record kinds.
+_SIMULATION_INFO = 'S'
+_DRIVER_INFO = 'D'
+_CHUNK = 'C'
+_SHARD_SET = 'H'
+
+# Per-case entries other than 'data'.
+_CASE_KEYS = ('_id', '_parent_id', '_driver_id', 'error_status',
+              'error_message', 'timestamp')
+
+
+class ColumnCaseRecorder(_BaseRecorder):
+    """
+    Dumps a run in a columnar binary form to `out`, which may be a string or
+    a file-like object. If `out` is a string, then a file with that name will
+    be opened in the current directory. If `out` is None, cases will be
+    ignored.
+
+    Cases are collected into chunks of `chunk_size` cases. Within a chunk
+    each recorded variable of each driver is stored as a column: numeric
+    scalars and arrays that have the same shape and type in every case of
+    the chunk are written as a single block of raw data in their native
+    dtype, anything else is written as a BSON list. Variable names are only
+    written once per chunk.
+
+    The file can be read with :class:`CaseDataset` using format
+    ``column``. Cases are written a chunk at a time, so the most recent
+    cases are not in the file until the chunk is full or the recorder is
+    closed.
+    """
+
+    def __init__(self, out='cases.col', chunk_size=256):
+        super(ColumnCaseRecorder, self).__init__()
+        if isinstance(out, basestring):
+            out = open(out, 'wb')
+        self.out = out
+        self.chunk_size = chunk_size
+        self._chunk = []
+
+    def record_constants(self, constants):
+        """ Record constant data. """
+        if not self.out:
+            return
+
+        self.out.write(MAGIC)
+        self._write(_SIMULATION_INFO,
+                    bson.dumps(_fixup(self.get_simulation_info(constants))))
+
+        for info in self.get_driver_info():
+            self._write(_DRIVER_INFO, bson.dumps(_fixup(info)))
+
+        self.out.flush()
+
+    def record(self, driver, inputs, outputs, exc, case_uuid, parent_uuid):
+        """ Add the given run data to the current chunk. """
+        if not self.out:
+            return
+
+        info = self.get_case_info(driver, inputs, outputs, exc,
+                                  case_uuid, parent_uuid)
+
+        # Values may change before the chunk is written.
+        data = info['data']
+        for name, value in data.items():
+            if isinstance(value, ndarray):
+                data[name] = value.copy()
+            elif not isinstance(value, (float, int, long, basestring)):
+                data[name] = _fixup(value)
+
+        self._chunk.append(info)
+        if len(self._chunk) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """ Write any cases in the current chunk. """
+        if self.out is None or not self._chunk:
+            return
+
+        cases = self._chunk
+        self._chunk = []
+
+        # Group the cases by driver, keeping the recording order.
+        groups = []
+        group_index = {}
+        order = []
+        for info in cases:
+            driver_id = info['_driver_id']
+            if driver_id not in group_index:
+                group_index[driver_id] = len(groups)
+                groups.append((driver_id, []))
+            order.append(group_index[driver_id])
+            groups[group_index[driver_id]][1].append(info)
+
+        blocks = []
+        order_column = _add_block(blocks, array(order, dtype='<u4'))
+
+        header_groups = []
+        for driver_id, infos in groups:
+            columns = {}
+            objects = {}
+            for key in _CASE_KEYS:
+                if key == '_driver_id':
+                    continue
+                values = [info[key] for info in infos]
+                block = _to_block(values)
+                if block is None:
+                    objects[key] = _fixup(values)
+                else:
+                    columns[key] = _add_block(blocks, block)
+
+            # Cases of a driver may not all record the same variables.
+            names = []
+            seen = set()
+            for info in infos:
+                for name in info['data']:
+                    if name not in seen:
+                        seen.add(name)
+                        names.append(name)
+
+            data_columns = {}
+            data_objects = {}
+            data_missing = {}
+            for name in names:
+                # Only cases that have `name` are stored.
+                missing = [i for i, info in enumerate(infos)
+                           if name not in info['data']]
+                if missing:
+                    data_missing[name] = missing
+                values = [info['data'][name] for info in infos
+                          if name in info['data']]
+                block = _to_block(values)
+                if block is None:
+                    data_objects[name] = _fixup(values)
+                else:
+                    data_columns[name] = _add_block(blocks, block)
+
+            header_groups.append(dict(driver_id=driver_id, count=len(infos),
+                                      columns=columns, objects=objects,
+                                      data_columns=data_columns,
+                                      data_objects=data_objects,
+                                      data_missing=data_missing))
+
+        header = bson.dumps(dict(count=len(cases), order=order_column,
+                                 groups=header_groups))
+        self._write(_CHUNK, pack('<L', len(header)) + header +
+                    ''.join([data for _, data in blocks]))
+        self.out.flush()
+
+    def record_shards(self, driver, files, cases, parent_uuid):
+        """ Record where the cases from `driver` are, see
+        :meth:`get_shard_set_info`. """
+        if not self.out:
+            return
+
+        self.flush()  # Keep the recording order.
+        info = self.get_shard_set_info(driver, files, cases, parent_uuid)
+        self._write(_SHARD_SET, bson.dumps(info))
+        self.out.flush()
+
+    def get_shard_options(self):
+        """ Return constructor arguments for a shard recorder. """
+        return dict(chunk_size=self.chunk_size)
+
+    def _write(self, kind, data):
+        """ Write a record of `kind` containing `data`. """
+        self.out.write(pack('<cQ', kind, len(data)))
+        self.out.write(data)
+
+    def close(self):
+        """
+        Writes any remaining cases and closes `out`. Note that a closed
+        recorder will do nothing in :meth:`record`.
+        """
+        if self.out is not None:
+            self.flush()
+            if not isinstance(self.out,
+                              (StringIO.StringIO, cStringIO.OutputType)):
+                # Closing a StringIO deletes its contents.
+                self.out.close()
+            self.out = None
+
+    def get_attributes(self, io_only=True):
+        """ Return attribute dictionary for GUI. """
+        attrs = {}
+        attrs['type'] = type(self).__name__
+        variables = []
+
+        attr = {}
+        attr['name'] = 'chunk_size'
+        attr['type'] = type(self.chunk_size).__name__
+        attr['value'] = str(self.chunk_size)
+        attr['connected'] = ''
+        attr['desc'] = 'Number of cases written together.'
+        variables.append(attr)
+
+        attrs["Inputs"] = variables
+        return attrs
+
+    def get_iterator(self):
+        """ Just returns None. """
+        return None
+
+
+def _to_block(values):
+    """ Return `values` as a single array, or None if they don't all have the
+    same numeric type and shape. """
+    first = values[0]
+    if isinstance(first, ndarray):
+        if first.dtype.kind not in 'biuf':
+            return None
+        for value in values:
+            if not isinstance(value, ndarray) or \
+               value.shape != first.shape or value.dtype != first.dtype:
+                return None
+        return array(values)
+
+    if type(first) not in (float, int, long):
+        return None
+    for value in values:
+        if type(value) is not type(first):
+            return None
+    try:
+        block = array(values)
+    except OverflowError:
+        return None
+    if block.dtype.kind not in 'iuf':
+        return None
+    return block
+
+
+def _add_block(blocks, block):
+    """ Append the data of `block` to the list `blocks` and return the
+    column info needed to read it back. """
+    if blocks:
+        offset = blocks[-1][0] + len(blocks[-1][1])
+    else:
+        offset = 0
+    data = block.tostring()
+    blocks.append((offset, data))
+    return dict(dtype=block.dtype.str, shape=list(block.shape[1:]),
+                offset=offset, nbytes=len(data))
+
+
+def _read_record(inp):
+    """ Return ``(kind, data)`` for the next record in `inp`, or
+    ``(None, None)`` at the end of the file. Reads the file header if
+    `inp` is positioned at the start. """
+    if inp.tell() == 0:
+        magic = inp.read(len(MAGIC))
+        if magic != MAGIC:
+            raise RuntimeError('not a column case file')
+
+    header = inp.read(9)
+    if len(header) < 9:
+        return (None, None)
+    kind, reclen = unpack('<cQ', header)
+    data = inp.read(reclen)
+    if len(data) < reclen:
+        return (None, None)  # Truncated.
+    return (kind, data)
+
+
+def _decode_column(column, data, count):
+    """ Return the block for `column` from the chunk `data`. """
+    typ = dtype(str(column['dtype']))
+    start = column['offset']
+    block = frombuffer(data[start:start+column['nbytes']], dtype=typ)
+    return block.reshape([count] + list(column['shape'])).copy()
+
+
+def _present(cases, missing):
+    """ Return the `cases` whose indices aren't in `missing`. """
+    if not missing:
+        return cases
+    missing = set(missing)
+    return [case for i, case in enumerate(cases) if i not in missing]
+
+
+def _decode_chunk_columns(data, names=None):
+    """ Return ``(order, groups)`` for the chunk record `data`. `order` is
+    an array of the group index of each case and `groups` is a list of
+    ``(driver_id, meta, values, missing)``, where `meta` and `values` map
+    case keys and variable names to an array or a list of values for the
+    cases in the group, and `missing` maps variable names to the indices of
+    the cases in the group that don't have that variable, which are left
+    out of its values. If `names` is given, only the variables named in
+    ``names[driver_id]`` are decoded. """
+    hdrlen = unpack('<L', data[:4])[0]
+    header = bson.loads(data[4:4+hdrlen])
+    data = data[4+hdrlen:]
+
+    groups = []
+    for group in header['groups']:
+        count = group['count']
+        driver_id = group['driver_id']
+
+        meta = {}
+        for key, column in group['columns'].items():
+            meta[key] = _decode_column(column, data, count)
+        meta.update(group['objects'])
+
+        if names is None:
+            wanted = None
+        else:
+            wanted = set(names.get(driver_id, ()))
+        missing = group['data_missing']
+        values = {}
+        for name, column in group['data_columns'].items():
+            if wanted is None or name in wanted:
+                values[name] = _decode_column(column, data,
+                                              count-len(missing.get(name, ())))
+        for name, objects in group['data_objects'].items():
+            if wanted is None or name in wanted:
+                values[name] = objects
+
+        groups.append((driver_id, meta, values, missing))
+
+    order = _decode_column(header['order'], data, header['count'])
+    return (order, groups)
+
+
+def _decode_chunk(data):
+    """ Return the list of case dictionaries in the chunk record `data`. """
+    order, groups = _decode_chunk_columns(data)
+
+    group_cases = []
+    for driver_id, meta, values, missing in groups:
+        count = len(meta['_id'])
+        cases = [dict(_driver_id=driver_id, data={}) for i in range(count)]
+
+        for key, column in meta.items():
+            if isinstance(column, ndarray):
+                column = column.tolist()
+            for case, value in zip(cases, column):
+                case[key] = value
+
+        for name, column in values.items():
+            if isinstance(column, ndarray):
+                if column.ndim > 1:
+                    column = list(column)
+                else:
+                    column = column.tolist()
+            for case, value in zip(_present(cases, missing.get(name)), column):
+                case['data'][name] = value
+
+        group_cases.append(iter(cases))
+
+    return [group_cases[i].next() for i in order]
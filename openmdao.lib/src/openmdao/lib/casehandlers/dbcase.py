@@ -13,6 +13,9 @@ except ImportError:
 import time
 from cPickle import dumps, loads, HIGHEST_PROTOCOL, UnpicklingError
 from optparse import OptionParser
+from struct import pack, unpack_from
+
+from numpy import dtype, frombuffer, ndarray, zeros
 
 from traits.trait_handlers import TraitListObject, TraitDictObject
 
@@ -26,6 +29,48 @@ from openmdao.lib.casehandlers.util import driver_map
 _casetable_attrs = set(['id', 'uuid', 'parent', 'msg', 'model_id', 'timeEnter'])
 _vartable_attrs = set(['var_id', 'name', 'case_id', 'sense', 'value'])
 
+# Marks a blob holding the raw data of a numeric array rather than a pickle.
+_ARRAY_TAG = '\x93NDARRAY'
+
+
+def _to_blob(value):
+    """Return `value` converted for storage in the value column. Numeric
+    arrays are stored as their raw data after a small header giving the
+    dtype and shape, anything else that isn't a float, int or str is
+    pickled.
+    """
+    if isinstance(value, (float, int, str)):
+        return value
+    if isinstance(value, ndarray) and value.dtype.kind in 'biufc':
+        typ = value.dtype.str
+        header = pack('<B%dsB%dQ' % (len(typ), value.ndim),
+                      len(typ), typ, value.ndim, *value.shape)
+        return sqlite3.Binary(_ARRAY_TAG + header + value.tostring())
+    if isinstance(value, TraitDictObject):
+        value = dict(value)
+    elif isinstance(value, TraitListObject):
+        value = list(value)
+    return sqlite3.Binary(dumps(value, HIGHEST_PROTOCOL))
+
+
+def _from_blob(value):
+    """Return the value stored by :func:`_to_blob` as `value`."""
+    value = str(value)
+    if not value.startswith(_ARRAY_TAG):
+        return loads(value)
+
+    pos = len(_ARRAY_TAG)
+    size = unpack_from('<B', value, pos)[0]
+    typ, ndim = unpack_from('<%dsB' % size, value, pos+1)
+    pos += 2 + size
+    shape = unpack_from('<%dQ' % ndim, value, pos)
+    pos += 8*ndim
+    typ = dtype(typ)
+    if pos == len(value):
+        return zeros(shape, dtype=typ)
+    return frombuffer(value[pos:], dtype=typ).reshape(shape).copy()
+
+
 def _query_split(query):
     """Return a tuple of lhs, relation, rhs after splitting on
     a list of allowed operators.
@@ -110,7 +155,7 @@ class DBCaseIterator(object):
                     value = float('NaN')
                 else:
                     try:
-                        value = loads(str(value))
+                        value = _from_blob(value)
                     except UnpicklingError as err:
                         print 'value', type(value), repr(value)
                         raise UnpicklingError("can't unpickle value '%s' for"
@@ -157,15 +202,30 @@ class DBCaseIterator(object):
 
 class DBCaseRecorder(object):
     """Records Cases to a relational DB (sqlite). Values other than floats,
-    ints or strings are pickled and are opaque to SQL queries.
+    ints, strings or numeric arrays are pickled and are opaque to SQL queries.
+    Numeric arrays are stored as raw data in their native dtype.
+
+    By default each case is committed as soon as it's recorded. If
+    `batch_size` is greater than 1 or `batch_time` is set, cases are
+    buffered and committed together in a single transaction once
+    `batch_size` cases have been recorded or `batch_time` seconds have
+    passed since the last commit, and a file database is switched to
+    write-ahead logging. Buffered cases are also committed when a driver
+    of the top-level assembly finishes, when :meth:`get_iterator` is
+    called and on :meth:`close`.
     """
 
     implements(ICaseRecorder)
 
-    def __init__(self, dbfile=':memory:', model_id='', append=False):
+    def __init__(self, dbfile=':memory:', model_id='', append=False,
+                 batch_size=1, batch_time=None):
         self.dbfile = dbfile  # this creates the connection
         self.model_id = model_id
+        self.batch_size = batch_size
+        self.batch_time = batch_time
         self._cfg_map = {}
+        self._cases = []
+        self._last_flush = time.time()
 
         if append:
             exstr = 'if not exists'
@@ -191,6 +251,10 @@ class DBCaseRecorder(object):
          value BLOB
          )""" % exstr)
 
+        if (batch_size > 1 or batch_time) and dbfile != ':memory:':
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+
     @property
     def dbfile(self):
         """The name of the database. This can be a filename or :memory: for
@@ -222,51 +286,50 @@ class DBCaseRecorder(object):
         if self._connection is None:
             raise RuntimeError('Attempt to record on closed recorder')
 
-        cur = self._connection.cursor()
-
         msg = '' if exc is None else str(exc)
-        cur.execute("""insert into cases(id,uuid,parent,msg,model_id,timeEnter)
-                           values (?,?,?,?,?,DATETIME('NOW'))""",
-                    (None, case_uuid, parent_uuid, msg, self.model_id))
-
-        case_id = cur.lastrowid
-        # insert the inputs and outputs into the vars table.  Pickle them if
-        # they're not one of the built-in types int, float, or str.
-
-        v = (None, 'timestamp', case_id, None, time.time())
-        cur.execute("insert into casevars(var_id,name,case_id,sense,value) values(?,?,?,?,?)",
-                    v)
+        case = (case_uuid, parent_uuid, msg, self.model_id,
+                time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime()))
 
+        # The inputs and outputs for the vars table. Values are converted
+        # now since they may change before the case is written.
         in_names, out_names = self._cfg_map[driver]
+        values = [('timestamp', None, time.time())]
+        values.extend([(name, 'i', _to_blob(value))
+                       for name, value in zip(in_names, inputs)])
+        values.extend([(name, 'o', _to_blob(value))
+                       for name, value in zip(out_names, outputs)])
+
+        self._cases.append((case, values))
+        if len(self._cases) >= self.batch_size or \
+           (self.batch_time and
+            time.time() - self._last_flush >= self.batch_time):
+            self.flush()
+
+    def flush(self):
+        """Write any buffered cases in a single transaction."""
+        self._last_flush = time.time()
+        if self._connection is None or not self._cases:
+            return
+
+        cases = self._cases
+        self._cases = []
 
-        for name, value in zip(in_names, inputs):
-            if isinstance(value, (float, int, str)):
-                v = (None, name, case_id, 'i', value)
-            else:
-                if isinstance(value, TraitDictObject):
-                    value = dict(value)
-                elif isinstance(value, TraitListObject):
-                    value = list(value)
-                v = (None, name, case_id, 'i',
-                     sqlite3.Binary(dumps(value, HIGHEST_PROTOCOL)))
-            cur.execute("insert into casevars(var_id,name,case_id,sense,value) values(?,?,?,?,?)",
-                        v)
-        for name, value in zip(out_names, outputs):
-            if isinstance(value, (float, int, str)):
-                v = (None, name, case_id, 'o', value)
-            else:
-                if isinstance(value, TraitDictObject):
-                    value = dict(value)
-                elif isinstance(value, TraitListObject):
-                    value = list(value)
-                v = (None, name, case_id, 'o',
-                     sqlite3.Binary(dumps(value, HIGHEST_PROTOCOL)))
-            cur.execute("insert into casevars(var_id,name,case_id,sense,value) values(?,?,?,?,?)",
-                        v)
+        cur = self._connection.cursor()
+        rows = []
+        for case, values in cases:
+            cur.execute("""insert into cases(id,uuid,parent,msg,model_id,timeEnter)
+                               values (NULL,?,?,?,?,?)""", case)
+            case_id = cur.lastrowid
+            rows.extend([(name, case_id, sense, value)
+                         for name, sense, value in values])
+
+        cur.executemany("insert into casevars(var_id,name,case_id,sense,value) values(NULL,?,?,?,?)",
+                        rows)
         self._connection.commit()
 
     def close(self):
         """Commit and close DB connection if not using ``:memory:``."""
+        self.flush()
         if self._connection is not None and self._dbfile != ':memory:':
             self._connection.commit()
             self._connection.close()
@@ -274,6 +337,7 @@ class DBCaseRecorder(object):
 
     def get_iterator(self):
         """Return a DBCaseIterator that points to our current DB."""
+        self.flush()
         return DBCaseIterator(dbfile=self._dbfile, connection=self._connection)
 
     def get_attributes(self, io_only=True):
@@ -385,7 +449,7 @@ def case_db_to_dict(dbname, varnames, case_sql='', var_sql='', include_errors=Fa
         for vname, value in varcur:
             if not isinstance(value, (float, int, str)):
                 try:
-                    value = loads(str(value))
+                    value = _from_blob(value)
                 except UnpicklingError as err:
                     raise UnpicklingError("can't unpickle value '%s' from"
                                           " database: %s" % (vname, str(err)))
@@ -2,15 +2,19 @@
 JSON/BSON Case Recording.
 """
 
+import copy
 import cStringIO
 import StringIO
 import logging
+import os.path
 import sys
 import time
 
 import json
 import bson
+import zlib
 
+from base64 import b64encode
 from numpy  import ndarray
 from struct import pack
 from uuid   import uuid1
@@ -21,14 +25,30 @@ from openmdao.main.releaseinfo import __version__
 
 
 class _BaseRecorder(object):
-    """ Base class for JSONRecorder and BSONRecorder. """
+    """
+    Base class for JSONRecorder and BSONRecorder.
+
+    If `delta` is True, a case only contains the values that have changed
+    since the previous case recorded by the same driver, except that every
+    `keyframe_interval` cases of a driver all values are recorded.
+    :class:`CaseDataset` restores the unchanged values when reading.
+
+    Cases from a concurrent :class:`CaseIteratorDriver` may be recorded in
+    shard files written by the servers evaluating the cases, see
+    :meth:`get_shard_info`, :meth:`start_shard` and :meth:`record_shards`.
+    """
 
     implements(ICaseRecorder)
 
-    def __init__(self):
+    def __init__(self, delta=False, keyframe_interval=100):
         self._cfg_map = {}
         self._uuid = None
         self._cases = None
+        self.delta = delta
+        self.keyframe_interval = keyframe_interval
+        self._last = {}  # Last values recorded, per driver.
+        self._simulation_info = None
+        self._shard = None  # Set if recording a shard file.
 
     def startup(self):
         """ Prepare for new run. """
@@ -40,6 +60,14 @@ class _BaseRecorder(object):
 
     def get_simulation_info(self, constants):
         """ Return simulation info dictionary. """
+        if self._shard is not None:
+            # Same as the file for the complete run.
+            info = copy.deepcopy(self._shard['simulation_info'])
+            self._uuid = info['uuid']
+            self._cases = 0
+            self._last = {}
+            return info
+
         # Locate top level assembly from first driver registered.
         top = self._cfg_map.keys()[0].parent
         while top.parent:
@@ -112,21 +140,25 @@ class _BaseRecorder(object):
 
         self._uuid = str(uuid1())
         self._cases = 0
+        self._last = {}
 
         dep_graph = top.get_graph(format='json')
         comp_graph = top.get_graph(components_only=True, format='json')
 
-        return dict(variable_metadata=variable_metadata,
-                    expressions=expressions,
-                    constants=constants,
-                    graph=dep_graph,
-                    comp_graph=comp_graph,
-                    name=top.name,
-                    OpenMDAO_Version=__version__,
-                    uuid=self._uuid)
+        self._simulation_info = dict(variable_metadata=variable_metadata,
+                                     expressions=expressions,
+                                     constants=constants,
+                                     graph=dep_graph,
+                                     comp_graph=comp_graph,
+                                     name=top.name,
+                                     OpenMDAO_Version=__version__,
+                                     uuid=self._uuid)
+        return self._simulation_info
 
     def get_driver_info(self):
         """ Return list of driver info dictionaries. """
+        if self._shard is not None:
+            return copy.deepcopy(self._shard['driver_info'])
 
         # Locate top level assembly from first driver registered.
         top = self._cfg_map.keys()[0].parent
@@ -164,13 +196,96 @@ class _BaseRecorder(object):
         data = dict(zip(in_names, inputs))
         data.update(zip(out_names, outputs))
 
-        return dict(_id=case_uuid,
+        if self._shard is not None:
+            driver_id = driver  # Driver is on another host.
+        else:
+            driver_id = id(driver)
+
+        info = dict(_id=case_uuid,
                     _parent_id=parent_uuid or self._uuid,
-                    _driver_id=id(driver),
+                    _driver_id=driver_id,
                     error_status=None,
                     error_message=str(exc) if exc else '',
                     timestamp=time.time(),
                     data=data)
+        if self.delta:
+            self._delta_encode(driver, info)
+        return info
+
+    def get_shard_info(self, driver):
+        """
+        Return information needed by :meth:`start_shard` to record cases
+        from `driver` in a shard file, or None if this recorder isn't writing
+        to a named file. The information may be pickled and sent to another
+        host.
+        """
+        path = getattr(self.out, 'name', None)
+        if not isinstance(path, basestring) or path.startswith('<') or \
+           self._simulation_info is None or driver not in self._cfg_map:
+            return None
+
+        cls = type(self)
+        return dict(recorder=(cls.__module__, cls.__name__),
+                    options=self.get_shard_options(),
+                    path=os.path.abspath(path),
+                    simulation_info=_plain(self._simulation_info),
+                    driver_info=self.get_driver_info(),
+                    names=self._cfg_map[driver],
+                    driver_id=id(driver))
+
+    def get_shard_options(self):
+        """ Return constructor arguments for a shard recorder. """
+        return dict(delta=self.delta, keyframe_interval=self.keyframe_interval)
+
+    def start_shard(self, shard):
+        """
+        Start recording a shard file, where `shard` was returned by
+        :meth:`get_shard_info` of the recorder for the complete run. The
+        shard begins with the same simulation and driver information as that
+        recorder's file. Cases are recorded by passing the driver ``_id``
+        from `shard` as the `driver` argument of :meth:`record`.
+        """
+        self._shard = shard
+        self._cfg_map = {shard['driver_id']: tuple(shard['names'])}
+        self.record_constants({})
+
+    def get_shard_set_info(self, driver, files, cases, parent_uuid):
+        """
+        Return shard set info dictionary for cases from `driver` recorded in
+        the shard `files`. `cases` is a list of ``(file_index, case_uuid)``
+        in the order the cases completed.
+        """
+        directory = os.path.dirname(os.path.abspath(self.out.name))
+        files = [os.path.relpath(path, directory) for path in files]
+        return dict(_shards=dict(files=files, driver_id=id(driver),
+                                 parent_id=parent_uuid,
+                                 cases=[list(case) for case in cases]))
+
+    def _delta_encode(self, driver, info):
+        """
+        Remove values from case `info` that haven't changed since the last
+        case from `driver`, unless this case is a keyframe. Cases with values
+        removed are marked with ``_delta``.
+        """
+        last, count = self._last.get(driver, (None, 0))
+        keyframe = last is None or count % self.keyframe_interval == 0
+
+        data = info['data']
+        current = {}
+        for name, value in data.items():
+            if isinstance(value, ndarray):
+                current[name] = value.copy()
+            elif type(value) in _SCALARS:
+                current[name] = value
+            else:
+                continue  # Always recorded.
+            if not keyframe and name in last and \
+               _same_value(last[name], value):
+                del data[name]
+
+        if not keyframe:
+            info['_delta'] = True
+        self._last[driver] = (current, count+1)
 
 
 class JSONCaseRecorder(_BaseRecorder):
@@ -180,10 +295,20 @@ class JSONCaseRecorder(_BaseRecorder):
     then that standard stream is used. Otherwise, if `out` is a string, then
     a file with that name will be opened in the current directory.
     If `out` is None, cases will be ignored.
+
+    If `delta` is True, cases only contain the values which have changed
+    since the previous case of the same driver, except every
+    `keyframe_interval` cases of a driver, which contain all values.
+
+    If `compress_level` is nonzero, each record is compressed with zlib at
+    that level (1 is fastest, 9 compresses most) and stored as a base64
+    string, which is smaller than the `indent` formatted text. Records keep
+    their length prefix, so :class:`CaseDataset` can still seek to a case.
     """
 
-    def __init__(self, out='cases.json', indent=4, sort_keys=True):
-        super(JSONCaseRecorder, self).__init__()
+    def __init__(self, out='cases.json', indent=4, sort_keys=True,
+                 delta=False, keyframe_interval=100, compress_level=0):
+        super(JSONCaseRecorder, self).__init__(delta, keyframe_interval)
         if isinstance(out, basestring):
             if out == 'stdout':
                 out = sys.stdout
@@ -194,6 +319,7 @@ class JSONCaseRecorder(_BaseRecorder):
         self.out = out
         self.indent = indent
         self.sort_keys = sort_keys
+        self.compress_level = compress_level
         self._count = 0
 
     def record_constants(self, constants):
@@ -205,20 +331,12 @@ class JSONCaseRecorder(_BaseRecorder):
         category = 'simulation_info'
         data = self._dump(info, category,
                           ('variable_metadata', 'expressions', 'constants'))
-        self._count += 1
-        self.out.write('{\n"__length_%s": %s\n, "%s": '
-                       % (self._count, len(data), category))
-        self.out.write(data)
-        self.out.write('\n')
+        self._write(category, data)
 
         for i, info in enumerate(self.get_driver_info()):
             category = 'driver_info_%s' % (i+1)
             data = self._dump(info, category)
-            self._count += 1
-            self.out.write(', "__length_%s": %s\n, "%s": '
-                           % (self._count, len(data), category))
-            self.out.write(data)
-            self.out.write('\n')
+            self._write(category, data)
 
         self.out.flush()
 
@@ -232,13 +350,34 @@ class JSONCaseRecorder(_BaseRecorder):
         self._cases += 1
         category = 'iteration_case_%s' % self._cases
         data = self._dump(info, category, ('data',))
-        self._count += 1
-        self.out.write(', "__length_%s": %s\n, "%s": '
-                       % (self._count, len(data), category))
-        self.out.write(data)
-        self.out.write('\n')
+        self._write(category, data)
         self.out.flush()
 
+    def record_shards(self, driver, files, cases, parent_uuid):
+        """ Record where the cases from `driver` are, see
+        :meth:`get_shard_set_info`. """
+        if not self.out:
+            return
+
+        info = self.get_shard_set_info(driver, files, cases, parent_uuid)
+        category = 'shard_set_%s' % (self._count+1)
+        data = self._dump(info, category)
+        self._write(category, data)
+        self.out.flush()
+
+    def get_shard_options(self):
+        """ Return constructor arguments for a shard recorder. """
+        options = super(JSONCaseRecorder, self).get_shard_options()
+        options.update(indent=self.indent, sort_keys=self.sort_keys,
+                       compress_level=self.compress_level)
+        return options
+
+    def _write(self, category, data):
+        """ Write record of JSON `data` for `category`. """
+        self._count += 1
+        self.out.write(_json_record(self._count, category, data,
+                                    self.compress_level))
+
     def _dump(self, info, category, subcategories=None):
         """ Return JSON data, report any bad keys & values encountered. """
         try:
@@ -317,6 +456,14 @@ class JSONCaseRecorder(_BaseRecorder):
         attr['desc'] = 'If True, sort dictionary keys.'
         variables.append(attr)
 
+        attr = {}
+        attr['name'] = 'compress_level'
+        attr['type'] = type(self.compress_level).__name__
+        attr['value'] = str(self.compress_level)
+        attr['connected'] = ''
+        attr['desc'] = 'zlib compression level for records, 0 for none.'
+        variables.append(attr)
+
         attrs["Inputs"] = variables
         return attrs
 
@@ -325,6 +472,48 @@ class JSONCaseRecorder(_BaseRecorder):
         return None
 
 
+# Flag set in the length prefix of a compressed BSON record.
+_COMPRESSED = 0x80000000
+
+
+def _json_record(count, category, data, compress_level=0):
+    """
+    Return JSON `data` for `category` framed as record number `count`.
+    If `compress_level` is nonzero, `data` is compressed and written as a
+    base64 string, with a ``__zlength_`` prefix rather than ``__length_``.
+    """
+    prefix = '{\n' if count == 1 else ', '
+    if compress_level:
+        data = '"%s"' % b64encode(zlib.compress(data, compress_level))
+        return '%s"__zlength_%s": %s\n, "%s":\n%s\n' \
+               % (prefix, count, len(data), category, data)
+    return '%s"__length_%s": %s\n, "%s": %s\n' \
+           % (prefix, count, len(data), category, data)
+
+
+def _bson_record(data, compress_level=0):
+    """
+    Return BSON `data` framed as a record. If `compress_level` is nonzero,
+    `data` is compressed and :data:`_COMPRESSED` is set in the length prefix.
+    """
+    if compress_level:
+        data = zlib.compress(data, compress_level)
+        return pack('<L', len(data) | _COMPRESSED) + data
+    return pack('<L', len(data)) + data
+
+
+# Types of values checked for changes by delta encoding.
+_SCALARS = (float, int, long, bool, str, unicode)
+
+
+def _same_value(old, new):
+    """ Return True if `new` is the same as the previously recorded `old`. """
+    if isinstance(new, ndarray):
+        return isinstance(old, ndarray) and old.dtype == new.dtype and \
+               old.shape == new.shape and (old == new).all()
+    return type(old) is type(new) and old == new
+
+
 class _Encoder(json.JSONEncoder):
     """ Special encoder to deal with types not handled by default encoder. """
 
@@ -358,33 +547,58 @@ def _fixup(value):
     return value
 
 
+def _plain(value):
+    """
+    Return a copy of `value` with dictionaries and lists, such as the trait
+    containers in recorded constants, replaced by plain ones. Trait
+    containers don't survive being pickled and sent to another process.
+    """
+    if isinstance(value, dict):
+        return dict([(key, _plain(val)) for key, val in value.items()])
+    elif isinstance(value, (list, tuple)):
+        return [_plain(val) for val in value]
+    return copy.deepcopy(value)
+
+
 class BSONCaseRecorder(_BaseRecorder):
     """
     Dumps a run in BSON form to `out`, which may be a string or a file-like
     object. If `out` is a string, then a file with that name will be opened
     in the current directory. If `out` is None, cases will be ignored.
 
+    If `delta` is True, cases only contain the values which have changed
+    since the previous case of the same driver, except every
+    `keyframe_interval` cases of a driver, which contain all values.
+
+    If `compress_level` is nonzero, each record is compressed with zlib at
+    that level (1 is fastest, 9 compresses most), and the high bit of its
+    length prefix is set. Records keep their length prefix, so
+    :class:`CaseDataset` can still seek to a case.
+
     The resulting file can be read by code similar to this::
 
         from bson import loads
         from pprint import pprint
         from struct import unpack
+        from zlib import decompress
         import sys
 
         sep = '-'*60
 
+        def read_record(inp, data):
+            reclen = unpack('<L', data)[0]
+            if reclen & 0x80000000:  # Compressed.
+                return loads(decompress(inp.read(reclen & 0x7fffffff)))
+            return loads(inp.read(reclen))
+
         with open(sys.argv[1], 'rb') as inp:
-            reclen = unpack('<L', inp.read(4))[0]
-            data = inp.read(reclen)
-            obj = loads(data)  # simulation_info
+            obj = read_record(inp, inp.read(4))  # simulation_info
             pprint(obj)
             print sep
 
             data = inp.read(4)
             while data:
-                reclen = unpack('<L', data)[0]
-                data = inp.read(reclen)
-                obj = loads(data)  # driver_info or iteration_case
+                obj = read_record(inp, data)  # driver_info or iteration_case
                 pprint(obj)
                 print sep
 
@@ -392,27 +606,22 @@ class BSONCaseRecorder(_BaseRecorder):
 
     """
 
-    def __init__(self, out='cases.bson'):
-        super(BSONCaseRecorder, self).__init__()
+    def __init__(self, out='cases.bson', delta=False, keyframe_interval=100,
+                 compress_level=0):
+        super(BSONCaseRecorder, self).__init__(delta, keyframe_interval)
         if isinstance(out, basestring):
             out = open(out, 'w')
         self.out = out
+        self.compress_level = compress_level
 
     def record_constants(self, constants):
         """ Record constant data. """
         if not self.out:
             return
 
-        data = self._dump(self.get_simulation_info(constants))
-        reclen = pack('<L', len(data))
-        self.out.write(reclen)
-        self.out.write(data)
-
+        self._write(self.get_simulation_info(constants))
         for info in self.get_driver_info():
-            data = self._dump(info)
-            reclen = pack('<L', len(data))
-            self.out.write(reclen)
-            self.out.write(data)
+            self._write(info)
 
         self.out.flush()
 
@@ -421,14 +630,30 @@ class BSONCaseRecorder(_BaseRecorder):
         if not self.out:
             return
 
-        info = self.get_case_info(driver, inputs, outputs, exc,
-                                  case_uuid, parent_uuid)
-        data = self._dump(info)
-        reclen = pack('<L', len(data))
-        self.out.write(reclen)
-        self.out.write(data)
+        self._write(self.get_case_info(driver, inputs, outputs, exc,
+                                       case_uuid, parent_uuid))
+        self.out.flush()
+
+    def record_shards(self, driver, files, cases, parent_uuid):
+        """ Record where the cases from `driver` are, see
+        :meth:`get_shard_set_info`. """
+        if not self.out:
+            return
+
+        self._write(self.get_shard_set_info(driver, files, cases,
+                                            parent_uuid))
         self.out.flush()
 
+    def get_shard_options(self):
+        """ Return constructor arguments for a shard recorder. """
+        options = super(BSONCaseRecorder, self).get_shard_options()
+        options.update(compress_level=self.compress_level)
+        return options
+
+    def _write(self, info):
+        """ Write record of `info`. """
+        self.out.write(_bson_record(self._dump(info), self.compress_level))
+
     def _dump(self, info):
         """ Return BSON data, report any bad keys & values encountered. """
         return bson.dumps(_fixup(info))
@@ -1,23 +1,47 @@
+import ast
 import bson
+import copy
 import json
 import logging
+import os
+import sys
+import zlib
 
 import StringIO
 
-from struct import pack, unpack
+from numpy import absolute, arange, array, asarray, delete, empty, \
+                  flatnonzero, errstate, isnan, logical_and, logical_not, \
+                  logical_or, maximum, ndarray, ones, promote_types, where, \
+                  zeros
+from base64 import b64decode
+from struct import unpack
 from weakref import ref
 
 from openmdao.main.api import Assembly, VariableTree
+from openmdao.lib.casehandlers.columncase import _read_record, _decode_chunk, \
+                                                 _decode_chunk_columns, _CHUNK, \
+                                                 _SHARD_SET
+from openmdao.lib.casehandlers.jsoncase import _bson_record, _json_record, \
+                                               _COMPRESSED
 
 _GLOBAL_DICT = dict(__builtins__=None)
 
+# Metadata recorded with each case.
+_METADATA_NAMES = ['_id', '_parent_id', '_driver_id', 'error_status',
+                   'error_message', 'timestamp']
+
+# Names available to :meth:`Query.where` expressions.
+_PREDICATE_DICT = dict(__builtins__=None, abs=absolute, isnan=isnan,
+                       nan=float('NaN'), _and=logical_and, _or=logical_or,
+                       _not=logical_not)
+
 
 class CaseDataset(object):
     """
     Reads case data from `filename` and allows queries on it.
-    `format` should be ``bson`` or ``json``, indicating a
-    :class:`BSONCaseRecorder` file or :class:`JSONCaseRecorder` file
-    respectively.
+    `format` should be ``bson``, ``json`` or ``column``, indicating a
+    :class:`BSONCaseRecorder` file, :class:`JSONCaseRecorder` file or
+    :class:`ColumnCaseRecorder` file respectively.
 
     To get all case data::
 
@@ -48,6 +72,25 @@ class CaseDataset(object):
 
         cases = cds.data.driver(driver_name).parent_case(parent_id).fetch()
 
+    To select cases by the values recorded::
+
+        cases = cds.data.where('top.driver.obj < 3').fetch()
+
+    To get a NumPy array of the values of each variable::
+
+        arrays = cds.data.vars('top.comp.x', 'top.comp.y').arrays().fetch()
+        x = arrays['top.comp.x']
+
+    Cases recorded in shard files by a concurrent :class:`CaseIteratorDriver`
+    with `shard_recording` set are read from the shard files as if they had
+    been recorded in `filename`. The shard files are found relative to the
+    directory containing `filename`.
+
+    To read cases as they are recorded, see :class:`CaseFollower`::
+
+        follower = cds.data.follow()
+        cases = list(follower.cases())
+
     Other possibilities exist, see :class:`Query`.
 
     To restore from the last recorded case::
@@ -62,8 +105,11 @@ class CaseDataset(object):
             self._reader = _BSONReader(filename)
         elif format == 'json':
             self._reader = _JSONReader(filename)
+        elif format == 'column':
+            self._reader = _ColumnReader(filename)
         else:
-            raise ValueError("dataset format must be 'json' or 'bson'")
+            raise ValueError("dataset format must be 'json', 'bson'"
+                             " or 'column'")
 
         self._query_id = self._parent_id = self._driver_id = None
         self._case_ids = self._drivers = None
@@ -86,50 +132,25 @@ class CaseDataset(object):
     def _fetch(self, query):
         """ Return data based on `query`. """
         self._setup(query)
-
-        metadata_names = ['_id', '_parent_id', '_driver_id', 'error_status',
-                          'error_message', 'timestamp']
-        if query.vnames:
-            tmp = []
-            for name in metadata_names:
-                if name in query.vnames:
-                    tmp.append(name)
-            metadata_names = tmp
-            names = query.vnames
-        else:
-            if query.driver_name:
-                driver_info = self._drivers[self._driver_id]
-                prefix = driver_info['prefix']
-                all_names = [prefix+name
-                             for name in driver_info['recording']]
-            else:
-                all_names = []
-                for driver_info in self._drivers.values():
-                    prefix = driver_info['prefix']
-                    all_names.extend([prefix+name
-                                      for name in driver_info['recording']])
-            names = sorted(all_names+metadata_names)
-
+        names = self._names(query)
         if query.names:
             # Returning single row, not list of rows.
             return names
 
-        nan = float('NaN')
+        predicate, needed = self._predicate(query, names)
+        if query.as_arrays:
+            return self._fetch_arrays(query, names, needed, predicate)
+
+        local_names = self._local_names() if query.local_only else None
+
         rows = ListResult()
         state = {}  # Retains last seen values.
-        for case_data in self._reader.cases():
-            data = case_data['data']
+        for case_data in self._cases():
             case_id = case_data['_id']
             case_driver_id = case_data['_driver_id']
 
             prefix = self._drivers[case_driver_id]['prefix']
-            if prefix:
-                # Make names absolute.
-                data = dict([(prefix+name, value)
-                             for name, value in data.items()])
-            else:
-                data = data.copy()  # Don't modify reader version.
-
+            data = _absolute_data(case_data, prefix)
             state.update(data)
 
             # Filter on driver.
@@ -139,28 +160,13 @@ class CaseDataset(object):
 
             # Filter on case.
             if self._case_ids is None or case_id in self._case_ids:
-                for name in metadata_names:
-                    data[name] = case_data[name]
-
-                row = DictList(names)
-                for name in names:
-                    if query.local_only:
-                        if name in metadata_names:
-                            row.append(data[name])
-                        else:
-                            driver = self._drivers[case_driver_id]
-                            lnames = [prefix+rec for rec in driver['recording']]
-                            if name in lnames:
-                                row.append(data[name])
-                            else:
-                                row.append(nan)
-                    elif name in state:
-                        row.append(state[name])
-                    elif name in data:
-                        row.append(data[name])
-                    else:
-                        row.append(nan)
-                rows.append(row)
+                values = _case_values(case_data, data, state, needed,
+                                      local_names)
+
+                # Filter on values.
+                if predicate is None or predicate.evaluate(values):
+                    rows.append(DictList(names,
+                                         [values[name] for name in names]))
 
             if case_id == self._query_id or case_id == self._parent_id:
                 break  # Parent is last case recorded.
@@ -170,8 +176,8 @@ class CaseDataset(object):
 
         if query.transpose:
             tmp = DictList(names)
-            for i in range(len(rows[0])):
-                tmp.append([row[i] for row in rows])
+            for column in zip(*rows):
+                tmp.append(list(column))
             # Keep CDS as attribute for post-processing
             tmp.cds = self
             return tmp
@@ -180,7 +186,130 @@ class CaseDataset(object):
         rows.cds = self
         return rows
 
-    def _write(self, query, out, format):
+    def _names(self, query):
+        """ Return names of the values returned for `query`. """
+        metadata_names = _METADATA_NAMES
+        if query.vnames:
+            tmp = []
+            for name in metadata_names:
+                if name in query.vnames:
+                    tmp.append(name)
+            metadata_names = tmp
+            names = query.vnames
+        else:
+            if query.driver_name:
+                driver_info = self._drivers[self._driver_id]
+                prefix = driver_info['prefix']
+                all_names = [prefix+name
+                             for name in driver_info['recording']]
+            else:
+                all_names = []
+                for driver_info in self._drivers.values():
+                    prefix = driver_info['prefix']
+                    all_names.extend([prefix+name
+                                      for name in driver_info['recording']])
+            names = sorted(all_names+metadata_names)
+        return names
+
+    def _predicate(self, query, names):
+        """
+        Return ``(predicate, needed)`` for `query`, where `predicate` is the
+        compiled :meth:`Query.where` expression (or None) and `needed` is
+        `names` plus any other names used by `predicate`.
+        """
+        if not query.predicate:
+            return (None, names)
+
+        known = set(_METADATA_NAMES)
+        for driver_info in self._drivers.values():
+            prefix = driver_info['prefix']
+            known.update([prefix+name for name in driver_info['recording']])
+        predicate = _Predicate(query.predicate, known)
+        needed = names + [name for name in predicate.names
+                          if name not in names]
+        return (predicate, needed)
+
+    def _local_names(self):
+        """ Return mapping from driver id to the names it records. """
+        local_names = {}
+        for _id, driver_info in self._drivers.items():
+            prefix = driver_info['prefix']
+            local_names[_id] = set([prefix+name
+                                    for name in driver_info['recording']])
+        return local_names
+
+    def _fetch_arrays(self, query, names, needed, predicate):
+        """
+        Return dictionary of arrays for `names` based on `query`. Only the
+        variables in `needed` are decoded, a block of cases at a time, and
+        the selection of cases is applied to whole columns.
+        """
+        needed = needed + [name for name in ('_id', '_driver_id')
+                           if name not in needed]
+
+        wanted = {}  # Absolute name -> relative name, per driver.
+        for _id, driver_info in self._drivers.items():
+            prefix = driver_info['prefix']
+            wanted[_id] = dict([(prefix+name, name)
+                                for name in driver_info['recording']
+                                if prefix+name in needed])
+        relative = dict([(_id, mapping.values())
+                         for _id, mapping in wanted.items()])
+
+        stop_id = self._query_id or self._parent_id
+        stop = None
+        pieces = dict([(name, []) for name in needed])
+        total = 0
+        for order, groups in self._reader.column_blocks(relative):
+            for i, (driver_id, meta, values, missing) in enumerate(groups):
+                positions = flatnonzero(order == i) + total
+                for name in needed:
+                    if name == '_driver_id':
+                        pieces[name].append((positions,
+                                             [driver_id]*len(positions)))
+                    elif name in meta:
+                        pieces[name].append((positions, meta[name]))
+                for name, rel in wanted.get(driver_id, {}).items():
+                    if rel in values:
+                        if rel in missing:
+                            have = delete(positions, missing[rel])
+                        else:
+                            have = positions
+                        pieces[name].append((have, values[rel]))
+
+                if stop_id is not None:
+                    case_ids = list(meta['_id'])
+                    if stop_id in case_ids:
+                        pos = positions[case_ids.index(stop_id)]
+                        if stop is None or pos < stop:
+                            stop = pos
+            total += len(order)
+            if stop is not None:
+                break  # Parent is last case recorded.
+
+        if self._query_id and stop is None:
+            raise ValueError('No case with _id %s' % self._query_id)
+        count = total if stop is None else stop+1
+
+        columns = {}
+        for name in needed:
+            fill = not (query.local_only or name in _METADATA_NAMES)
+            columns[name] = _assemble(pieces[name], total, fill)[:count]
+
+        # Filter on driver, case and values.
+        selected = ones(count, dtype=bool)
+        if self._driver_id is not None:
+            selected &= columns['_driver_id'] == self._driver_id
+        if self._case_ids is not None:
+            selected &= array([case_id in self._case_ids
+                               for case_id in columns['_id']], dtype=bool)
+        if predicate is not None:
+            selected &= asarray(predicate.evaluate(columns, columns=True),
+                                dtype=bool)
+
+        return dict([(name, columns[name][selected]) for name in names])
+
+    def _write(self, query, out, format, compress_level=0):
         """ Write data based on `query` to `out`. """
         if query.local_only:
             raise ValueError('data.local() invalid for write()')
@@ -188,14 +317,18 @@ class CaseDataset(object):
             raise ValueError('data.var_names() invalid for write()')
         if query.transpose:
             raise ValueError('data.by_variable() invalid for write()')
+        if query.as_arrays:
+            raise ValueError('data.arrays() invalid for write()')
+        if query.predicate:
+            raise ValueError('data.where() invalid for write()')
 
         self._setup(query)
 
         format = format.lower()
         if format == 'bson':
-            writer = _BSONWriter(out)
+            writer = _BSONWriter(out, compress_level)
         elif format == 'json':
-            writer = _JSONWriter(out)
+            writer = _JSONWriter(out, compress_level=compress_level)
         else:
             raise ValueError("dataset format must be 'json' or 'bson'")
 
@@ -235,10 +368,10 @@ class CaseDataset(object):
                     found = True
 
                 if query.vnames:
-                    # Filter on variable.
-                    for name in data.keys():
-                        if prefix+name not in query.vnames:
-                            del data[name]
+                    # Filter on variable (without modifying reader version).
+                    data = case_data['data'] = \
+                        dict([(name, value) for name, value in data.items()
+                              if prefix+name in query.vnames])
 
                 writer.write('iteration_case_%s' % (count+1), case_data)
 
@@ -306,10 +439,7 @@ class CaseDataset(object):
             # Collect tree of cases.
             self._parent_id = query.parent_id
             cases = {}
-            for case_data in self._reader.cases():
-                _id = case_data['_id']
-                _driver_id = case_data['_driver_id']
-                _parent_id = case_data['_parent_id']
+            for _id, _driver_id, _parent_id in self._reader.case_ids():
 
                 if _id in cases:
                     node = cases[_id]
@@ -343,6 +473,19 @@ class CaseDataset(object):
             else:
                 raise ValueError('No case with _id %s', self._parent_id)
 
+    def _cases(self):
+        """
+        Return sequence of case dictionaries to process for the current
+        query. If specific cases were requested, reading starts from the
+        first of them rather than the start of the file.
+        """
+        if self._case_ids is not None:
+            positions = [self._reader.position(case_id)
+                         for case_id in self._case_ids]
+            if positions and None not in positions and min(positions) > 0:
+                return self._reader.cases_from(min(positions))
+        return self._reader.cases()
+
     def restore(self, assembly, case_id):
         """ Restore case `case_id` into `assembly`. """
         case = self.data.case(case_id).fetch()[0]
@@ -418,6 +561,39 @@ class CaseDataset(object):
                 assembly.set(name, value)
 
 
+def _absolute_data(case_data, prefix):
+    """ Return data of `case_data` using absolute names. """
+    data = case_data['data']
+    if prefix:
+        return dict([(prefix+name, value) for name, value in data.items()])
+    return data.copy()  # Don't modify reader version.
+
+
+def _case_values(case_data, data, state, needed, local_names):
+    """
+    Return dictionary of values for the `needed` names for `case_data`,
+    where `data` is the case data using absolute names and `state` retains
+    the last values seen. If `local_names` is not None, only names recorded
+    by the case's driver have values, others are NaN.
+    """
+    nan = float('NaN')
+    values = {}
+    if local_names is not None:
+        local_names = local_names[case_data['_driver_id']]
+    for name in needed:
+        if name in _METADATA_NAMES:
+            values[name] = case_data[name]
+        elif local_names is not None:
+            values[name] = data[name] if name in local_names else nan
+        elif name in state:
+            values[name] = state[name]
+        elif name in data:
+            values[name] = data[name]
+        else:
+            values[name] = nan
+    return values
+
+
 class Query(object):
     """
     Retains query information for a :class:`CaseDataset`. All methods other
@@ -435,22 +611,36 @@ class Query(object):
         self.local_only = False
         self.names = False
         self.transpose = False
+        self.as_arrays = False
+        self.predicate = None
 
     def fetch(self):
-        """ Return a list of rows of data, one for each selected case. """
+        """
+        Return a list of rows of data, one for each selected case, or a
+        dictionary of arrays if :meth:`arrays` was called.
+        """
         return self._dataset._fetch(self)
 
-    def write(self, out, format=None):
+    def write(self, out, format=None, compress_level=0):
         """
         Write filtered :class:`CaseDataset` to `out`, a filename or file-like
         object.  Default `format` is the format of the original data file.
+        If `compress_level` is nonzero, records are compressed with zlib at
+        that level.
         """
         if format is None:
             if isinstance(self._dataset._reader, _BSONReader):
                 format = 'bson'
             else:
                 format = 'json'
-        self._dataset._write(self, out, format)
+        self._dataset._write(self, out, format, compress_level)
+
+    def follow(self):
+        """
+        Return a :class:`CaseFollower` which reads the cases selected by this
+        query as they are added to a recording in progress.
+        """
+        return CaseFollower(self._dataset, self)
 
     def driver(self, driver_name):
         """ Filter the cases to those recorded by the named driver. """
@@ -479,6 +669,15 @@ class Query(object):
                 self.vnames.extend(arg)
         return self
 
+    def where(self, expr):
+        """
+        Filter the cases to those where `expr` is true. `expr` is a Python
+        expression using the recorded variable names, for example
+        ``'driver.obj < 3 and comp.x[0] > 0'``.
+        """
+        self.predicate = expr
+        return self
+
     def local(self):
         """
         Restrict the variables returned to only those in the specific driver's
@@ -493,6 +692,7 @@ class Query(object):
         Have :meth:`fetch` return data as ``[case][var]`` (the default).
         """
         self.transpose = False
+        self.as_arrays = False
         return self
 
     def by_variable(self):
@@ -501,6 +701,20 @@ class Query(object):
         default of ``[case][var]``.
         """
         self.transpose = True
+        self.as_arrays = False
+        return self
+
+    def arrays(self):
+        """
+        Have :meth:`fetch` return a dictionary mapping each variable name to
+        a NumPy array of its values, with one entry per case. Numeric values
+        of the same shape give an array of that type with an extra first
+        dimension, other values give an array of objects. Only the variables
+        needed are decoded, and the values are collected a block of cases
+        at a time rather than a row at a time.
+        """
+        self.transpose = False
+        self.as_arrays = True
         return self
 
     def var_names(self):
@@ -509,6 +723,113 @@ class Query(object):
         return self
 
 
+class CaseFollower(object):
+    """
+    Reads cases selected by `query` from the file of `dataset` as they are
+    recorded. Each call of :meth:`cases` or :meth:`update` continues from
+    where the previous call stopped, so a recording in progress can be
+    monitored without reading it again from the start.
+
+    Cases are returned in the same form as by :meth:`Query.fetch`. The
+    selection of specific cases via :meth:`Query.case` or
+    :meth:`Query.parent_case` isn't supported.
+
+    To print new objective values every few seconds::
+
+        follower = cds.data.vars('driver.obj').follow()
+        while running:
+            for case in follower.cases():
+                print case['driver.obj']
+            time.sleep(5)
+
+    To keep the values of each variable up to date::
+
+        follower = cds.data.vars('comp.x', 'comp.y').follow()
+        while running:
+            if follower.update():
+                plot(follower.by_variable['comp.x'],
+                     follower.by_variable['comp.y'])
+            time.sleep(5)
+    """
+
+    def __init__(self, dataset, query):
+        if query.case_id is not None or query.parent_id is not None:
+            raise ValueError('data.case() and data.parent_case() invalid'
+                             ' for follow()')
+
+        dataset._setup(query)
+        self._dataset = dataset
+        self._drivers = dict(dataset._drivers)
+        self._driver_id = dataset._driver_id
+        self._names = dataset._names(query)
+        self._predicate, self._needed = dataset._predicate(query, self._names)
+        self._local_names = None
+        if query.local_only:
+            self._local_names = dataset._local_names()
+
+        self._reader = None
+        self._resume = None
+        self._state = {}  # Retains last seen values.
+
+        #: :class:`DictList` of values, ``[var][case]``, updated by
+        #: :meth:`update`.
+        self.by_variable = DictList(self._names,
+                                    [[] for name in self._names])
+
+    def cases(self):
+        """ Return sequence of the cases recorded since the last call. """
+        reader = self._get_reader()
+        if self._resume is None:
+            self._resume = (reader._inp.tell(), 0)  # After simulation info.
+
+        for info, self._resume in reader.records_from(*self._resume):
+            if '_driver_id' not in info:
+                continue  # Driver info, already known.
+
+            prefix = self._drivers[info['_driver_id']]['prefix']
+            data = _absolute_data(info, prefix)
+            self._state.update(data)
+
+            # Filter on driver.
+            if self._driver_id is not None and \
+               info['_driver_id'] != self._driver_id:
+                continue
+
+            values = _case_values(info, data, self._state, self._needed,
+                                  self._local_names)
+
+            # Filter on values.
+            if self._predicate is None or self._predicate.evaluate(values):
+                yield DictList(self._names,
+                               [values[name] for name in self._names])
+
+    def update(self):
+        """
+        Append the values of cases recorded since the last call to
+        :attr:`by_variable`. Returns the number of cases added.
+        """
+        count = 0
+        for case in self.cases():
+            for column, value in zip(self.by_variable, case):
+                column.append(value)
+            count += 1
+        return count
+
+    def _get_reader(self):
+        """ Return reader for the current contents of the file. """
+        source = self._dataset._reader
+        if source._filename is None:
+            # Copy what's been written to the StringIO so far.
+            last = None if self._reader is None else self._reader._last
+            self._reader = type(source)(StringIO.StringIO(
+                                            source._inp.getvalue()))
+            if last is not None:
+                self._reader._last = last
+        elif self._reader is None:
+            self._reader = type(source)(source._filename)
+        return self._reader
+
+
 class DictList(list):
     """ List that can be indexed by index or 'var_name'. """
 
@@ -578,22 +899,371 @@ class _CaseNode(object):
         return kids
 
 
+def _group_cases(cases, names):
+    """ Return `cases` in the form returned by :meth:`_Reader.column_blocks`. """
+    nan = float('NaN')
+    group_index = {}
+    groups = []
+    order = []
+    for case in cases:
+        driver_id = case['_driver_id']
+        if driver_id not in group_index:
+            group_index[driver_id] = len(groups)
+            meta = dict([(key, []) for key in _METADATA_NAMES
+                                   if key != '_driver_id'])
+            values = dict([(name, []) for name in names.get(driver_id, ())])
+            groups.append((driver_id, meta, values, {}))
+        order.append(group_index[driver_id])
+
+        driver_id, meta, values, missing = groups[group_index[driver_id]]
+        for key, column in meta.items():
+            column.append(case[key])
+        data = case['data']
+        for name, column in values.items():
+            column.append(data.get(name, nan))
+
+    return (array(order, dtype=int), groups)
+
+
+def _to_array(values):
+    """ Return `values` as a numeric array if possible, else as an array of
+    objects. """
+    if isinstance(values, ndarray) and values.dtype.kind in 'biufc':
+        return values
+    try:
+        result = array(values)
+    except Exception:
+        pass
+    else:
+        if result.dtype.kind in 'biufc' and len(result) == len(values):
+            return result
+
+    result = empty(len(values), dtype=object)
+    for i, value in enumerate(values):
+        result[i] = value
+    return result
+
+
+def _assemble(pieces, total, fill):
+    """
+    Return an array of `total` values from `pieces`, a list of
+    ``(positions, values)``. Positions without a value are NaN, or if `fill`
+    is True, take the last value at an earlier position.
+    """
+    nan = float('NaN')
+    has = zeros(total, dtype=bool)
+    blocks = []
+    for positions, values in pieces:
+        has[positions] = True
+        blocks.append((positions, _to_array(values)))
+
+    if fill:
+        last = maximum.accumulate(where(has, arange(total), -1))
+        missing = last < 0
+    else:
+        missing = ~has
+
+    numeric = False
+    if blocks:
+        first = blocks[0][1]
+        numeric = True
+        typ = first.dtype
+        for positions, values in blocks:
+            if values.dtype == object or values.shape[1:] != first.shape[1:]:
+                numeric = False
+                break
+            typ = promote_types(typ, values.dtype)
+
+    if numeric:
+        if missing.any() and typ.kind in 'biu':
+            typ = promote_types(typ, float)
+        result = empty((total,)+first.shape[1:], dtype=typ)
+        for positions, values in blocks:
+            result[positions] = values
+    else:
+        result = empty(total, dtype=object)
+        result.fill(nan)
+        for positions, values in blocks:
+            for pos, value in zip(positions, values):
+                result[pos] = value
+
+    if fill:
+        result = result[where(missing, 0, last)]
+    if missing.any():
+        result[missing] = nan
+    return result
+
+
+class _Predicate(object):
+    """
+    A :meth:`Query.where` expression, compiled so it can be evaluated on
+    the values of a single case or on arrays of values. `known` is the set
+    of variable names that may be used.
+    """
+
+    def __init__(self, expr, known):
+        self.expr = expr
+        self.names = []  # Variable names used.
+        try:
+            tree = ast.parse(expr.strip(), mode='eval')
+        except SyntaxError as exc:
+            raise ValueError('Invalid where() expression %r: %s' % (expr, exc))
+        tree = _PredicateTransformer(known, self.names).visit(tree)
+        self._code = compile(ast.fix_missing_locations(tree), '<where>', 'eval')
+
+    def evaluate(self, values, columns=False):
+        """ Return result of the expression using `values`, a mapping from
+        variable name to its value, or to an array of values for each case
+        if `columns` is True. """
+        index = _column_index if columns else _item
+        with errstate(invalid='ignore'):  # Comparisons with NaN.
+            return eval(self._code, _PREDICATE_DICT,
+                        dict(_values=values, _index=index))
+
+
+class _PredicateTransformer(ast.NodeTransformer):
+    """
+    Replaces variable names in a :meth:`Query.where` expression with lookups
+    in ``_values``. Logical operators are replaced by NumPy functions so the
+    expression also works on arrays.
+    """
+
+    def __init__(self, known, names):
+        self._known = known
+        self._names = names
+
+    def _lookup(self, name, node):
+        """ Return lookup of `name` to replace `node`. """
+        if name not in self._names:
+            self._names.append(name)
+        lookup = ast.Subscript(value=ast.Name(id='_values', ctx=ast.Load()),
+                               slice=ast.Index(value=ast.Str(s=name)),
+                               ctx=ast.Load())
+        return ast.copy_location(lookup, node)
+
+    def _call(self, func, args, node):
+        """ Return call of `func` with `args` to replace `node`. """
+        call = ast.Call(func=ast.Name(id=func, ctx=ast.Load()), args=args,
+                        keywords=[], starargs=None, kwargs=None)
+        return ast.copy_location(call, node)
+
+    def visit_Name(self, node):
+        if node.id in self._known:
+            return self._lookup(node.id, node)
+        if node.id in _PREDICATE_DICT or node.id in ('True', 'False', 'None'):
+            return node
+        raise ValueError('Names not found in the dataset: %s' % [node.id])
+
+    def visit_Attribute(self, node):
+        name = _dotted_name(node)
+        if name is None:
+            return self.generic_visit(node)
+        if name in self._known:
+            return self._lookup(name, node)
+        raise ValueError('Names not found in the dataset: %s' % [name])
+
+    def visit_Subscript(self, node):
+        # Recorded names may include an index, as in 'comp.x[1]'.
+        if not isinstance(node.slice, ast.Index):
+            return self.generic_visit(node)
+
+        name = _dotted_name(node.value)
+        if name is not None and isinstance(node.slice.value, ast.Num):
+            full_name = '%s[%s]' % (name, node.slice.value.n)
+            if full_name in self._known:
+                return self._lookup(full_name, node)
+
+        # Index the value of each case.
+        return self._call('_index', [self.visit(node.value),
+                                     self.visit(node.slice.value)], node)
+
+    def visit_BoolOp(self, node):
+        func = '_and' if isinstance(node.op, ast.And) else '_or'
+        values = [self.visit(value) for value in node.values]
+        result = values[0]
+        for value in values[1:]:
+            result = self._call(func, [result, value], node)
+        return result
+
+    def visit_UnaryOp(self, node):
+        if isinstance(node.op, ast.Not):
+            return self._call('_not', [self.visit(node.operand)], node)
+        return self.generic_visit(node)
+
+    def visit_Compare(self, node):
+        # 'a < b < c' becomes '_and(a < b, b < c)'.
+        operands = [self.visit(node.left)] + \
+                   [self.visit(comp) for comp in node.comparators]
+        result = None
+        for i, op in enumerate(node.ops):
+            compare = ast.copy_location(
+                          ast.Compare(left=operands[i], ops=[op],
+                                      comparators=[operands[i+1]]), node)
+            if result is None:
+                result = compare
+            else:
+                result = self._call('_and', [result, compare], node)
+        return result
+
+
+def _item(value, index):
+    """ Return `value` indexed by `index`, or NaN if the value is missing. """
+    try:
+        return value[index]
+    except TypeError:
+        return float('NaN')
+
+
+def _column_index(column, index):
+    """ Return array of the values in `column` indexed by `index`. """
+    if column.dtype != object:
+        if not isinstance(index, tuple):
+            index = (index,)
+        return column[(slice(None),)+index]
+    return _to_array([_item(value, index) for value in column])
+
+
+def _dotted_name(node):
+    """ Return dotted name for `node`, or None if it isn't one. """
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        prefix = _dotted_name(node.value)
+        if prefix is not None:
+            return '%s.%s' % (prefix, node.attr)
+    return None
+
+
 class _Reader(object):
-    """ Base class for JSON/BSON readers. """
+    """
+    Base class for JSON/BSON readers.
+
+    Queries for specific cases use an index of where each case is in the
+    file. The index is built by scanning the file the first time it's
+    needed, and is saved in a sidecar file (`filename` + ``.idx``) so later
+    datasets reading the same file can seek to a case directly.
+
+    A shard set record is replaced by the cases in the shard files it refers
+    to, in the order the cases were recorded. The shard files are in the
+    same format as the file being read.
+    """
 
     def __init__(self, filename, mode):
         if isinstance(filename, StringIO.StringIO):
             self._inp = filename
+            self._filename = None
         else:
             self._inp = open(filename, mode)
+            self._filename = filename
+        self._offset = 0  # Position of record last read.
+        self._sub = 0     # Position of case within that record.
         self._simulation_info = self._next()
         self._state = 'drivers'
         self._info = None
+        self._drivers = None
+        self._index = None
+        self._positions = None
+        self._last = {}  # Last data read, per driver.
+        self._keyframe = True  # If last case read had all values.
+        self._shard_cases = []  # Cases from shard set remaining (reversed).
 
     def _next(self):
         """ Return next dictionary of data. """
         raise NotImplementedError('_next')
 
+    def _read_next(self):
+        """
+        Return next dictionary of data, or None at the end of the data. An
+        incomplete record at the end of the file, as seen while the file is
+        still being written, is treated as the end of the data.
+
+        Values left out of a delta encoded case are restored from the
+        previous case of the same driver.
+        """
+        if self._shard_cases:
+            info = self._shard_cases.pop()
+            self._sub += 1
+        else:
+            try:
+                info = self._next()
+            except Exception:
+                exc_info = sys.exc_info()
+                if self._inp.read(1):
+                    raise exc_info[0], exc_info[1], exc_info[2]  # Bad data.
+                return None
+
+            if info is not None and '_shards' in info:
+                self._start_shards(info['_shards'], 0)
+                return self._read_next()
+
+        if info is not None and '_driver_id' in info:
+            driver_id = info['_driver_id']
+            self._keyframe = not info.pop('_delta', False)
+            if not self._keyframe:
+                data = dict(self._last.get(driver_id, ()))
+                data.update(info['data'])
+                info['data'] = data
+            self._last[driver_id] = info['data']
+        return info
+
+    def _seek(self, offset, sub):
+        """ Position to read case `sub` of the record at `offset`. """
+        self._inp.seek(offset)
+        self._shard_cases = []
+        if sub:
+            self._start_shards(self._next()['_shards'], sub)
+            self._offset = offset
+
+    def _rewind(self):
+        """ Position to read the first record after 'simulation_info'. """
+        self._inp.seek(0)
+        self._shard_cases = []
+        self._next()
+
+    def _start_shards(self, shards, sub):
+        """ Setup to read the cases of shard set `shards` from case `sub`. """
+        cases = self._read_shards(shards)[sub:]
+        cases.reverse()
+        self._shard_cases = cases
+        self._sub = sub - 1
+
+    def _read_shards(self, shards):
+        """
+        Return list of the cases recorded in the shard files of shard set
+        `shards`, in the order they were recorded. Cases which can't be found
+        are logged and skipped.
+        """
+        if self._filename is None:
+            directory = os.getcwd()
+        else:
+            directory = os.path.dirname(os.path.abspath(self._filename))
+
+        readers = []
+        for name in shards['files']:
+            path = os.path.join(directory, name)
+            try:
+                readers.append(type(self)(path))
+            except Exception as exc:
+                logging.error("Can't read shard %s: %s", path, exc)
+                readers.append(None)
+        shard_cases = [reader.cases() if reader else iter(())
+                       for reader in readers]
+
+        cases = []
+        for shard, case_id in shards['cases']:
+            for info in shard_cases[shard]:
+                if info['_id'] == case_id:
+                    cases.append(info)
+                    break
+            else:
+                logging.error('Case %s not found in shard %s',
+                              case_id, shards['files'][shard])
+
+        for reader in readers:
+            if reader is not None:
+                reader._inp.close()
+        return cases
+
     @property
     def simulation_info(self):
         """ Simulation info dictionary. """
@@ -601,26 +1271,33 @@ class _Reader(object):
 
     def drivers(self):
         """ Return list of 'driver_info' dictionaries. """
+        if self._drivers is not None and self._state != 'drivers':
+            return copy.deepcopy(self._drivers)
+
         if self._state != 'drivers':
-            self._inp.seek(0)
-            self._next()  # Re-read 'simulation_info'.
+            self._rewind()
 
         driver_info = []
-        info = self._next()
+        info = self._read_next()
         while info:
             if '_driver_id' not in info:
                 driver_info.append(info)
             else:
                 self._info = info
                 self._state = 'cases'
-                return driver_info
-            info = self._next()
-        self._state = 'eof'
+                break
+            info = self._read_next()
+        else:
+            self._state = 'eof'
+
+        self._drivers = copy.deepcopy(driver_info)
         return driver_info
 
     def cases(self):
         """ Return sequence of 'iteration_case' dictionaries. """
         if self._state != 'cases' or self._info is None:
+            self._state = 'drivers'
+            self._rewind()
             self.drivers()  # Read up to first case.
             if self._state != 'cases':
                 return
@@ -628,11 +1305,172 @@ class _Reader(object):
         yield self._info  # Read when looking for drivers.
         self._info = None
 
-        info = self._next()
+        info = self._read_next()
+        while info:
+            yield info
+            info = self._read_next()
+        self._state = 'eof'
+
+    def cases_from(self, start):
+        """
+        Return sequence of 'iteration_case' dictionaries starting with the
+        case at position `start` in the index. The sequence begins with the
+        last case recorded by each driver before `start`, so the values seen
+        are the same as if the file had been read from the beginning.
+        """
+        index = self.index
+        n_drivers = len(set([entry[3] for entry in index]))
+
+        prior = []
+        seen = set()
+        keyframes = {}  # Last keyframe of each driver before `start`.
+        for pos in range(start-1, -1, -1):
+            driver_id = index[pos][3]
+            if driver_id not in seen:
+                seen.add(driver_id)
+                prior.append(pos)
+            if driver_id not in keyframes and index[pos][5]:
+                keyframes[driver_id] = pos
+                if len(keyframes) == n_drivers:
+                    break
+
+        self._state = 'seek'
+        self._last = {}
+        if all([index[pos][5] for pos in prior]):
+            for pos in reversed(prior):
+                offset, sub = index[pos][:2]
+                self._seek(offset, sub)
+                yield self._read_next()
+        elif len(keyframes) == len(seen):
+            # Delta encoded, read from the earliest keyframe needed.
+            start = min(keyframes.values())
+        else:
+            start = 0
+
+        offset, sub = index[start][:2]
+        self._seek(offset, sub)
+        info = self._read_next()
         while info:
             yield info
-            info = self._next()
+            info = self._read_next()
+        self._state = 'eof'
+
+    def records_from(self, offset, sub=0):
+        """
+        Return sequence of ``(info, (offset, sub))`` for the complete records
+        starting with case `sub` of the record at file position `offset`,
+        where ``(offset, sub)`` is where reading should resume after `info`.
+        The sequence ends at the end of the data, or at an incomplete record
+        of a file which is still being written.
+        """
+        self._state = 'seek'
+        self._seek(offset, sub)
+        while True:
+            info = self._read_next()
+            if info is None:
+                return
+            yield (info, self._resume())
+
+    def _resume(self):
+        """ Return ``(offset, sub)`` to resume reading after the last
+        record read. """
+        if self._shard_cases:
+            return (self._offset, self._sub+1)
+        return (self._inp.tell(), 0)
+
+    def column_blocks(self, names, size=1000):
+        """
+        Return sequence of ``(order, groups)`` for blocks of up to `size`
+        cases, where `order` is an array of the group index of each case
+        and `groups` is a list of ``(driver_id, meta, values, missing)`` for
+        the cases of each driver. `meta` maps the case metadata keys and
+        `values` maps the names in ``names[driver_id]`` to lists of values.
+        `missing` maps names to the indices of cases without a value for
+        them, which are left out of `values`.
+        """
+        cases = []
+        for case in self.cases():
+            cases.append(case)
+            if len(cases) >= size:
+                yield _group_cases(cases, names)
+                cases = []
+        if cases:
+            yield _group_cases(cases, names)
+
+    def position(self, case_id):
+        """ Return position of `case_id` in the index, or None. """
+        if self._positions is None:
+            self._positions = dict([(entry[2], pos)
+                                    for pos, entry in enumerate(self.index)])
+        return self._positions.get(case_id)
+
+    def case_ids(self):
+        """ Return sequence of ``(_id, _driver_id, _parent_id)``. """
+        for entry in self.index:
+            yield entry[2:5]
+
+    @property
+    def index(self):
+        """
+        List of ``(offset, sub, _id, _driver_id, _parent_id, keyframe)`` for
+        each case, where `offset` is the file position of the record
+        containing the case, `sub` is the position of the case within that
+        record, and `keyframe` is False if the case is delta encoded.
+        """
+        if self._index is None:
+            self._index = self._load_index()
+            if self._index is None:
+                self._index = self._build_index()
+                self._save_index()
+        return self._index
+
+    def _index_stamp(self):
+        """ Return file size and modification time of the file read. """
+        info = os.stat(self._filename)
+        return [info.st_size, info.st_mtime]
+
+    def _load_index(self):
+        """ Return index from the sidecar file, or None if it's missing or
+        out of date. """
+        if self._filename is None:
+            return None
+        try:
+            with open(self._filename+'.idx', 'r') as inp:
+                data = json.load(inp)
+            if data['stamp'] != self._index_stamp():
+                return None
+            index = [tuple(entry) for entry in data['index']]
+            if index and len(index[0]) != 6:
+                return None  # Old format.
+            return index
+        except Exception:
+            return None
+
+    def _save_index(self):
+        """ Save index in the sidecar file, if possible. """
+        if self._filename is None:
+            return
+        try:
+            with open(self._filename+'.idx', 'w') as out:
+                json.dump(dict(stamp=self._index_stamp(), index=self._index),
+                          out)
+        except (IOError, OSError) as exc:
+            logging.debug("Can't save index for %s: %s", self._filename, exc)
+
+    def _build_index(self):
+        """ Return index built by scanning the file. """
+        index = []
+        self._state = 'seek'
+        self._rewind()
+        info = self._read_next()
+        while info:
+            if '_driver_id' in info:
+                index.append((self._offset, self._sub, info['_id'],
+                              info['_driver_id'], info['_parent_id'],
+                              self._keyframe))
+            info = self._read_next()
         self._state = 'eof'
+        return index
 
 
 class _JSONReader(_Reader):
@@ -643,13 +1481,22 @@ class _JSONReader(_Reader):
 
     def _next(self):
         """ Return next dictionary of data. """
+        self._offset = self._inp.tell()
+        self._sub = 0
         data = self._inp.readline()
-        while '__length_' not in data:
+        while '__length_' not in data and '__zlength_' not in data:
             if not data:
                 return None
+            self._offset = self._inp.tell()
             data = self._inp.readline()
 
         key, _, value = data.partition(':')  # '"__length_1": NNN'
+        if '__zlength_' in key:
+            reclen = int(value)
+            data = self._inp.readline()  # ', "dictname":'
+            data = self._inp.read(reclen)  # Quoted base64 string.
+            return json.loads(zlib.decompress(b64decode(data[1:-1])))
+
         reclen = int(value) - 1
         data = self._inp.readline()  # ', "dictname": {'
         data = '{\n' + self._inp.read(reclen)
@@ -664,17 +1511,95 @@ class _BSONReader(_Reader):
 
     def _next(self):
         """ Return next dictionary of data. """
+        self._offset = self._inp.tell()
+        self._sub = 0
         data = self._inp.read(4)
         if not data:
             return None
         reclen = unpack('<L', data)[0]
+        if reclen & _COMPRESSED:
+            data = self._inp.read(reclen & ~_COMPRESSED)
+            return bson.loads(zlib.decompress(data))
         return bson.loads(self._inp.read(reclen))
 
 
+class _ColumnReader(_Reader):
+    """ Reads a :class:`ColumnCaseRecorder` file. """
+
+    def __init__(self, filename):
+        self._pending = []
+        super(_ColumnReader, self).__init__(filename, 'rb')
+
+    def _next(self):
+        """ Return next dictionary of data. """
+        if self._inp.tell() == 0:
+            self._pending = []  # Rewound.
+
+        if self._pending:
+            self._sub += 1
+
+        while not self._pending:
+            self._offset = self._inp.tell()
+            self._sub = 0
+            kind, data = _read_record(self._inp)
+            if kind is None:
+                return None
+            elif kind == _CHUNK:
+                self._pending = _decode_chunk(data)
+                self._pending.reverse()
+            else:
+                return bson.loads(data)
+
+        return self._pending.pop()
+
+    def column_blocks(self, names, size=None):
+        """
+        Return sequence of ``(order, groups)`` for each chunk and shard set
+        in the file. Only the columns in `names` are decoded. `size` is
+        ignored.
+        """
+        self._state = 'seek'
+        self._inp.seek(0)
+        self._pending = []
+        self._shard_cases = []
+        kind, data = _read_record(self._inp)
+        while kind is not None:
+            if kind == _CHUNK:
+                yield _decode_chunk_columns(data, names)
+            elif kind == _SHARD_SET:
+                cases = self._read_shards(bson.loads(data)['_shards'])
+                if cases:
+                    yield _group_cases(cases, names)
+            kind, data = _read_record(self._inp)
+        self._state = 'eof'
+
+    def _seek(self, offset, sub):
+        """ Position to read case `sub` of the record at `offset`. """
+        self._inp.seek(offset)
+        self._pending = []
+        self._shard_cases = []
+        if sub:
+            kind, data = _read_record(self._inp)
+            if kind == _SHARD_SET:
+                self._start_shards(bson.loads(data)['_shards'], sub)
+            else:
+                self._pending = _decode_chunk(data)[sub:]
+                self._pending.reverse()
+                self._sub = sub - 1
+            self._offset = offset
+
+    def _resume(self):
+        """ Return ``(offset, sub)`` to resume reading after the last
+        record read. """
+        if self._pending or self._shard_cases:
+            return (self._offset, self._sub+1)
+        return (self._inp.tell(), 0)
+
+
 class _JSONWriter(object):
     """ Writes case data as JSON. """
 
-    def __init__(self, out, indent=4, sort_keys=True):
+    def __init__(self, out, indent=4, sort_keys=True, compress_level=0):
         if isinstance(out, basestring):
             self._out = open(out, 'w')
         elif isinstance(out, StringIO.StringIO):
@@ -686,17 +1611,15 @@ class _JSONWriter(object):
                              " text mode")
         self._indent = indent
         self._sort_keys = sort_keys
+        self._compress_level = compress_level
         self._count = 0
 
     def write(self, category, data):
         """ Write `data` under `category`. """
         data = json.dumps(data, indent=self._indent, sort_keys=self._sort_keys)
         self._count += 1
-        prefix = '{\n' if self._count == 1 else ', '
-        self._out.write('%s"__length_%s": %s\n, "%s": '
-                        % (prefix, self._count, len(data), category))
-        self._out.write(data)
-        self._out.write('\n')
+        self._out.write(_json_record(self._count, category, data,
+                                     self._compress_level))
 
     def close(self):
         """ Close file. """
@@ -711,7 +1634,7 @@ class _JSONWriter(object):
 class _BSONWriter(object):
     """ Writes case data as BSON. """
 
-    def __init__(self, out):
+    def __init__(self, out, compress_level=0):
         if isinstance(out, basestring):
             self._out = open(out, 'wb')
         elif 'w' in out.mode and 'b' in out.mode:
@@ -719,12 +1642,11 @@ class _BSONWriter(object):
         else:
             raise ValueError("'out' must be a writable file-like object in"
                              " binary mode")
+        self._compress_level = compress_level
 
     def write(self, category, data):
         """ Write `data` under `category`. """
-        data = bson.dumps(data)
-        self._out.write(pack('<L', len(data)))
-        self._out.write(data)
+        self._out.write(_bson_record(bson.dumps(data), self._compress_level))
 
     def close(self):
         """ Close file. """
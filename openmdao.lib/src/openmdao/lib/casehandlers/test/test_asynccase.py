@@ -0,0 +1,102 @@
+"""
+Test of AsyncCaseRecorder.
+"""
+
+import threading
+import time
+import unittest
+
+import numpy as np
+
+from openmdao.main.api import Assembly, Component, set_as_top
+from openmdao.main.datatypes.api import Array, Float
+from openmdao.lib.casehandlers.api import AsyncCaseRecorder, ListCaseRecorder
+from openmdao.lib.drivers.api import SLSQPdriver
+
+
+class ArrayComp(Component):
+
+    x = Array(np.zeros(3), iotype='in')
+    n = Float(0.0, iotype='out')
+    y = Array(np.zeros(3), iotype='out')
+
+    def execute(self):
+        # Update in place, recorded values must be snapshots.
+        self.y[:] = 2.0*self.x
+        self.n = float(np.dot(self.x, self.x))
+
+
+class SlowRecorder(ListCaseRecorder):
+    """ Records slowly, keeping track of the recording threads. """
+
+    def __init__(self, fail_at=None):
+        super(SlowRecorder, self).__init__()
+        self.threads = set()
+        self.fail_at = fail_at
+        self.flushed = 0
+        self.closed = 0
+
+    def record(self, driver, inputs, outputs, exc, case_uuid, parent_uuid):
+        time.sleep(0.001)
+        self.threads.add(threading.current_thread())
+        if len(self.cases) == self.fail_at:
+            raise RuntimeError('recording failed')
+        super(SlowRecorder, self).record(driver, inputs, outputs, exc,
+                                         case_uuid, parent_uuid)
+
+    def flush(self):
+        self.flushed += 1
+
+    def close(self):
+        self.closed += 1
+
+
+class TestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.top = top = set_as_top(Assembly())
+        top.add('comp', ArrayComp())
+        top.add('driver', SLSQPdriver())
+        top.driver.workflow.add('comp')
+        top.driver.add_parameter('comp.x', low=-10, high=10)
+        top.driver.add_objective('comp.n')
+        top.comp.x = np.array([1.0, 2.0, 3.0])
+        top.recorder_includes = ['comp.y']
+
+    def test_record(self):
+        sync = ListCaseRecorder()
+        slow = SlowRecorder()
+        self.top.recorders = [sync, AsyncCaseRecorder(slow, max_cases=2)]
+        self.top.run()
+
+        self.assertEqual(slow.closed, 1)
+        self.assertTrue(slow.flushed >= 1)
+        self.assertEqual(slow.threads & set([threading.current_thread()]),
+                         set())
+        self.assertTrue(len(slow.cases) > 3)
+        self.assertEqual(len(slow.cases), len(sync.cases))
+        for expected, case in zip(sync.cases, slow.cases):
+            self.assertTrue(case['comp.y'] is not expected['comp.y'])
+            self.assertTrue((case['comp.y'] == 2*case['comp.x']).all())
+            self.assertEqual(case['_pseudo_0'],
+                             expected['_pseudo_0'])
+
+        # Runs again after close.
+        self.top.run()
+        self.assertEqual(slow.closed, 2)
+        self.assertEqual(len(slow.cases), len(sync.cases))
+
+    def test_error(self):
+        slow = SlowRecorder(fail_at=2)
+        self.top.recorders = [AsyncCaseRecorder(slow)]
+        try:
+            self.top.run()
+        except RuntimeError as err:
+            self.assertEqual(str(err), 'recording failed')
+        else:
+            self.fail('RuntimeError expected')
+        self.assertEqual(len(slow.cases), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,3 +1,5 @@
+import shutil
+import tempfile
 import unittest
 
 from openmdao.main.api import Case
@@ -261,6 +263,116 @@ class CaseSetTestCase(unittest.TestCase):
         cs1.close()
 
 
+class MappedCaseSetTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp(prefix='test_caseset-')
+        self.cases = []
+        for i in range(3000):
+            self.cases.append(self.make_case(i % 2000))  # Some duplicates.
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir, onerror=lambda *args: None)
+
+    def make_case(self, i):
+        return Case(inputs=[('x', i), ('y', 0.5*i)], outputs=[('z', float(i))])
+
+    def test_array(self):
+        ca = CaseArray(storage_dir=self.tempdir)
+        for case in self.cases:
+            ca.record_case(case)
+        self.assertEqual(len(ca), len(self.cases))
+        self.assertEqual(ca['x'], [case['x'] for case in self.cases])
+        self.assertEqual(ca[2500], self.cases[2500])
+        self.assertEqual(ca[-1], self.cases[-1])
+        self.assertTrue(isinstance(ca[10]['x'], int))
+        self.assertTrue(isinstance(ca[10]['y'], float))
+        self.assertTrue(self.cases[1234] in ca)
+        self.assertFalse(self.make_case(2000) in ca)
+        self.assertFalse(Case(inputs=[('x', 1.5), ('y', 0.75)],
+                              outputs=[('z', 1.5)]) in ca)
+        self.assertFalse(None in ca)
+
+        for c1, c2 in zip(ca.copy(), self.cases):
+            self.assertEqual(c1, c2)
+
+        ca.remove(self.cases[5])  # Removes the first of two.
+        self.assertEqual(len(ca), len(self.cases)-1)
+        self.assertTrue(self.cases[5] in ca)
+        ca.remove(self.cases[5])
+        self.assertFalse(self.cases[5] in ca)
+        self.assertEqual(ca.pop(), self.cases[-1])
+        self.assertTrue(self.cases[-1] in ca)  # Also recorded earlier.
+        self.assertEqual(ca.pop(998), self.cases[-1])
+        self.assertFalse(self.cases[-1] in ca)
+        self.assertTrue(self.cases[6] in ca)
+
+        ca.clear()
+        self.assertEqual(len(ca), 0)
+        self.assertFalse(self.cases[6] in ca)
+
+    def test_bad_values(self):
+        ca = CaseArray(storage_dir=self.tempdir)
+        self.assertRaises(TypeError, ca.record_case,
+                          Case(inputs=[('x', 'abc')]))
+        ca = CaseArray(storage_dir=self.tempdir)
+        ca.record_case(Case(inputs=[('x', 1)]))
+        self.assertRaises(TypeError, ca.record_case, Case(inputs=[('x', 'a')]))
+
+    def test_widen(self):
+        # Fields are widened for values that don't fit the first case.
+        cs = CaseSet(storage_dir=self.tempdir)
+        for i in range(1500):
+            cs.record_case(Case(inputs=[('x', i), ('y', i % 2 == 0)]))
+        self.assertTrue(isinstance(cs[10]['x'], int))
+        cs.record_case(Case(inputs=[('x', 1.5), ('y', 2)]))
+        self.assertEqual(len(cs), 1501)
+        self.assertEqual(cs[-1]['x'], 1.5)
+        self.assertEqual(cs[-1]['y'], 2)
+        self.assertEqual(cs[10]['x'], 10)
+        self.assertEqual(cs[10]['y'], 1)
+        self.assertTrue(Case(inputs=[('x', 1400), ('y', True)]) in cs)
+        self.assertFalse(Case(inputs=[('x', 1401), ('y', True)]) in cs)
+        cs.record_case(Case(inputs=[('x', 10), ('y', True)]))
+        self.assertEqual(len(cs), 1501)
+
+    def test_set_ops(self):
+        cs = caseiter_to_caseset(ListCaseIterator(self.cases),
+                                 storage_dir=self.tempdir)
+        self.assertEqual(len(cs), 2000)
+        cs2 = CaseSet(storage_dir=self.tempdir)
+        memory = CaseSet()
+        for i in range(1000, 2500):
+            cs2.record_case(self.make_case(i))
+            memory.record_case(self.make_case(i))
+        self.assertEqual(len(cs2), 1500)
+        self.assertTrue(self.cases[1500] in cs2)
+        self.assertFalse(self.cases[10] in cs2)
+
+        for other in (cs2, memory):
+            self.assertEqual(len(cs & other), 1000)
+            self.assertEqual(len(other & cs), 1000)
+            self.assertEqual(len(cs | other), 2500)
+            self.assertEqual(len(other | cs), 2500)
+            self.assertEqual(len(cs - other), 1000)
+            self.assertEqual(len(other - cs), 500)
+            self.assertEqual(len(cs.symmetric_difference(other)), 1500)
+            self.assertFalse(cs.isdisjoint(other))
+            self.assertTrue((cs & other) <= other)
+            self.assertTrue((cs & other) < other)
+            self.assertTrue((cs & other) == (other & cs))
+            self.assertTrue(other - cs < other)
+            self.assertFalse(cs <= other)
+            self.assertTrue(cs.isdisjoint(other - cs))
+
+        self.assertEqual(cs.pop(1), self.cases[1])
+        self.assertFalse(self.cases[1] in cs)
+        self.assertTrue(self.cases[2] in cs)
+        cs.remove(self.cases[2])
+        self.assertRaises(KeyError, cs.remove, self.cases[2])
+        self.assertEqual(len(cs), 1998)
+
+
 if __name__ == "__main__":
     unittest.main()
 
@@ -0,0 +1,187 @@
+"""
+Test of ColumnCaseRecorder.
+"""
+
+import glob
+import os
+import StringIO
+import unittest
+
+from math import isnan
+
+import numpy as np
+
+from openmdao.main.api import Assembly, Component, set_as_top
+from openmdao.main.datatypes.api import Array, Float
+from openmdao.lib.casehandlers.api import CaseDataset, ColumnCaseRecorder, \
+                                          JSONCaseRecorder
+from openmdao.lib.casehandlers.test.test_query import SellarMDF
+from openmdao.lib.drivers.api import SLSQPdriver
+from openmdao.util.testutil import assert_rel_error
+
+
+class ArrayComp(Component):
+
+    x = Array(np.zeros(3), iotype='in')
+    n = Float(0.0, iotype='out')
+    y = Array(np.zeros((3, 2)), iotype='out')
+
+    def execute(self):
+        self.y = np.outer(self.x, [1.0, 2.0])
+        self.n = float(np.dot(self.x, self.x))
+
+
+class TestCase(unittest.TestCase):
+
+    def tearDown(self):
+        for path in glob.glob('cases.*'):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def test_sellar(self):
+        # Same data as from JSONCaseRecorder.
+        top = set_as_top(SellarMDF())
+        top.name = 'top'
+        top.recorders = [JSONCaseRecorder('cases.json'),
+                         ColumnCaseRecorder('cases.col', chunk_size=10)]
+        top.run()
+        for recorder in top.recorders:
+            recorder.close()
+
+        json_cds = CaseDataset('cases.json', 'json')
+        col_cds = CaseDataset('cases.col', 'column')
+        self.assertEqual(col_cds.data.var_names().fetch(),
+                         json_cds.data.var_names().fetch())
+
+        json_cases = json_cds.data.fetch()
+        col_cases = col_cds.data.fetch()
+        self.assertEqual(len(col_cases), len(json_cases))
+        for json_case, col_case in zip(json_cases, col_cases):
+            for name in json_case.keys():
+                json_val = json_case[name]
+                col_val = col_case[name]
+                if name == 'timestamp':
+                    continue
+                elif isinstance(json_val, float):
+                    if isnan(json_val):
+                        self.assertTrue(isnan(col_val))
+                    else:
+                        self.assertEqual(col_val, json_val)
+                elif name not in ('_id', '_parent_id', '_driver_id'):
+                    self.assertEqual(col_val, json_val)
+
+        # Following a file, including a partial chunk.
+        follower = col_cds.data.follow()
+        cases = list(follower.cases())
+        self.assertEqual(len(cases), len(col_cases))
+        self.assertEqual([case['_id'] for case in cases],
+                         [case['_id'] for case in col_cases])
+        self.assertEqual(list(follower.cases()), [])
+
+        # Queries that rescan the file.
+        sub_cases = col_cds.data.driver('sub.driver').fetch()
+        self.assertEqual(len(sub_cases),
+                         len(json_cds.data.driver('sub.driver').fetch()))
+
+        parent = col_cases[5]['_id']
+        self.assertEqual(len(col_cds.data.parent_case(parent).fetch()), 6)
+
+        # Restore from the last case.
+        top = set_as_top(SellarMDF())
+        col_cds.restore(top, col_cases[-1]['_id'])
+        assert_rel_error(self, top.sub.globals.z1, 1.977639, .0001)
+        assert_rel_error(self, top.sub.states.y[0], 3.160004, .0001)
+
+    def test_arrays(self):
+        # Arrays are stored and returned in their native dtype and shape.
+        top = set_as_top(Assembly())
+        top.add('comp', ArrayComp())
+        top.add('driver', SLSQPdriver())
+        top.driver.workflow.add('comp')
+        top.driver.add_parameter('comp.x', low=-10, high=10)
+        top.driver.add_objective('comp.n')
+        top.comp.x = np.array([1.0, 2.0, 3.0])
+
+        sout = StringIO.StringIO()
+        top.recorders = [ColumnCaseRecorder(sout, chunk_size=3)]
+        top.run()
+
+        cds = CaseDataset(StringIO.StringIO(sout.getvalue()), 'column')
+        cases = cds.data.vars('comp.x', 'comp.y').fetch()
+        self.assertTrue(len(cases) > 3)
+        for case in cases:
+            x, y = case['comp.x'], case['comp.y']
+            self.assertTrue(isinstance(y, np.ndarray))
+            self.assertEqual(y.shape, (3, 2))
+            self.assertEqual(y.dtype, np.float64)
+            self.assertTrue((y == np.outer(x, [1.0, 2.0])).all())
+
+        # Columns of arrays are decoded directly.
+        arrays = cds.data.vars('comp.x', 'comp.y', 'comp.n') \
+                    .where('comp.n < 10').arrays().fetch()
+        self.assertEqual(arrays['comp.y'].shape[1:], (3, 2))
+        self.assertEqual(arrays['comp.y'].dtype, np.float64)
+        self.assertEqual(len(arrays['comp.y']),
+                         len([case for case in cases
+                              if np.dot(case['comp.x'], case['comp.x']) < 10]))
+        self.assertTrue((arrays['comp.n'] < 10).all())
+
+        # A truncated file returns the complete chunks.
+        data = sout.getvalue()
+        cds = CaseDataset(StringIO.StringIO(data[:-10]), 'column')
+        self.assertEqual(len(cds.data.fetch()) % 3, 0)
+
+        # Following a growing file.
+        partial = StringIO.StringIO(data[:-10])
+        cds = CaseDataset(partial, 'column')
+        follower = cds.data.vars('comp.x').follow()
+        count = follower.update()
+        self.assertEqual(count % 3, 0)
+        partial.seek(0, os.SEEK_END)
+        partial.write(data[-10:])
+        self.assertEqual(count + follower.update(), len(cases))
+        self.assertEqual(len(follower.by_variable['comp.x']), len(cases))
+
+    def test_changed_vars(self):
+        # Cases of a driver in the same chunk record different variables.
+        top = set_as_top(Assembly())
+        top.add('comp', ArrayComp())
+        top.driver.workflow.add('comp')
+
+        sout = StringIO.StringIO()
+        recorder = ColumnCaseRecorder(sout, chunk_size=10)
+        recorder.startup()
+        recorder.register(top.driver, ['comp.x'], ['comp.n', 'comp.y'])
+        recorder.record_constants({})
+        recorder.register(top.driver, ['comp.x'], ['comp.n'])
+        recorder.record(top.driver, [np.ones(3)], [3.0], None, 'case-1', None)
+        recorder.register(top.driver, ['comp.x'], ['comp.n', 'comp.y'])
+        for i in range(2):
+            recorder.record(top.driver, [np.ones(3)], [3.0, np.ones((3, 2))],
+                            None, 'case-%d' % (i+2), None)
+        recorder.close()
+
+        cds = CaseDataset(StringIO.StringIO(sout.getvalue()), 'column')
+        cases = cds.data.fetch()
+        self.assertEqual(len(cases), 3)
+        self.assertTrue(isnan(cases[0]['comp.y']))
+        for case in cases[1:]:
+            self.assertEqual(case['comp.y'].shape, (3, 2))
+        for case in cases:
+            self.assertEqual(case['comp.n'], 3.0)
+
+        arrays = cds.data.vars('comp.n', 'comp.y').arrays().fetch()
+        self.assertEqual(arrays['comp.y'].shape, (3, 3, 2))
+        self.assertTrue(np.isnan(arrays['comp.y'][0]).all())
+        self.assertTrue((arrays['comp.y'][1:] == 1.0).all())
+        self.assertTrue((arrays['comp.n'] == 3.0).all())
+
+    def test_bad_file(self):
+        path = os.path.join(os.path.dirname(__file__), 'sellar.bson')
+        self.assertRaises(RuntimeError, CaseDataset, path, 'column')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -97,12 +97,17 @@ Constants:
    driver.gradient_options.derivative_direction: auto
    driver.gradient_options.directional_fd: False
    driver.gradient_options.fd_blocks: []
+   driver.gradient_options.fd_coloring: none
    driver.gradient_options.fd_form: forward
+   driver.gradient_options.fd_servers: 1
    driver.gradient_options.fd_step: 1e-06
    driver.gradient_options.fd_step_type: absolute
    driver.gradient_options.force_fd: False
+   driver.gradient_options.gmres_block_size: 0
    driver.gradient_options.gmres_maxiter: 100
    driver.gradient_options.gmres_tolerance: 1e-09
+   driver.gradient_options.lin_solver: scipy_gmres
+   driver.gradient_options.preconditioner: component
    excludes: []
    force_fd: False
    includes: ['*']
@@ -134,12 +139,17 @@ Constants:
    nested.doublenest.driver.gradient_options.derivative_direction: auto
    nested.doublenest.driver.gradient_options.directional_fd: False
    nested.doublenest.driver.gradient_options.fd_blocks: []
+   nested.doublenest.driver.gradient_options.fd_coloring: none
    nested.doublenest.driver.gradient_options.fd_form: forward
+   nested.doublenest.driver.gradient_options.fd_servers: 1
    nested.doublenest.driver.gradient_options.fd_step: 1e-06
    nested.doublenest.driver.gradient_options.fd_step_type: absolute
    nested.doublenest.driver.gradient_options.force_fd: False
+   nested.doublenest.driver.gradient_options.gmres_block_size: 0
    nested.doublenest.driver.gradient_options.gmres_maxiter: 100
    nested.doublenest.driver.gradient_options.gmres_tolerance: 1e-09
+   nested.doublenest.driver.gradient_options.lin_solver: scipy_gmres
+   nested.doublenest.driver.gradient_options.preconditioner: component
    nested.doublenest.excludes: []
    nested.doublenest.force_fd: False
    nested.doublenest.includes: ['*']
@@ -149,12 +159,17 @@ Constants:
    nested.driver.gradient_options.derivative_direction: auto
    nested.driver.gradient_options.directional_fd: False
    nested.driver.gradient_options.fd_blocks: []
+   nested.driver.gradient_options.fd_coloring: none
    nested.driver.gradient_options.fd_form: forward
+   nested.driver.gradient_options.fd_servers: 1
    nested.driver.gradient_options.fd_step: 1e-06
    nested.driver.gradient_options.fd_step_type: absolute
    nested.driver.gradient_options.force_fd: False
+   nested.driver.gradient_options.gmres_block_size: 0
    nested.driver.gradient_options.gmres_maxiter: 100
    nested.driver.gradient_options.gmres_tolerance: 1e-09
+   nested.driver.gradient_options.lin_solver: scipy_gmres
+   nested.driver.gradient_options.preconditioner: component
    nested.excludes: []
    nested.force_fd: False
    nested.includes: ['*']
@@ -244,12 +259,17 @@ Constants:
    driver.gradient_options.derivative_direction: auto
    driver.gradient_options.directional_fd: False
    driver.gradient_options.fd_blocks: []
+   driver.gradient_options.fd_coloring: none
    driver.gradient_options.fd_form: forward
+   driver.gradient_options.fd_servers: 1
    driver.gradient_options.fd_step: 1e-06
    driver.gradient_options.fd_step_type: absolute
    driver.gradient_options.force_fd: False
+   driver.gradient_options.gmres_block_size: 0
    driver.gradient_options.gmres_maxiter: 100
    driver.gradient_options.gmres_tolerance: 1e-09
+   driver.gradient_options.lin_solver: scipy_gmres
+   driver.gradient_options.preconditioner: component
    excludes: []
    force_fd: False
    includes: ['*']
@@ -281,12 +301,17 @@ Constants:
    nested.doublenest.driver.gradient_options.derivative_direction: auto
    nested.doublenest.driver.gradient_options.directional_fd: False
    nested.doublenest.driver.gradient_options.fd_blocks: []
+   nested.doublenest.driver.gradient_options.fd_coloring: none
    nested.doublenest.driver.gradient_options.fd_form: forward
+   nested.doublenest.driver.gradient_options.fd_servers: 1
    nested.doublenest.driver.gradient_options.fd_step: 1e-06
    nested.doublenest.driver.gradient_options.fd_step_type: absolute
    nested.doublenest.driver.gradient_options.force_fd: False
+   nested.doublenest.driver.gradient_options.gmres_block_size: 0
    nested.doublenest.driver.gradient_options.gmres_maxiter: 100
    nested.doublenest.driver.gradient_options.gmres_tolerance: 1e-09
+   nested.doublenest.driver.gradient_options.lin_solver: scipy_gmres
+   nested.doublenest.driver.gradient_options.preconditioner: component
    nested.doublenest.excludes: []
    nested.doublenest.force_fd: False
    nested.doublenest.includes: ['*']
@@ -296,12 +321,17 @@ Constants:
    nested.driver.gradient_options.derivative_direction: auto
    nested.driver.gradient_options.directional_fd: False
    nested.driver.gradient_options.fd_blocks: []
+   nested.driver.gradient_options.fd_coloring: none
    nested.driver.gradient_options.fd_form: forward
+   nested.driver.gradient_options.fd_servers: 1
    nested.driver.gradient_options.fd_step: 1e-06
    nested.driver.gradient_options.fd_step_type: absolute
    nested.driver.gradient_options.force_fd: False
+   nested.driver.gradient_options.gmres_block_size: 0
    nested.driver.gradient_options.gmres_maxiter: 100
    nested.driver.gradient_options.gmres_tolerance: 1e-09
+   nested.driver.gradient_options.lin_solver: scipy_gmres
+   nested.driver.gradient_options.preconditioner: component
    nested.excludes: []
    nested.force_fd: False
    nested.includes: ['*']
@@ -396,12 +426,17 @@ Constants:
    driver.gradient_options.derivative_direction: auto
    driver.gradient_options.directional_fd: False
    driver.gradient_options.fd_blocks: []
+   driver.gradient_options.fd_coloring: none
    driver.gradient_options.fd_form: forward
+   driver.gradient_options.fd_servers: 1
    driver.gradient_options.fd_step: 1e-06
    driver.gradient_options.fd_step_type: absolute
    driver.gradient_options.force_fd: False
+   driver.gradient_options.gmres_block_size: 0
    driver.gradient_options.gmres_maxiter: 100
    driver.gradient_options.gmres_tolerance: 1e-09
+   driver.gradient_options.lin_solver: scipy_gmres
+   driver.gradient_options.preconditioner: component
    excludes: []
    force_fd: False
    includes: ['*']
@@ -455,12 +490,17 @@ Constants:
    driver.gradient_options.derivative_direction: auto
    driver.gradient_options.directional_fd: False
    driver.gradient_options.fd_blocks: []
+   driver.gradient_options.fd_coloring: none
    driver.gradient_options.fd_form: forward
+   driver.gradient_options.fd_servers: 1
    driver.gradient_options.fd_step: 1e-06
    driver.gradient_options.fd_step_type: absolute
    driver.gradient_options.force_fd: False
+   driver.gradient_options.gmres_block_size: 0
    driver.gradient_options.gmres_maxiter: 100
    driver.gradient_options.gmres_tolerance: 1e-09
+   driver.gradient_options.lin_solver: scipy_gmres
+   driver.gradient_options.preconditioner: component
    excludes: []
    force_fd: False
    includes: ['*']
@@ -9,6 +9,8 @@ import os
 import logging
 import shutil
 
+import numpy
+
 from openmdao.main.api import Assembly, Case, set_as_top
 from openmdao.test.execcomp import ExecComp
 from openmdao.lib.casehandlers.api import DBCaseIterator, DBCaseRecorder, \
@@ -260,6 +262,42 @@ class DBCaseRecorderTestCase(unittest.TestCase):
             except OSError:
                 logging.error("problem removing directory %s", tmpdir)
 
+    def test_batch(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            dfile = os.path.join(tmpdir, 'junk.db')
+            recorder = DBCaseRecorder(dfile, batch_size=4)
+            mode = recorder._connection.execute('PRAGMA journal_mode')
+            self.assertEqual(mode.fetchone()[0], 'wal')
+
+            inputs = ['comp1.x', 'comp1.a']
+            outputs = ['comp1.z']
+            recorder.register(self, inputs, outputs)
+            for i in range(6):
+                inputs = [i, numpy.arange(6, dtype='i4').reshape((2, 3)) + i]
+                outputs = [numpy.array([i, 2.5*i])]
+                recorder.record(self, inputs, outputs, None, '', '')
+
+            # Only the first batch has been committed.
+            varinfo = case_db_to_dict(dfile, ['comp1.x'])
+            self.assertEqual(varinfo['comp1.x'], range(4))
+
+            recorder.close()
+            varinfo = case_db_to_dict(dfile, ['comp1.x', 'comp1.a',
+                                              'comp1.z'])
+            self.assertEqual(varinfo['comp1.x'], range(6))
+            for i, value in enumerate(varinfo['comp1.a']):
+                self.assertEqual(value.dtype, numpy.dtype('i4'))
+                self.assertEqual(value.shape, (2, 3))
+                self.assertEqual(value[1, 2], i+5)
+            for i, value in enumerate(varinfo['comp1.z']):
+                self.assertEqual(list(value), [i, 2.5*i])
+        finally:
+            try:
+                shutil.rmtree(tmpdir, onerror=onerror)
+            except OSError:
+                logging.error("problem removing directory %s", tmpdir)
+
 
 class NestedCaseTestCase(unittest.TestCase):
 
@@ -63,12 +63,17 @@ Constants:
    driver.gradient_options.derivative_direction: auto
    driver.gradient_options.directional_fd: False
    driver.gradient_options.fd_blocks: []
+   driver.gradient_options.fd_coloring: none
    driver.gradient_options.fd_form: forward
+   driver.gradient_options.fd_servers: 1
    driver.gradient_options.fd_step: 1e-06
    driver.gradient_options.fd_step_type: absolute
    driver.gradient_options.force_fd: False
+   driver.gradient_options.gmres_block_size: 0
    driver.gradient_options.gmres_maxiter: 100
    driver.gradient_options.gmres_tolerance: 1e-09
+   driver.gradient_options.lin_solver: scipy_gmres
+   driver.gradient_options.preconditioner: component
    excludes: []
    force_fd: False
    includes: ['*']
@@ -142,12 +147,17 @@ Constants:
    driver.gradient_options.derivative_direction: auto
    driver.gradient_options.directional_fd: False
    driver.gradient_options.fd_blocks: []
+   driver.gradient_options.fd_coloring: none
    driver.gradient_options.fd_form: forward
+   driver.gradient_options.fd_servers: 1
    driver.gradient_options.fd_step: 1e-06
    driver.gradient_options.fd_step_type: absolute
    driver.gradient_options.force_fd: False
+   driver.gradient_options.gmres_block_size: 0
    driver.gradient_options.gmres_maxiter: 100
    driver.gradient_options.gmres_tolerance: 1e-09
+   driver.gradient_options.lin_solver: scipy_gmres
+   driver.gradient_options.preconditioner: component
    excludes: []
    force_fd: False
    includes: ['*']
@@ -3,6 +3,7 @@ Test query of case recorder file.
 """
 
 import glob
+import json
 import os.path
 import unittest
 
@@ -10,8 +11,10 @@ from math import isnan
 
 from openmdao.main.api import Assembly, Component, VariableTree, set_as_top
 from openmdao.main.datatypes.api import Array, Float, VarTree
+from openmdao.main.interfaces import implements, ICaseRecorder
 from openmdao.lib.casehandlers.api import CaseDataset, \
-                                          JSONCaseRecorder, BSONCaseRecorder
+                                          JSONCaseRecorder, BSONCaseRecorder, \
+                                          ColumnCaseRecorder
 from openmdao.lib.drivers.api import FixedPointIterator, SLSQPdriver
 from openmdao.lib.optproblems import sellar
 from openmdao.util.testutil import assert_rel_error
@@ -106,6 +109,75 @@ class SellarMDF(Assembly):
         self.sub.x1 = 1.0
 
 
+class ShardingRecorder(object):
+    """
+    Records cases from `driver_name` in two shard files via the shard API
+    of `recorder`, the way a concurrent CaseIteratorDriver would.
+    """
+
+    implements(ICaseRecorder)
+
+    def __init__(self, recorder, driver_name):
+        self.recorder = recorder
+        self.driver_name = driver_name
+        self.driver = None
+        self.shards = None
+        self.cases = []
+        self.parent_uuid = None
+
+    def startup(self):
+        self.recorder.startup()
+
+    def register(self, driver, inputs, outputs):
+        if driver.get_pathname() == self.driver_name:
+            self.driver = driver
+        self.recorder.register(driver, inputs, outputs)
+
+    def record_constants(self, constants):
+        self.recorder.record_constants(constants)
+
+    def record(self, driver, inputs, outputs, exc, case_uuid, parent_uuid):
+        if driver is self.driver:
+            if self.shards is None:
+                info = self.recorder.get_shard_info(driver)
+                root, ext = os.path.splitext(info['path'])
+                self.shards = []
+                for i in range(2):
+                    shard = type(self.recorder)('%s-%d%s' % (root, i, ext),
+                                                **info['options'])
+                    shard.start_shard(info)
+                    self.shards.append(shard)
+            shard = len(self.cases) % 2
+            self.shards[shard].record(id(driver), inputs, outputs, exc,
+                                      case_uuid, parent_uuid)
+            self.cases.append((shard, case_uuid))
+            self.parent_uuid = parent_uuid
+        else:
+            self.flush()
+            self.recorder.record(driver, inputs, outputs, exc,
+                                 case_uuid, parent_uuid)
+
+    def flush(self):
+        if self.cases:
+            files = []
+            for shard in self.shards:
+                if hasattr(shard, 'flush'):
+                    shard.flush()
+                files.append(shard.out.name)
+            self.recorder.record_shards(self.driver, files, self.cases,
+                                        self.parent_uuid)
+            self.cases = []
+
+    def close(self):
+        self.flush()
+        for shard in self.shards or ():
+            shard.close()
+        self.recorder.close()
+
+    def get_iterator(self):
+        return None
+
+
 def create_files():
     """ Create/update test data files. """
     prob = set_as_top(SellarMDF())
@@ -131,6 +203,12 @@ class TestCase(unittest.TestCase):
                 # Still in use (recorder or dataset hasn't been deleted yet).
                 pass
 
+        # Index files for the test data.
+        pattern = os.path.join(os.path.dirname(__file__), '*.idx')
+        for path in glob.glob(pattern):
+            if os.path.exists(path):
+                os.remove(path)
+
     def test_query(self):
         # Full dataset.
         vnames = self.cds.data.var_names().fetch()
@@ -319,6 +397,306 @@ class TestCase(unittest.TestCase):
         cases = CaseDataset(path, 'json').data.fetch()
         self.assertEqual(len(cases), 7)
 
+    def test_index(self):
+        # Specific cases are read via the index, without a full scan.
+        path = os.path.join(os.path.dirname(__file__), 'sellar.json')
+        with open(path, 'r') as inp:
+            with open('cases.json', 'w') as out:
+                out.write(inp.read())
+
+        cds = CaseDataset('cases.json', 'json')
+        all_cases = cds.data.fetch()
+        for i in (0, 6, 70, 141):
+            cases = cds.data.case(all_cases[i]['_id']).fetch()
+            self.compare_rows(cases, [all_cases[i]])
+        self.assertTrue(os.path.exists('cases.json.idx'))
+
+        parent = all_cases[100]['_id']
+        cds = CaseDataset('cases.json', 'json')
+        cds._reader.position = lambda case_id: None  # Force full scan.
+        expected = cds.data.parent_case(parent).fetch()
+
+        cds = CaseDataset('cases.json', 'json')
+        cds._reader._build_index = None  # Must use saved index.
+        cases = cds.data.case(all_cases[100]['_id']).fetch()
+        self.compare_rows(cases, [all_cases[100]])
+        cases = cds.data.parent_case(parent).fetch()
+        self.compare_rows(cases, expected)
+
+        # Out of date index is rebuilt.
+        with open('cases.json', 'a') as out:
+            out.write('\n')
+        cds = CaseDataset('cases.json', 'json')
+        cases = cds.data.case(all_cases[100]['_id']).fetch()
+        self.compare_rows(cases, [all_cases[100]])
+
+    def compare_rows(self, rows, expected):
+        self.assertEqual(len(rows), len(expected))
+        for row, expected_row in zip(rows, expected):
+            self.assertEqual(sorted(row.keys()), sorted(expected_row.keys()))
+            for name in row.keys():
+                value = row[name]
+                if isinstance(value, float) and isnan(value):
+                    self.assertTrue(isnan(expected_row[name]))
+                else:
+                    self.assertEqual(value, expected_row[name])
+
+    def test_where(self):
+        cases = self.cds.data.vars('sub.globals.z1', 'sub.states') \
+                             .where('sub.globals.z1 < 2.5').fetch()
+        self.assertEqual(len(cases), 110)
+        for case in cases:
+            self.assertTrue(case['sub.globals.z1'] < 2.5)
+
+        # Names not returned, indexing, 'and' and chained comparisons.
+        expr = "sub.states['y'][0] > 3.2 and 0 < sub.globals.z1 < 5 and" \
+               " not _driver_id == %s" % self.cds.drivers[1]['_id']
+        cases = self.cds.data.vars('sub.globals.z1').where(expr).fetch()
+        self.assertEqual(len(cases), 4)
+        for case in cases:
+            self.assertTrue(0 < case['sub.globals.z1'] < 5)
+
+        for expr, msg in (('sub.nosuch < 3',
+                           "Names not found in the dataset: ['sub.nosuch']"),
+                          ('sub.globals.z1 <',
+                           "Invalid where() expression 'sub.globals.z1 <':"
+                           " unexpected EOF while parsing (<unknown>, line 1)")):
+            try:
+                self.cds.data.where(expr).fetch()
+            except ValueError as exc:
+                self.assertEqual(str(exc), msg)
+            else:
+                self.fail('ValueError expected')
+
+    def test_arrays(self):
+        # Arrays have the same values as rows.
+        for query in (lambda: self.cds.data,
+                      lambda: self.cds.data.local(),
+                      lambda: self.cds.data.driver('sub.driver'),
+                      lambda: self.cds.data.where('sub.states.y[1] > 3.7'),
+                      lambda: self.cds.data.parent_case(
+                                         self.cds.data.fetch()[100]['_id'])):
+            rows = query().fetch()
+            arrays = query().arrays().fetch()
+            self.assertEqual(sorted(arrays.keys()), sorted(rows[0].keys()))
+            self.assertEqual(len(arrays['_id']), len(rows))
+            self.compare_rows([dict([(name, array[i])
+                                     for name, array in arrays.items()])
+                               for i in range(len(rows))], rows)
+
+        arrays = self.cds.data.vars('sub.globals.z1', 'sub.states') \
+                              .where("sub.states['y'][0] > 3.2").arrays() \
+                              .fetch()
+        self.assertEqual(arrays['sub.globals.z1'].dtype, float)
+        self.assertEqual(arrays['sub.globals.z1'].shape, (63,))
+        for states in arrays['sub.states']:
+            self.assertTrue(states['y'][0] > 3.2)
+
+        case_id = self.cds.data.fetch()[7]['_id']
+        arrays = self.cds.data.case(case_id).vars('sub.globals.z1') \
+                              .arrays().fetch()
+        self.assertEqual(arrays['sub.globals.z1'].tolist(), [5.])
+
+    def test_follow(self):
+        # Cases are read as the file grows, in pieces that split records.
+        for fmt in ('json', 'bson'):
+            path = os.path.join(os.path.dirname(__file__), 'sellar.'+fmt)
+            with open(path, 'rb') as inp:
+                data = inp.read()
+            cds = CaseDataset(path, fmt)
+            expected = cds.data.local().fetch()
+            by_variable = cds.data.local().by_variable().fetch()
+            end = cds._reader.index[0][0] + 100  # Within first case.
+
+            filename = 'cases.'+fmt
+            with open(filename, 'wb') as out:
+                out.write(data[:end])
+                out.flush()
+                cds = CaseDataset(filename, fmt)
+                follower = cds.data.local().follow()
+                updater = cds.data.local().follow()
+
+                cases = []
+                while end < len(data):
+                    cases.extend(follower.cases())
+                    updater.update()
+                    out.write(data[end:end+7777])
+                    out.flush()
+                    end += 7777
+                    # Other queries don't interfere.
+                    cds.data.driver('sub.driver').fetch()
+            cases.extend(follower.cases())
+            self.assertTrue(updater.update() > 0)
+            self.assertEqual(updater.update(), 0)
+            self.assertEqual(list(follower.cases()), [])
+            self.compare_rows(cases, expected)
+            self.assertEqual(sorted(updater.by_variable.keys()),
+                             sorted(by_variable.keys()))
+            for name in by_variable.keys():
+                self.compare_rows([dict(x=value) for value in
+                                   updater.by_variable[name]],
+                                  [dict(x=value) for value in
+                                   by_variable[name]])
+
+        # Filters.
+        follower = self.cds.data.driver('sub.driver').vars('sub.dis1.y1') \
+                                .where('sub.dis1.y1 > 4').follow()
+        cases = list(follower.cases())
+        expected = self.cds.data.driver('sub.driver').vars('sub.dis1.y1') \
+                                .where('sub.dis1.y1 > 4').fetch()
+        self.assertEqual(len(cases), 45)
+        self.compare_rows(cases, expected)
+
+        try:
+            self.cds.data.case(self.cds.data.fetch()[0]['_id']).follow()
+        except ValueError as exc:
+            self.assertEqual(str(exc), 'data.case() and data.parent_case()'
+                                       ' invalid for follow()')
+        else:
+            self.fail('ValueError expected')
+
+    def test_delta(self):
+        # Delta encoded files read the same as full files.
+        top = set_as_top(SellarMDF())
+        top.name = 'top'
+        top.recorders = [JSONCaseRecorder('cases.json'),
+                         JSONCaseRecorder('cases.delta.json', delta=True,
+                                          keyframe_interval=10),
+                         BSONCaseRecorder('cases.delta.bson', delta=True,
+                                          keyframe_interval=10)]
+        top.run()
+
+        self.assertTrue(os.path.getsize('cases.delta.json') <
+                        os.path.getsize('cases.json'))
+
+        def strip(rows):  # Some metadata differs between recorders.
+            return [dict([(name, value) for name, value in row.items()
+                          if name not in ('timestamp', '_parent_id')])
+                    for row in rows]
+
+        cds = CaseDataset('cases.json', 'json')
+        full = cds.data.fetch()
+        for path, fmt in (('cases.delta.json', 'json'),
+                          ('cases.delta.bson', 'bson')):
+            delta_cds = CaseDataset(path, fmt)
+            self.compare_rows(strip(delta_cds.data.fetch()), strip(full))
+            self.compare_rows(strip(delta_cds.data.local().fetch()),
+                              strip(cds.data.local().fetch()))
+            self.compare_rows(strip(delta_cds.data.driver('sub.driver')
+                                             .fetch()),
+                              strip(cds.data.driver('sub.driver').fetch()))
+
+            # Seeking to cases uses keyframes.
+            for i in (0, 5, 37, 100, len(full)-1):
+                self.compare_rows(strip(delta_cds.data.case(full[i]['_id'])
+                                                 .fetch()),
+                                  strip([full[i]]))
+            parent = full[100]['_id']
+            self.compare_rows(strip(delta_cds.data.parent_case(parent)
+                                             .fetch()),
+                              strip(cds.data.parent_case(parent).fetch()))
+
+            keyframes = [entry[5] for entry in delta_cds._reader.index]
+            self.assertTrue(0 < keyframes.count(True) < len(keyframes)/5)
+
+    def test_compress(self):
+        # Compressed files read the same as uncompressed files.
+        top = set_as_top(SellarMDF())
+        top.name = 'top'
+        top.recorders = [JSONCaseRecorder('cases.json'),
+                         BSONCaseRecorder('cases.bson'),
+                         JSONCaseRecorder('cases.z.json', compress_level=6),
+                         BSONCaseRecorder('cases.z.bson', compress_level=1,
+                                          delta=True, keyframe_interval=10)]
+        top.run()
+
+        self.assertTrue(os.path.getsize('cases.z.json') <
+                        os.path.getsize('cases.json'))
+        self.assertTrue(os.path.getsize('cases.z.bson') <
+                        os.path.getsize('cases.bson'))
+
+        # Still a valid JSON file.
+        with open('cases.z.json', 'r') as inp:
+            self.assertTrue('simulation_info' in json.load(inp))
+
+        def strip(rows):  # Some metadata differs between recorders.
+            return [dict([(name, value) for name, value in row.items()
+                          if name not in ('timestamp', '_parent_id')])
+                    for row in rows]
+
+        cds = CaseDataset('cases.json', 'json')
+        full = cds.data.fetch()
+        for path, fmt in (('cases.z.json', 'json'), ('cases.z.bson', 'bson')):
+            z_cds = CaseDataset(path, fmt)
+            self.compare_rows(strip(z_cds.data.fetch()), strip(full))
+            self.compare_rows(strip(z_cds.data.driver('sub.driver').fetch()),
+                              strip(cds.data.driver('sub.driver').fetch()))
+
+            # Seeking to cases.
+            for i in (0, 5, 37, 100, len(full)-1):
+                self.compare_rows(strip(z_cds.data.case(full[i]['_id'])
+                                             .fetch()),
+                                  strip([full[i]]))
+
+            follower = z_cds.data.follow()
+            self.compare_rows(strip(follower.cases()), strip(full))
+
+    def test_shards(self):
+        # Cases recorded in shard files read the same as if recorded in the
+        # main file.
+        top = set_as_top(SellarMDF())
+        top.name = 'top'
+        formats = (('json', JSONCaseRecorder), ('bson', BSONCaseRecorder),
+                   ('column', ColumnCaseRecorder))
+        top.recorders = []
+        for fmt, cls in formats:
+            top.recorders.append(cls('cases.%s' % fmt))
+            top.recorders.append(ShardingRecorder(cls('cases.shards.%s' % fmt),
+                                                  'top.sub.driver'))
+        top.run()
+
+        def strip(rows):  # Some metadata differs between recorders.
+            return [dict([(name, value) for name, value in row.items()
+                          if name not in ('timestamp', '_parent_id')])
+                    for row in rows]
+
+        for fmt, cls in formats:
+            cds = CaseDataset('cases.%s' % fmt, fmt)
+            shard_cds = CaseDataset('cases.shards.%s' % fmt, fmt)
+            full = cds.data.fetch()
+
+            # Each shard is a complete file.
+            sub_cases = cds.data.driver('sub.driver').fetch()
+            count = 0
+            for path in glob.glob('cases.shards-*.%s' % fmt):
+                cases = CaseDataset(path, fmt).data.fetch()
+                self.assertTrue(len(cases) > 0)
+                count += len(cases)
+            self.assertEqual(count, len(sub_cases))
+
+            self.compare_rows(strip(shard_cds.data.fetch()), strip(full))
+            self.compare_rows(strip(shard_cds.data.driver('sub.driver')
+                                             .fetch()),
+                              strip(sub_cases))
+
+            # Seeking to cases within shard sets.
+            for i in (0, 5, 37, 100, len(full)-1):
+                self.compare_rows(strip(shard_cds.data.case(full[i]['_id'])
+                                                 .fetch()),
+                                  strip([full[i]]))
+            parent = full[100]['_id']
+            self.compare_rows(strip(shard_cds.data.parent_case(parent)
+                                             .fetch()),
+                              strip(cds.data.parent_case(parent).fetch()))
+
+            arrays = shard_cds.data.vars('sub.dis1.y1').arrays().fetch()
+            expected = cds.data.vars('sub.dis1.y1').arrays().fetch()
+            self.assertEqual(arrays['sub.dis1.y1'].tolist(),
+                             expected['sub.dis1.y1'].tolist())
+
+            follower = shard_cds.data.follow()
+            self.compare_rows(strip(follower.cases()), strip(full))
+
     def test_restore(self):
         # Restore from case, run, verify outputs match expected.
         top = set_as_top(SellarMDF())
@@ -364,6 +742,13 @@ class TestCase(unittest.TestCase):
         self.assertEqual(len(reduced), 10)
         self.assertEqual(len(reduced[0]), 10)
 
+        CaseDataset(path, 'json').data.vars(names).write('cases.reduced.z',
+                                                         compress_level=9)
+        self.assertTrue(os.path.getsize('cases.reduced.z') <
+                        os.path.getsize('cases.reduced'))
+        self.assertEqual(CaseDataset('cases.reduced.z', 'json').data.fetch(),
+                         reduced)
+
 
 if __name__ == '__main__':
     unittest.main()
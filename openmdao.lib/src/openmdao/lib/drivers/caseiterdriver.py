@@ -3,6 +3,7 @@
 
 """
 
+import copy
 from cStringIO import StringIO
 import gc
 import logging
@@ -11,12 +12,14 @@ import Queue
 import sys
 import thread
 import threading
+import time
+from multiprocessing.managers import RemoteError
 from uuid import uuid1, getnode
 
-from numpy import array
+from numpy import array, array_equal, ndarray
 
-from openmdao.main.api import Driver, VariableTree
-from openmdao.main.datatypes.api import Bool, Dict, Enum, Int
+from openmdao.main.api import Assembly, Driver, VariableTree
+from openmdao.main.datatypes.api import Bool, Dict, Enum, Int, List
 from openmdao.main.exceptions import traceback_str, exception_str
 from openmdao.main.expreval import ExprEvaluator
 from openmdao.main.hasparameters import HasVarTreeParameters
@@ -34,6 +37,22 @@ from openmdao.util.filexfer import filexfer
 _EMPTY     = 'empty'
 _LOADING   = 'loading'
 _EXECUTING = 'executing'
+_PAUSED    = 'paused'
+
+# Shard recorders in a server process, keyed by filename.
+_SHARD_RECORDERS = {}
+
+# Model value which couldn't be copied, never the same as any other value.
+_UNKNOWN = object()
+
+# Weight of the latest case time in a server's average case time.
+_TIME_WEIGHT = 0.3
+
+# Minimum seconds between checks of a server host's load.
+_LOAD_CHECK_INTERVAL = 30.
+
+# Seconds to wait for a reply before reconsidering paused servers.
+_PAUSE_TIMEOUT = 5.
 
 
 class _Case(object):
@@ -53,6 +72,8 @@ class _Case(object):
         self.index = index  # Index of input and output values.
         self.retries = 0    # Retry counter.
         self.exc = None     # a sys.exec_info() tuple
+        self.twin = None    # Copy being evaluated speculatively.
+        self.done = False   # Set when results have been handled.
         self._exprs = None  # Dictionary of ExprEvaluators.
 
         self._inputs = {}
@@ -173,6 +194,8 @@ class _ServerData(object):
         self.top = None         # Top level object in server.
         self.state = _EMPTY     # See states above.
         self.case = None        # Current case being evaluated.
+        self.batch = None       # Current cases if evaluating a batch.
+        self.results = None     # Results from evaluating `batch`.
         self.exception = None   # sys.exc_info() from last operation.
 
         self.server = None      # Remote server proxy.
@@ -180,7 +203,12 @@ class _ServerData(object):
         self.queue = None       # Queue to put requests.
         self.in_use = False     # True if being used.
         self.load_failures = 0  # Load failure count.
+        self.shard = None       # Index in list of shard files.
 
+        self.started = None      # Time current case(s) were started.
+        self.avg_time = None     # Moving average of time per case.
+        self.load_checked = 0    # Time host load was last checked.
+        self.overloaded = False  # Result of last host load check.
 
 
 @add_delegate(HasVarTreeParameters, HasVarTreeResponses)
@@ -214,9 +242,38 @@ class CaseIteratorDriver(Driver):
                                         ' requirements will be included in the'
                                         ' generated egg.')
 
+    cases_per_dispatch = Int(1, low=1, iotype='in',
+                             desc='Number of cases sent to a server together'
+                                  ' when evaluating concurrently. The model'
+                                  ' is not reloaded between cases sent'
+                                  ' together.')
+
+    shard_recording = Bool(False, iotype='in',
+                           desc='If True, cases evaluated concurrently are'
+                                ' recorded by each server in its own shard'
+                                ' file, for recorders which support it.')
+
+    keep_servers = Bool(False, iotype='in',
+                        desc='If True, servers used for concurrent evaluation'
+                             ' are kept for the next execution, along with'
+                             ' their loaded models. Changed inputs are sent'
+                             ' to the kept models rather than replicating'
+                             ' the model again. Not used with'
+                             ' shard_recording.')
+
+    load_balancing = Bool(False, iotype='in',
+                          desc='If True, the time each server takes per case'
+                               ' is tracked when evaluating concurrently.'
+                               ' The last cases are held for faster servers,'
+                               ' cases still running in slow servers are'
+                               ' speculatively run again in idle servers,'
+                               ' and no cases are sent to servers on hosts'
+                               ' loaded beyond their allocator max_load.')
+
     def __init__(self, *args, **kwargs):
         super(CaseIteratorDriver, self).__init__(*args, **kwargs)
         self._iter = None  # Set to None when iterator is empty.
+        self._unread = 0   # Number of cases not yet read from `_iter`.
         self._replicants = 0
         self._abort_exc = None  # Set if error_policy == ABORT.
 
@@ -224,6 +281,14 @@ class CaseIteratorDriver(Driver):
         self._egg_required_distributions = None
         self._egg_orphan_modules = None
 
+        # State of our parent when replicated, if keeping servers.
+        self._keep = False
+        self._egg_signature = None
+        self._egg_fixed = None
+        self._egg_inputs = None
+        self._patch = []  # (path, value) of inputs changed since replicated.
+        self._pool_resources = None  # Resources used to allocate servers.
+
         self._reply_q = None  # Replies from server threads.
         self._server_lock = None  # Lock for server data.
 
@@ -235,6 +300,11 @@ class CaseIteratorDriver(Driver):
         self._rerun = []  # Cases that failed and should be retried.
         self._generation = 0  # Used to keep worker names unique.
 
+        self._shards = []          # (recorder, shard info) if sharding.
+        self._shards_only = False  # True if all recorders are sharded.
+        self._shard_files = []     # Local copies of shard files, per server.
+        self._shard_cases = []     # (shard index, case uuid) in order.
+
         # var wasn't showing up in parent depgraph without this
         self.error_policy = 'ABORT'
 
@@ -270,7 +340,7 @@ class CaseIteratorDriver(Driver):
                 server.top = self.parent
                 while self._iter is not None:
                     try:
-                        case = self._iter.next()
+                        case = self._read_case()
                         self._todo.append(case)
                         server.exception = None
                         server.case = None
@@ -294,9 +364,76 @@ class CaseIteratorDriver(Driver):
 
     def _setup(self):
         """ Setup to begin new run. """
+        self._shards = []
+        self._shards_only = False
+        self._shard_files = []
+        self._shard_cases = []
+
+        self._keep = False
+        if not self.sequential:
+            if self.shard_recording:
+                self._get_shards()
+            self._keep = self.keep_servers and not self._shards
+
+        if self._servers and not self._keep:
+            self.release_servers()
+
         if not self.sequential:
-            # Save model to egg.
-            # Must do this before creating any locks or queues.
+            # Reuse replicated model if only unconnected inputs have changed.
+            patch = None
+            if self._keep:
+                signature, fixed, inputs = self._model_state()
+                if self._egg_file and signature == self._egg_signature:
+                    patch = self._model_patch(fixed, inputs)
+
+            if patch is None:
+                self._replicate()
+                if self._keep:
+                    self._egg_signature = signature
+                    self._egg_fixed = fixed
+                    self._egg_inputs = inputs
+                patch = []
+            else:
+                self._logger.debug('reusing model, %d inputs changed',
+                                   len(patch))
+            self._patch = patch
+
+        inp_paths = []
+        inp_values = []
+        for path, param in self.get_parameters().items():
+            if isinstance(path, tuple):
+                path = path[0]  # Use first target of ParameterGroup.
+            path = make_legal_path(path)
+            value = self.get('case_inputs.'+path)
+            for target in param.targets:
+                inp_paths.append(target)
+                inp_values.append(value)
+
+        outputs = self.get_responses().keys()
+        extra_outputs = self.workflow._rec_outputs
+
+        length = len(inp_values[0]) if inp_values else 0
+        cases = []
+        for i in range(length):
+            inputs = []
+            for j in range(len(inp_paths)):
+                inputs.append((inp_paths[j], inp_values[j][i]))
+            cases.append(_Case(i, inputs, outputs, extra_outputs,
+                               parent_uuid=self._case_uuid))
+        self.init_responses(length)
+
+        self._iter = iter(cases)
+        self._unread = length
+        self._abort_exc = None
+
+    def _replicate(self):
+        """ Save a copy of our parent, mutated to run our workflow, to egg. """
+        self._remove_egg()
+
+        # Kept servers must not be copied with our parent.
+        pool = (self._servers, self._reply_q, self._server_lock)
+        self._servers, self._reply_q, self._server_lock = {}, None, None
+        try:
             self._replicants += 1
             version = 'replicant.%d' % (self._replicants)
 
@@ -315,7 +452,15 @@ class CaseIteratorDriver(Driver):
             # various workflow quantities.
             replicant = self.parent.copy()
             workflow = replicant.get(self.name+'.workflow')
-            driver = replicant.add('driver', Driver())
+            if self._shards:
+                driver = replicant.add('driver', self._shard_driver())
+                # The shard driver does the recording, and the copied
+                # recorders would write to files of this process.
+                replicant.recorders = []
+            elif self.cases_per_dispatch > 1:
+                driver = replicant.add('driver', _BatchDriver())
+            else:
+                driver = replicant.add('driver', Driver())
             workflow.parent = driver
             workflow.scope = None
             replicant.driver.workflow = workflow
@@ -323,37 +468,104 @@ class CaseIteratorDriver(Driver):
                                              need_requirements=need_reqs)
             replicant = workflow = driver = None  # Release objects.
             gc.collect()  # Collect/compact before possible fork.
+        finally:
+            self._servers, self._reply_q, self._server_lock = pool
 
-            self._egg_file = egg_info[0]
-            self._egg_required_distributions = egg_info[1]
-            self._egg_orphan_modules = [name for name, path in egg_info[2]]
+        self._egg_file = egg_info[0]
+        self._egg_required_distributions = egg_info[1]
+        self._egg_orphan_modules = [name for name, path in egg_info[2]]
 
-        inp_paths = []
-        inp_values = []
-        for path, param in self.get_parameters().items():
-            if isinstance(path, tuple):
-                path = path[0]  # Use first target of ParameterGroup.
-            path = make_legal_path(path)
-            value = self.get('case_inputs.'+path)
-            for target in param.targets:
-                inp_paths.append(target)
-                inp_values.append(value)
+    def _model_state(self):
+        """
+        Return ``(signature, fixed, inputs)`` describing the parts of our
+        parent used when evaluating cases concurrently. `signature` describes
+        the model structure, `fixed` holds values flowing into our workflow
+        from outside of it, and `inputs` holds unconnected inputs of
+        components in our workflow. Values are copies, keyed by path.
+        """
+        parent = self.parent
+        graph = parent._depgraph
+        comps = self.iteration_set()
+        names = set([comp.name for comp in comps])
+
+        fixed = {}
+        inputs = {}
+        for comp in comps:
+            for path in graph.list_inputs(comp.name, connected=True):
+                for src in graph.get_sources(path):
+                    if src.split('.')[0].split('[')[0] not in names:
+                        fixed[src] = _model_value(parent, src)
+            for path in graph.list_inputs(comp.name, connected=False):
+                inputs[path] = _model_value(parent, path)
+            if isinstance(comp, Assembly):
+                _assembly_inputs(comp, comp.name+'.', inputs)
+
+        signature = (sorted(names),
+                     sorted(graph.list_connections()),
+                     sorted([str(path) for path in self.get_parameters()]),
+                     sorted(self.get_responses()),
+                     self.cases_per_dispatch > 1,
+                     self.ignore_egg_requirements,
+                     sorted(fixed), sorted(inputs))
+        return (signature, fixed, inputs)
+
+    def _model_patch(self, fixed, inputs):
+        """
+        Return list of ``(path, value)`` for `inputs` which have changed
+        since the model was replicated, or None if any of the `fixed`
+        values have changed and the model must be replicated again.
+        """
+        for path, value in fixed.items():
+            if not _same_value(value, self._egg_fixed[path]):
+                self._logger.debug('%r changed, replicating model', path)
+                return None
+
+        return [(path, value) for path, value in sorted(inputs.items())
+                if not _same_value(value, self._egg_inputs[path])]
+
+    def _get_shards(self):
+        """ Determine the top level recorders which can record our cases
+        in shard files. """
+        if not self.workflow._rec_required:
+            return
 
-        outputs = self.get_responses().keys()
-        extra_outputs = self.workflow._rec_outputs
+        top = self.parent
+        while top.parent is not None:
+            top = top.parent
 
-        length = len(inp_values[0]) if inp_values else 0
-        cases = []
-        for i in range(length):
-            inputs = []
-            for j in range(len(inp_paths)):
-                inputs.append((inp_paths[j], inp_values[j][i]))
-            cases.append(_Case(i, inputs, outputs, extra_outputs,
-                               parent_uuid=self._case_uuid))
-        self.init_responses(length)
+        for recorder in top.recorders:
+            if hasattr(recorder, 'get_shard_info'):
+                info = recorder.get_shard_info(self)
+                if info is not None:
+                    self._shards.append((recorder, info))
+        self._shards_only = len(self._shards) == len(top.recorders)
 
-        self._iter = iter(cases)
-        self._abort_exc = None
+    def _shard_driver(self):
+        """ Return driver for the replicated model which records our cases
+        in shard files. """
+        workflow = self.workflow
+
+        inputs = []
+        recording = workflow._rec_parameters
+        for name, param in self.get_parameters().items():
+            if param in recording:
+                if isinstance(name, tuple):  # Use first target.
+                    name = name[0]
+                inputs.append(name)
+
+        recording = set(workflow._rec_responses)
+        outputs = [path for path in self.get_responses().keys()
+                        if path in recording]
+        itername = '%s.workflow.itername' % self.name
+        outputs.extend([path for path in workflow._rec_outputs
+                             if path != itername])
+
+        shards = [(info, self._remote_shard(i))
+                  for i, (recorder, info) in enumerate(self._shards)]
+
+        return _ShardDriver(shards, inputs, outputs,
+                            itername in workflow._rec_outputs,
+                            self._case_uuid)
 
     def _start(self):
         """ Start evaluating cases concurrently. """
@@ -374,18 +586,41 @@ class CaseIteratorDriver(Driver):
             msg = 'No servers supporting required resources %s' % resources
             self.raise_exception(msg, RuntimeError)
 
+        if self._servers and resources != self._pool_resources:
+            self._logger.debug('resources changed, releasing kept servers')
+            self._shutdown_servers()
+            self._servers = {}
+        self._pool_resources = resources
+
+        if self._server_lock is None:
+            self._server_lock = threading.Lock()
+            self._reply_q = Queue.Queue()
+
+        # Restart servers kept from the previous execution.
+        # Limits servers restarted if kept servers > cases.
+        kept = self._servers.values()
+        for server in kept:
+            try:
+                self._todo.append(self._read_case())
+            except StopIteration:
+                self._iter = None
+                break
+            if sys.platform == 'win32':  # pragma no cover
+                server.in_use = True  # Kicked-off with started servers.
+                server.state = _EMPTY
+            else:
+                self._restart_server(server)
+
         # Kick off initial wave of cases.
-        self._server_lock = threading.Lock()
-        self._reply_q = Queue.Queue()
         self._generation += 1
-        n_servers = 0
+        n_servers = len(kept)
         while n_servers < max_servers:
-            if not self._more_to_go():
+            if self._iter is None or not self._more_to_go():
                 break
 
             # Get next case. Limits servers started if max_servers > cases.
             try:
-                case = self._iter.next()
+                case = self._read_case()
             except StopIteration:
                 if not self._rerun:
                     self._iter = None
@@ -399,6 +634,9 @@ class CaseIteratorDriver(Driver):
             self._logger.debug('starting worker for %r', name)
             server = self._servers[name] = _ServerData(name)
             server.in_use = True
+            if self._shards:
+                server.shard = len(self._shard_files)
+                self._shard_files.append(None)
             server_thread = threading.Thread(target=self._service_loop,
                                              args=(name, resources,
                                                    credentials, self._reply_q))
@@ -419,18 +657,24 @@ class CaseIteratorDriver(Driver):
                     except Queue.Empty:
                         break  # Timeout.
                     else:
+                        sdata = self._servers.get(name)
+                        # Difficult to force a late reply from a discarded
+                        # server.
+                        if sdata is None:  # pragma no cover
+                            continue
                         # Difficult to force startup failure.
-                        if server.server is None:  # pragma nocover
+                        if sdata.server is None:  # pragma nocover
                             self._logger.debug('server startup failed for %r',
                                                name)
-                            server.in_use = False
+                            sdata.in_use = False
                         else:
-                            server.in_use = self._server_ready(server)
+                            sdata.in_use = self._server_ready(sdata)
+                            self._resume_servers()
 
         if sys.platform == 'win32':  # pragma no cover
             # Don't start server processing until all servers are started,
             # otherwise we have egg removal issues.
-            for i in self._servers:
+            for i in range(len(self._servers) - len(kept)):
                 name, result, exc = self._reply_q.get()
                 server = self._servers[name]
                 if server.server is None:
@@ -444,7 +688,9 @@ class CaseIteratorDriver(Driver):
 
         # Continue until no servers are busy.
         while self._busy():
-            if self._more_to_go():
+            if self._paused():
+                timeout = _PAUSE_TIMEOUT
+            elif self._more_to_go():
                 timeout = None
             else:
                 # Don't wait indefinitely for a server we don't need.
@@ -455,6 +701,9 @@ class CaseIteratorDriver(Driver):
                 name, result, exc = self._reply_q.get(timeout=timeout)
             # Hard to force worker to hang, which is handled here.
             except Queue.Empty:  # pragma no cover
+                if self._paused():
+                    self._resume_servers()
+                    continue
                 msgs = []
                 for name, server in self._servers.items():
                     if server.in_use:
@@ -473,24 +722,58 @@ class CaseIteratorDriver(Driver):
                     for msg in msgs:
                         self._logger.error('    %s', msg)
             else:
-                server = self._servers[name]
+                server = self._servers.get(name)
+                # Difficult to force a late reply from a discarded server.
+                if server is None:  # pragma no cover
+                    continue
                 server.in_use = self._server_ready(server)
+                self._resume_servers()
 
-        # Shut-down (started) servers.
+        if self._keep:
+            # Keep started servers for the next execution.
+            for name, server in self._servers.items():
+                if server.queue is None:
+                    del self._servers[name]
+        else:
+            self._shutdown_servers()
+
+        if self._shards:
+            self._record_shards()
+
+    def _restart_server(self, server):
+        """ Start processing with a server kept from a previous execution. """
+        self._logger.debug('restarting %r', server.name)
+        server.in_use = True
+        server.case = server.batch = server.results = None
+        server.load_failures = 0
+        if self.reload_model or server.top is None or \
+           server.info['egg_file'] is not self._egg_file:
+            self._load_model(server)
+        else:
+            server.exception = None
+            server.queue.put((self._remote_update_model, server))
+        server.state = _LOADING
+
+    def _shutdown_servers(self):
+        """ Shut-down (started) servers. """
         self._logger.debug('Shut-down (started) servers')
         n_queues = 0
         for server in self._servers.values():
             if server.queue is not None:
                 server.queue.put(None)
                 n_queues += 1
-        for i in range(n_queues):
+        while n_queues > 0:
             try:
                 name, status, exc = self._reply_q.get(True, 60)
             # Hard to force worker to hang, which is handled here.
             except Queue.Empty:  # pragma no cover
                 pass
             else:
-                self._servers[name].queue = None
+                server = self._servers.get(name)
+                if server is None:  # Late reply from an abandoned server.
+                    continue
+                server.queue = None
+            n_queues -= 1
         # Hard to force worker to hang, which is handled here.
         for server in self._servers.values():  # pragma no cover
             if server.queue is not None:
@@ -504,6 +787,23 @@ class CaseIteratorDriver(Driver):
                 return True
         return False
 
+    def release_servers(self):
+        """
+        Release servers kept for the next execution due to `keep_servers`,
+        and remove the egg file of the replicated model.
+        """
+        if self._servers:
+            self._shutdown_servers()
+        self._servers = {}
+        self._reply_q = None
+        self._server_lock = None
+        self._remove_egg()
+
+    def pre_delete(self):
+        """ Release kept servers before the model is deleted. """
+        super(CaseIteratorDriver, self).pre_delete()
+        self.release_servers()
+
     def _cleanup(self):
         """
         Cleanup internal state, and egg file if necessary.
@@ -511,16 +811,30 @@ class CaseIteratorDriver(Driver):
               for workers which haven't shut down by now.
         """
         self._iter = None
-        self._reply_q = None
-        self._server_lock = None
-        self._servers = {}
+        if self._keep and self._busy():  # Abnormal exit.
+            self._shutdown_servers()
+            self._keep = False
+        if not self._keep:
+            self._reply_q = None
+            self._server_lock = None
+            self._servers = {}
+            self._remove_egg()
         self._seq_server.top = None  # Avoid leak.
         self._todo = []
         self._rerun = []
+        self._shards = []
+        self._shards_only = False
+        self._shard_files = []
+        self._shard_cases = []
 
+    def _remove_egg(self):
+        """ Remove egg file of the replicated model. """
         if self._egg_file and os.path.exists(self._egg_file):
             os.remove(self._egg_file)
             self._egg_file = None
+        self._egg_signature = None
+        self._egg_fixed = None
+        self._egg_inputs = None
 
     def _server_ready(self, server):
         """
@@ -536,7 +850,7 @@ class CaseIteratorDriver(Driver):
             if server.exception is None:
                 in_use = self._start_next_case(server)
             else:
-                exc, tback = server.exception
+                exc = server.exception[1]
                 self._logger.debug('    exception while loading: %r', exc)
                 if self.error_policy == 'ABORT':
                     if self._abort_exc is None:
@@ -554,32 +868,19 @@ class CaseIteratorDriver(Driver):
                         in_use = False
 
         elif state == _EXECUTING:
-            case = server.case
-            server.case = None
-            if server.exception is None:
-                # Grab the results from the model and record.
-                try:
-                    self._record_case(server.top, case)
-                except Exception as exc:
-                    msg = 'Exception recording case: %s' % exc
-                    self._logger.debug('    %s', msg)
-                    self._logger.debug('%s', case)
-                    case.msg = '%s: %s' % (self.get_pathname(), msg)
-            else:
-                self._logger.debug('    exception while executing: %r', server.exception[1])
-                case.exc = server.exception
+            if self.load_balancing and server.name is not None:
+                self._update_time(server)
 
-            if case.exc is not None:
-                if self.error_policy == 'ABORT':
-                    if self._abort_exc is None:
-                        self._abort_exc = case.exc
-                    self._stop = True
-                elif case.retries < self.max_retries:
-                    case.exc = None
-                    case.retries += 1
-                    self._rerun.append(case)
-                else:
-                    self._logger.error('Too many retries for %s', case)
+            if server.batch is None:
+                case = server.case
+                server.case = None
+                self._case_done(server, case)
+            else:
+                cases = server.batch
+                results = server.results or [None] * len(cases)
+                server.batch = server.results = None
+                for case, result in zip(cases, results):
+                    self._case_done(server, case, result)
 
             # Set up for next case.
             in_use = self._start_processing(server, reload=True)
@@ -614,6 +915,62 @@ class CaseIteratorDriver(Driver):
 
         return in_use
 
+    def _case_done(self, server, case, result=None):
+        """
+        Record results of `case` evaluated by `server`, or handle its
+        failure. `result` is from :meth:`_BatchDriver.execute` if `case`
+        was evaluated as part of a batch.
+        """
+        twin = case.twin
+        if twin is not None:
+            if twin.done:
+                self._logger.debug('    discard result, twin already done')
+                return
+            case.twin = twin.twin = None
+            if server.exception is not None or \
+               (result is not None and result[0] is not None):
+                # Leave any error handling to the twin still running.
+                self._logger.debug('    twin failed, other still running')
+                return
+            self._abandon(twin)
+
+        if server.exception is not None:
+            self._logger.debug('    exception while executing: %r', server.exception[1])
+            case.exc = server.exception
+        elif result is not None and result[0] is not None:
+            case.exc = _exc_info(result[0])
+            self._logger.debug('    exception while executing: %r', case.exc[1])
+        else:
+            # Grab the results from the model and record.
+            try:
+                if result is None:
+                    self._record_case(server.top, case)
+                else:
+                    outputs, exc, extra, extra_exc = result[1:]
+                    self._record_results(case, outputs, _exc_info(exc),
+                                         extra, _exc_info(extra_exc))
+            except Exception as exc:
+                msg = 'Exception recording case: %s' % exc
+                self._logger.debug('    %s', msg)
+                self._logger.debug('%s', case)
+                case.msg = '%s: %s' % (self.get_pathname(), msg)
+            if server.shard is not None:  # Recorded by the server.
+                self._shard_cases.append((server.shard, case.uuid))
+
+        if case.exc is not None:
+            if self.error_policy == 'ABORT':
+                if self._abort_exc is None:
+                    self._abort_exc = case.exc
+                self._stop = True
+            elif case.retries < self.max_retries:
+                case.exc = None
+                case.retries += 1
+                self._rerun.append(case)
+            else:
+                self._logger.error('Too many retries for %s', case)
+        else:
+            case.done = True
+
     def _more_to_go(self):
         """ Return True if there's more work to do. """
         if self._stop:
@@ -629,7 +986,7 @@ class CaseIteratorDriver(Driver):
         If there's something to do, start processing by either loading
         the model, or going straight to running it.
         """
-        if self._more_to_go():
+        if self._more_to_go() or self._find_straggler(server) is not None:
             if server.name is None:
                 in_use = self._start_next_case(server)
             elif reload:
@@ -652,31 +1009,195 @@ class CaseIteratorDriver(Driver):
         return in_use
 
     def _start_next_case(self, server):
-        """ Look for the next case and start it. """
+        """ Look for the next case(s) and start them. """
+        balance = self.load_balancing and server.name is not None
+        if balance and self._hold(server):
+            self._logger.debug('    hold')
+            server.state = _PAUSED
+            return True
+
+        if server.name is not None and self.cases_per_dispatch > 1:
+            cases = []
+            while len(cases) < self.cases_per_dispatch:
+                case = self._next_case()
+                if case is None:
+                    break
+                cases.append(case)
+            if cases:
+                return self._run_batch(cases, server)
+        else:
+            case = self._next_case()
+            if case is not None:
+                return self._run_case(case, server)
+
+        if balance:
+            case = self._find_straggler(server)
+            if case is not None:
+                self._logger.debug('    rerun straggler')
+                twin = copy.copy(case)
+                twin.twin = case
+                twin.done = False
+                case.twin = twin
+                return self._run_case(twin, server)
+
+        self._logger.debug('    no more cases')
+        return False
+
+    def _hold(self, server):
+        """
+        Return True if `server` should wait rather than start another case,
+        either because its host is overloaded or because faster servers are
+        expected to finish all remaining cases before it could.
+        """
+        left = self._cases_left()
+        if not left or not self._more_to_go():
+            return False
+
+        others = [sdata for sdata in self._servers.values()
+                  if sdata is not server and sdata.in_use
+                     and sdata.state == _EXECUTING]
+        if not others:
+            return False  # Someone has to make progress.
+
+        if self._overloaded(server):
+            return True
+
+        if server.avg_time is None:
+            return False
+
+        # Count cases other servers would complete before this one could.
+        now = time.time()
+        faster = 0
+        for sdata in others:
+            if sdata.avg_time is None or sdata.avg_time <= 0.:
+                continue  # No useful timing yet.
+            n_cases = 1 if sdata.batch is None else len(sdata.batch)
+            busy = max(sdata.started + sdata.avg_time * n_cases - now, 0.)
+            if busy < server.avg_time:
+                faster += int((server.avg_time - busy) / sdata.avg_time)
+        return faster >= left
+
+    def _overloaded(self, server):
+        """
+        Return True if the host of `server` was overloaded when last checked.
+        The check is only made every `_LOAD_CHECK_INTERVAL` seconds.
+        """
+        now = time.time()
+        if now - server.load_checked >= _LOAD_CHECK_INTERVAL:
+            server.load_checked = now
+            try:
+                server.overloaded = not RAM.check_load(server.server)
+            except Exception as exc:
+                self._logger.warning("Can't check load for %r: %r",
+                                     server.name, exc)
+                server.overloaded = False
+            if server.overloaded:
+                self._logger.debug('    %r host overloaded', server.name)
+        return server.overloaded
+
+    def _find_straggler(self, server):
+        """
+        Return the case expected to finish last in another server if `server`
+        could finish it sooner, else None. Only single cases without a twin
+        are considered, and only if nothing else remains to be done.
+        """
+        if not self.load_balancing or server.name is None or \
+           server.avg_time is None or self.cases_per_dispatch > 1 or \
+           self._shards or self._stop or self._todo or self._rerun or \
+           self._iter is not None:
+            return None
+
+        times = [sdata.avg_time for sdata in self._servers.values()
+                 if sdata.avg_time is not None]
+        default_time = sum(times) / len(times)
+
+        now = time.time()
+        straggler = None
+        longest = server.avg_time
+        for sdata in self._servers.values():
+            if sdata is server or not sdata.in_use or \
+               sdata.state != _EXECUTING or sdata.case is None or \
+               sdata.case.twin is not None:
+                continue
+            elapsed = now - sdata.started
+            avg_time = sdata.avg_time or default_time
+            remaining = avg_time - elapsed
+            if remaining <= 0:
+                remaining = elapsed  # Overdue, guess it takes twice as long.
+            if remaining > longest:
+                straggler = sdata.case
+                longest = remaining
+        return straggler
+
+    def _abandon(self, case):
+        """
+        Stop waiting for the server evaluating `case`, the twin of a case
+        which has completed. The server is released once it is done.
+        """
+        for name, server in self._servers.items():
+            if server.case is case:
+                self._logger.debug('abandon %r', name)
+                with self._server_lock:
+                    del self._servers[name]
+                server.queue.put(None)
+                break
+
+    def _update_time(self, server):
+        """ Update average time per case for `server`. """
+        n_cases = 1 if server.batch is None else len(server.batch)
+        elapsed = (time.time() - server.started) / n_cases
+        if server.avg_time is None:
+            server.avg_time = elapsed
+        else:
+            server.avg_time += _TIME_WEIGHT * (elapsed - server.avg_time)
+
+    def _resume_servers(self):
+        """ Reconsider starting cases in paused servers. """
+        for server in self._servers.values():
+            if server.in_use and server.state == _PAUSED:
+                if self._more_to_go() or \
+                   self._find_straggler(server) is not None:
+                    server.in_use = self._start_next_case(server)
+                else:
+                    self._logger.debug('%r no more cases', server.name)
+                    server.state = _EMPTY
+                    server.in_use = False
+
+    def _paused(self):
+        """ Return True if any server in use is paused. """
+        for server in self._servers.values():
+            if server.in_use and server.state == _PAUSED:
+                return True
+        return False
 
+    def _next_case(self):
+        """ Return the next case to run, or None if there are no more. """
         if self._todo:
             self._logger.debug('    run startup case')
-            case = self._todo.pop(0)
-            in_use = self._run_case(case, server)
+            return self._todo.pop(0)
         elif self._rerun:
             self._logger.debug('    rerun case')
-            case = self._rerun.pop(0)
-            in_use = self._run_case(case, server)
+            return self._rerun.pop(0)
         elif self._iter is None:
-            self._logger.debug('    no more cases')
-            in_use = False
-        else:
-            try:
-                case = self._iter.next()
-            except StopIteration:
-                self._logger.debug('    no more cases')
-                self._iter = None
-                in_use = False
-            else:
-                self._logger.debug('    run next case')
-                in_use = self._run_case(case, server)
+            return None
 
-        return in_use
+        try:
+            case = self._read_case()
+        except StopIteration:
+            self._iter = None
+            return None
+        self._logger.debug('    run next case')
+        return case
+
+    def _read_case(self):
+        """ Return the next case from `_iter`. """
+        case = self._iter.next()
+        self._unread -= 1
+        return case
+
+    def _cases_left(self):
+        """ Return the number of cases not yet started. """
+        return len(self._todo) + len(self._rerun) + self._unread
 
     def _run_case(self, case, server):
         """ Setup and start a case. Returns True if started. """
@@ -692,22 +1213,56 @@ class CaseIteratorDriver(Driver):
             case.exc = sys.exc_info()
             msg = 'Exception setting case inputs: %s' % case.exc
             self._logger.debug('    %s', msg)
+            if case.twin is not None:  # Original is still running.
+                case.twin.twin = None
+                case.twin = None
+                server.state = _EMPTY
+                return False
             if case.retries < self.max_retries:
                 case.retries += 1
                 self._rerun.append(case)
             return self._start_processing(server)
 
         server.case = case
+        server.started = time.time()
         self._model_execute(server)
         server.state = _EXECUTING
         return True
 
+    def _run_batch(self, cases, server):
+        """ Start a batch of cases in a remote server. Returns True. """
+        for case in cases:
+            case.exc = None
+            case.uuid = _Case.next_uuid()
+            case.parent_uuid = self._case_uuid
+
+        server.batch = cases
+        server.results = None
+        server.exception = None
+        server.started = time.time()
+        server.queue.put((self._remote_batch_execute, server))
+        server.state = _EXECUTING
+        return True
+
     def _record_case(self, scope, case):
         """
         Record case data from `scope` in ``case_outputs``.
         Also sends case data to recorders.
         """
         case_outputs, exc = case.fetch_outputs(scope)
+        if self.workflow._rec_required and not self._shards_only:
+            itername = '%s.workflow.itername' % self.name
+            extra, extra_exc = case.fetch_outputs(scope, extra=True,
+                                                  itername=itername)
+        else:
+            extra, extra_exc = [], None
+        self._record_results(case, case_outputs, exc, extra, extra_exc)
+
+    def _record_results(self, case, case_outputs, exc, extra, extra_exc):
+        """
+        Record `case_outputs` of `case` in ``case_outputs``.
+        Also sends case data, including `extra` outputs, to recorders.
+        """
         if exc is None and case.exc is None:
             index = case.index
             for path, value in case_outputs:
@@ -717,9 +1272,10 @@ class CaseIteratorDriver(Driver):
                 self.set('case_outputs.'+path, value,
                          index=(index,), force=True)
 
-        # Record workflow data in recorders.
+        # Record workflow data in recorders not recording in shard files.
         workflow = self.workflow
-        if workflow._rec_required:
+        sharded = [recorder for recorder, info in self._shards]
+        if workflow._rec_required and not self._shards_only:
             inputs = []
             recording = workflow._rec_parameters
             for name, param in self.get_parameters().items():
@@ -736,27 +1292,26 @@ class CaseIteratorDriver(Driver):
                         value = value.copy()
                     outputs.append(value)
 
-            itername = '%s.workflow.itername' % self.name
-            extra, extra_exc = case.fetch_outputs(scope, extra=True,
-                                                  itername=itername)
             for path, value in extra:
                 if self.sequential and isinstance(value, VariableTree):
                     value = value.copy()
                 outputs.append(value)
 
+            itername = '%s.workflow.itername' % self.name
             if itername in workflow._rec_outputs:
                 if self.itername:
                     outputs.append('%s.%s' % (self.itername, case.index+1))
                 else:
                     outputs.append('%s' % (case.index+1))
 
-            top = scope
+            top = self.parent
             while top.parent:
                 top = top.parent
             for recorder in top.recorders:
-                recorder.record(self, inputs, outputs,
-                                case.exc or exc or extra_exc,
-                                case.uuid, self._case_uuid)
+                if recorder not in sharded:
+                    recorder.record(self, inputs, outputs,
+                                    case.exc or exc or extra_exc,
+                                    case.uuid, self._case_uuid)
 
     def _service_loop(self, name, resource_desc, credentials, reply_q):
         """ Each server has an associated thread executing this. """
@@ -802,6 +1357,9 @@ class CaseIteratorDriver(Driver):
                 else:
                     req_exc = None
                 reply_q.put((name, result, req_exc))
+
+            if sdata.shard is not None:
+                self._fetch_shards(sdata)
         except Exception as exc:  # pragma no cover
             # This can easily happen if we take a long time to allocate and
             # we get 'cleaned-up' before we get started.
@@ -812,6 +1370,58 @@ class CaseIteratorDriver(Driver):
             RAM.release(server)
             reply_q.put((name, True, None))  # ACK shutdown.
 
+    def _fetch_shards(self, server):
+        """ Flush the shard files in `server` and copy them here. """
+        if server.top is None:
+            return  # Nothing recorded.
+        try:
+            # Shard files are written in the directory of the loaded model.
+            directory = server.top.get_abs_directory()
+            server.top.pre_delete()
+        except Exception as exc:
+            self._logger.error('%r: flushing shard files failed: %r',
+                               server.name, exc)
+            directory = ''
+
+        shard_name = self.get_pathname() + server.name[len(self.name):]
+        files = []
+        for i, (recorder, info) in enumerate(self._shards):
+            root, ext = os.path.splitext(info['path'])
+            remote = os.path.join(directory, self._remote_shard(i))
+            local = '%s-%s%s' % (root, shard_name, ext)
+            try:
+                filexfer(server.server, remote, None, local, 'b')
+            except Exception as exc:
+                self._logger.error('%r: copying shard file %r failed: %r',
+                                   server.name, remote, exc)
+                local = None
+            files.append(local)
+        self._shard_files[server.shard] = files
+
+    def _remote_shard(self, i):
+        """ Return name of shard file in a server for sharded recorder `i`. """
+        ext = os.path.splitext(self._shards[i][1]['path'])[1]
+        return '%s-shard%d%s' % (self.name, i, ext)
+
+    def _record_shards(self):
+        """ Record where our cases are in each sharded recorder. """
+        for i, (recorder, info) in enumerate(self._shards):
+            files = []
+            file_index = {}
+            for shard, shard_files in enumerate(self._shard_files):
+                if shard_files and shard_files[i]:
+                    file_index[shard] = len(files)
+                    files.append(shard_files[i])
+
+            cases = []
+            for shard, case_uuid in self._shard_cases:
+                if shard in file_index:
+                    cases.append((file_index[shard], case_uuid))
+                else:
+                    self._logger.error('Recording of case %s lost', case_uuid)
+
+            recorder.record_shards(self, files, cases, self._case_uuid)
+
     def _load_model(self, server):
         """ Load a model into a server. """
         server.exception = None
@@ -845,6 +1455,18 @@ class CaseIteratorDriver(Driver):
             server.exception = sys.exc_info()
         else:
             server.top = tlo
+            if self._patch:
+                self._remote_update_model(server)
+
+    def _remote_update_model(self, server):
+        """ Set inputs changed since the model was replicated. """
+        try:
+            for path, value in self._patch:
+                server.top.set(path, value)
+        except Exception as exc:
+            self._logger.error('server %r update of %r failed: %r',
+                               server.name, path, exc)
+            server.exception = sys.exc_info()
 
     def _model_execute(self, server):
         """ Execute model in server. """
@@ -871,3 +1493,208 @@ class CaseIteratorDriver(Driver):
                                ' PID %d on %s: %r',
                                server.info['name'], server.info['pid'],
                                server.info['host'], exc)
+
+    def _remote_batch_execute(self, server):
+        """ Execute batch of cases in remote server. """
+        cases = server.batch
+        names = list(cases[0]._inputs)
+        if self.workflow._rec_required and not self._shards_only:
+            extra_outputs = cases[0]._extra_outputs
+        else:
+            extra_outputs = []
+        batch = dict(itername=self.get_itername(),
+                     inputs=names,
+                     outputs=cases[0]._outputs,
+                     extra_outputs=extra_outputs,
+                     skip='%s.workflow.itername' % self.name,
+                     cases=[(case.index, case.uuid,
+                             [case._inputs[name] for name in names])
+                            for case in cases])
+        try:
+            server.top.set('driver.batch', batch)
+            server.top.run()
+            server.results = server.top.get('driver.results')
+        except Exception as exc:
+            server.exception = sys.exc_info()
+            self._logger.error('Caught exception from server %r,'
+                               ' PID %d on %s: %r',
+                               server.info['name'], server.info['pid'],
+                               server.info['host'], exc)
+
+
+class _BatchDriver(Driver):
+    """
+    Runs the workflow of a model replicated for concurrent evaluation by a
+    :class:`CaseIteratorDriver`. If `batch` is set, the workflow is run for
+    each case in it, and `results` is set to a list of
+    ``(error, outputs, exc, extra, extra_exc)`` for each case.
+    Otherwise the workflow is run once.
+    """
+
+    batch = Dict(iotype='in', desc='Cases to be evaluated.')
+
+    results = List(iotype='out', desc='Results of evaluating batch.')
+
+    def execute(self):
+        """ Run workflow once, or for each case in `batch`. """
+        if not self.batch:
+            super(_BatchDriver, self).execute()
+            self.case_done(self._case_uuid)
+            return
+
+        batch = self.batch
+        scope = self.parent
+        results = []
+        for index, case_uuid, values in batch['cases']:
+            case = _Case(index, zip(batch['inputs'], values), batch['outputs'],
+                         batch['extra_outputs'], case_uuid)
+            try:
+                case.apply_inputs(scope)
+                scope.set_itername(batch['itername'], index+1)
+                self.workflow.reset()
+                self.workflow.run(case_uuid=case_uuid)
+            except Exception:
+                results.append((_remote_error(sys.exc_info()),
+                                None, None, None, None))
+                continue
+
+            self.case_done(case_uuid)
+            outputs, exc = case.fetch_outputs(scope)
+            extra, extra_exc = case.fetch_outputs(scope, extra=True,
+                                                  itername=batch['skip'])
+            results.append((None, _copy_values(outputs), _remote_error(exc),
+                            _copy_values(extra), _remote_error(extra_exc)))
+        self.results = results
+
+    def case_done(self, case_uuid):
+        """ Called after each successful run of the workflow. """
+        pass
+
+
+class _ShardDriver(_BatchDriver):
+    """
+    A :class:`_BatchDriver` which records each case in shard files local
+    to the server. Shard files are flushed when the model is deleted.
+    """
+
+    def __init__(self, shards, inputs, outputs, itername, parent_uuid):
+        super(_ShardDriver, self).__init__()
+        self._shards = shards  # List of (shard info, filename).
+        self._rec_inputs = inputs
+        self._rec_outputs = outputs
+        self._rec_itername = itername  # True if recording 'itername'.
+        self._shard_parent = parent_uuid
+
+    def case_done(self, case_uuid):
+        """ Record the case. """
+        scope = self.parent
+        case = _Case(0, [], self._rec_inputs + self._rec_outputs, None)
+        data, exc = case.fetch_outputs(scope)
+        values = [value for name, value in data]
+        inputs = values[:len(self._rec_inputs)]
+        outputs = values[len(self._rec_inputs):]
+
+        if self._rec_itername:
+            count = self.workflow._exec_count
+            if self.itername:
+                outputs.append('%s.%s' % (self.itername, count))
+            else:
+                outputs.append('%s' % count)
+
+        for shard, filename in self._shards:
+            recorder = _SHARD_RECORDERS.get(filename)
+            if recorder is None:
+                recorder = _shard_recorder(shard, filename)
+            recorder.record(shard['driver_id'], inputs, outputs, exc,
+                            case_uuid, self._shard_parent)
+
+    def pre_delete(self):
+        """ Flush shard files before the model is deleted. """
+        super(_ShardDriver, self).pre_delete()
+        for recorder in _SHARD_RECORDERS.values():
+            if hasattr(recorder, 'flush'):
+                recorder.flush()
+
+
+def _copy_values(data):
+    """ Return list of ``(name, value)`` `data` with variable trees copied,
+    so they can be returned from a server. """
+    return [(name, value.copy() if isinstance(value, VariableTree) else value)
+            for name, value in data]
+
+
+def _remote_error(exc):
+    """ Return ``sys.exc_info()`` tuple `exc` as a :class:`RemoteError`,
+    as if raised by a method called in a server. """
+    if exc is None:
+        return None
+    return RemoteError(traceback_str(exc))
+
+
+def _exc_info(exc):
+    """ Return ``sys.exc_info()`` tuple for exception `exc` returned from a
+    server, as if it had been raised here by a method call. """
+    if exc is None:
+        return None
+    try:
+        raise exc
+    except Exception:
+        return sys.exc_info()
+
+
+def _assembly_inputs(assembly, prefix, inputs):
+    """ Add unconnected inputs of components within `assembly` to `inputs`,
+    keyed by path starting with `prefix`. """
+    graph = assembly._depgraph
+    for name in assembly.list_components():
+        for path in graph.list_inputs(name, connected=False):
+            inputs[prefix+path] = _model_value(assembly, path)
+        comp = getattr(assembly, name)
+        if isinstance(comp, Assembly):
+            _assembly_inputs(comp, prefix+name+'.', inputs)
+
+
+def _model_value(scope, path):
+    """ Return a copy of the value of `path` in `scope`. """
+    try:
+        value = scope.get(path)
+        if isinstance(value, (ndarray, VariableTree)):
+            return value.copy()
+        return copy.deepcopy(value)
+    except Exception:
+        return _UNKNOWN
+
+
+def _same_value(value, other):
+    """ Return True if `value` is known to be the same as `other`. """
+    if value is _UNKNOWN or other is _UNKNOWN:
+        return False
+    if isinstance(value, ndarray) or isinstance(other, ndarray):
+        return isinstance(value, ndarray) and isinstance(other, ndarray) and \
+               value.dtype == other.dtype and array_equal(value, other)
+    if isinstance(value, VariableTree):
+        if type(other) is not type(value):
+            return False
+        items = dict(value.items())
+        other_items = dict(other.items())
+        if sorted(items) != sorted(other_items):
+            return False
+        for name, val in items.items():
+            if not _same_value(val, other_items[name]):
+                return False
+        return True
+    try:
+        return bool(value == other)
+    except Exception:
+        return False
+
+
+def _shard_recorder(shard, filename):
+    """ Return a new recorder writing shard `filename`, as described by
+    `shard` from :meth:`get_shard_info` of the recorder for the run. """
+    module_name, class_name = shard['recorder']
+    module = __import__(module_name, fromlist=[class_name])
+    recorder = getattr(module, class_name)(filename, **shard['options'])
+    recorder.start_shard(shard)
+    _SHARD_RECORDERS[filename] = recorder
+    return recorder
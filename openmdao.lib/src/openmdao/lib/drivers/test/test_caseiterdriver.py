@@ -2,6 +2,7 @@
 Test CaseIteratorDriver.
 """
 
+import glob
 import logging
 import os
 import pkg_resources
@@ -15,6 +16,8 @@ import nose
 import random
 import numpy.random as numpy_random
 
+from multiprocessing.managers import RemoteError
+
 from math import isnan
 from numpy import asarray, linspace, mean
 
@@ -23,9 +26,13 @@ from openmdao.main.eggchecker import check_save_load
 
 from openmdao.main.datatypes.api import Float, Bool, Array, Int, Str, \
                                         List, VarTree
-from openmdao.lib.casehandlers.api import ListCaseRecorder
+from openmdao.lib.casehandlers.api import CaseDataset, JSONCaseRecorder, \
+                                          ListCaseRecorder
 from openmdao.lib.drivers.api import CaseIteratorDriver, SimpleCaseIterDriver, \
                                      SLSQPdriver
+from openmdao.lib.drivers.caseiterdriver import _BatchDriver, _Case, \
+                                               _ServerData, _EXECUTING, \
+                                               _LOADING
 
 from openmdao.main.case import Case, CaseTreeNode
 
@@ -230,6 +237,167 @@ class TestCase(unittest.TestCase):
         self.run_cases(sequential=False, forced_errors=True, retry=False)
         self.run_cases(sequential=False, forced_errors=True, retry=True)
 
+    def test_batches(self):
+        logging.debug('')
+        logging.debug('test_batches')
+        init_cluster(encrypted=True, allow_shell=True)
+        self.model.driver.cases_per_dispatch = 3
+        self.generate_cases(force_errors=True)
+        self.run_cases(sequential=False, forced_errors=True, retry=False)
+        self.run_cases(sequential=False, forced_errors=True, retry=True)
+
+    def test_batch_driver(self):
+        logging.debug('')
+        logging.debug('test_batch_driver')
+
+        # Driver used in servers to evaluate batches of cases.
+        top = set_as_top(Assembly())
+        top.add('driver', _BatchDriver())
+        top.add('driven', DrivenComponent())
+        top.driver.workflow.add('driven')
+
+        xs = [numpy_random.normal(size=4) for i in range(3)]
+        top.driver.batch = dict(
+            itername='3-driver',
+            inputs=['driven.x', 'driven.raise_error'],
+            outputs=['driven.rosen_suzuki'],
+            extra_outputs=['driven.sum_y', 'cid.workflow.itername'],
+            skip='cid.workflow.itername',
+            cases=[(i, 'uuid-%d' % i, [xs[i], i == 1]) for i in range(3)])
+        top.run()
+
+        results = top.driver.results
+        self.assertEqual(len(results), 3)
+        for i in (0, 2):
+            error, outputs, exc, extra, extra_exc = results[i]
+            self.assertEqual(error, None)
+            self.assertEqual(outputs,
+                             [('driven.rosen_suzuki', rosen_suzuki(xs[i]))])
+            self.assertEqual(exc, None)
+            self.assertEqual(extra, [('driven.sum_y', 4.)])
+            self.assertEqual(extra_exc, None)
+        self.assertEqual(top.driven.get_itername(), '3-driver.3-driven')
+
+        error = results[1][0]
+        self.assertTrue(isinstance(error, RemoteError))
+        self.assertTrue('driven (3-driver.2-driven): Forced error'
+                        in str(error))
+
+    def test_keep_servers(self):
+        logging.debug('')
+        logging.debug('test_keep_servers')
+        init_cluster(encrypted=True, allow_shell=True)
+        driver = self.model.driver
+        driver.keep_servers = True
+        driver.reload_model = False
+        self.run_cases(sequential=False)
+        servers = set(driver._servers)
+        self.assertTrue(servers)
+
+        # New cases are run by the kept servers, without a new replicant.
+        self.generate_cases(force_errors=True)
+        self.run_cases(sequential=False, forced_errors=True)
+        self.assertEqual(driver._replicants, 1)
+        self.assertTrue(servers.issubset(driver._servers))
+
+        driver.release_servers()
+        self.assertEqual(driver._servers, {})
+
+    def test_model_patch(self):
+        logging.debug('')
+        logging.debug('test_model_patch')
+
+        # Changed unconnected inputs are sent to kept models.
+        driver = self.model.driver
+        signature, fixed, inputs = driver._model_state()
+        driver._egg_fixed, driver._egg_inputs = fixed, inputs
+        self.model.driven.sleep = 0.5
+        new_signature, fixed, inputs = driver._model_state()
+        self.assertEqual(new_signature, signature)
+        self.assertEqual(driver._model_patch(fixed, inputs),
+                         [('driven.sleep', 0.5)])
+
+        # Changed values from outside the workflow need a new replicant.
+        self.model.add('source', DrivenComponent())
+        self.model.connect('source.sum_y', 'driven.sleep')
+        new_signature, fixed, inputs = driver._model_state()
+        self.assertNotEqual(new_signature, signature)
+        driver._egg_fixed, driver._egg_inputs = fixed, inputs
+        self.assertEqual(driver._model_patch(fixed, inputs), [])
+        self.model.source.sum_y = 1.
+        signature, fixed, inputs = driver._model_state()
+        self.assertEqual(driver._model_patch(fixed, inputs), None)
+
+    def test_load_balancing(self):
+        logging.debug('')
+        logging.debug('test_load_balancing')
+
+        driver = self.model.driver
+        driver.load_balancing = True
+        fast = _ServerData('fast')
+        slow = _ServerData('slow')
+        for server, avg_time in ((fast, 1.), (slow, 10.)):
+            server.in_use = True
+            server.state = _EXECUTING
+            server.avg_time = avg_time
+            server.started = time.time()
+        driver._servers = dict(fast=fast, slow=slow)
+
+        # Last cases are held for a faster server.
+        slow.state = _LOADING
+        driver._todo = [_Case(i, [], None, None) for i in range(5)]
+        self.assertTrue(driver._hold(slow))
+        driver._todo = [_Case(i, [], None, None) for i in range(10)]
+        self.assertFalse(driver._hold(slow))
+
+        # A server without useful timing isn't counted.
+        driver._todo = [_Case(i, [], None, None) for i in range(5)]
+        fast.avg_time = 0.
+        self.assertFalse(driver._hold(slow))
+        fast.avg_time = 1.
+
+        # Nothing is sent to an overloaded host.
+        slow.load_checked = time.time()
+        slow.overloaded = True
+        self.assertTrue(driver._hold(slow))
+
+        # Unless nothing else is running.
+        fast.state = _LOADING
+        self.assertFalse(driver._hold(slow))
+
+        # An idle fast server reruns a case still running in a slow server.
+        driver._todo = []
+        slow.state = _EXECUTING
+        case = slow.case = _Case(0, [], None, None)
+        self.assertEqual(driver._find_straggler(fast), case)
+        self.assertEqual(driver._find_straggler(slow), None)
+
+        # But only once.
+        twin = fast.case = _Case(0, [], None, None)
+        case.twin = twin
+        twin.twin = case
+        self.assertEqual(driver._find_straggler(fast), None)
+
+        # A failed evaluation is left to its twin.
+        try:
+            raise RuntimeError('slow failed')
+        except RuntimeError:
+            slow.exception = sys.exc_info()
+        driver._case_done(slow, case)
+        self.assertEqual(case.twin, None)
+        self.assertEqual(twin.twin, None)
+        self.assertEqual(driver._rerun, [])
+
+        # Results of a twin which completed second are discarded.
+        case.twin = twin
+        twin.twin = case
+        twin.done = True
+        driver._case_done(slow, case)
+        self.assertEqual(case.exc, None)
+        self.assertFalse(case.done)
+
+        driver._servers = {}
+
     def test_unencrypted(self):
         logging.debug('')
         logging.debug('test_unencrypted')
@@ -237,6 +405,27 @@ class TestCase(unittest.TestCase):
         self.model.driver.extra_resources = {'allocator': name}
         self.run_cases(sequential=False)
 
+    def test_shards(self):
+        logging.debug('')
+        logging.debug('test_shards')
+        init_cluster(encrypted=True, allow_shell=True)
+        self.model.recorders = [JSONCaseRecorder('cases.json')]
+        self.model.driver.shard_recording = True
+        try:
+            self.run_cases(sequential=False)
+
+            # Each server recorded its cases in a shard file.
+            self.assertTrue(len(glob.glob('cases-driver_*.json')) > 0)
+            cases = CaseDataset('cases.json', 'json').data.fetch()
+            self.assertEqual(len(cases),
+                             len(self.model.driver.case_inputs.driven.x))
+            for case in cases:
+                self.assertEqual(case['driven.rosen_suzuki'],
+                                 rosen_suzuki(case['driven.x']))
+        finally:
+            for path in glob.glob('cases*.json*'):
+                os.remove(path)
+
     def run_cases(self, sequential, forced_errors=False, retry=True):
         """ Evaluate cases, either sequentially or across multiple servers. """
         driver = self.model.driver
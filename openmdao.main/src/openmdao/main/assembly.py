@@ -24,7 +24,7 @@ from openmdao.main.container import _copydict
 from openmdao.main.component import Component, Container
 from openmdao.main.variable import Variable
 from openmdao.main.vartree import VariableTree
-from openmdao.main.datatypes.api import List, Slot, Str
+from openmdao.main.datatypes.api import Bool, List, Slot, Str
 from openmdao.main.driver import Driver
 from openmdao.main.hasparameters import HasParameters, ParameterGroup
 from openmdao.main.hasconstraints import HasConstraints, HasEqConstraints, \
@@ -38,6 +38,7 @@ from openmdao.main.expreval import ExprEvaluator
 from openmdao.main.exprmapper import ExprMapper, PseudoComponent
 from openmdao.main.array_helpers import is_differentiable_var
 from openmdao.main.depgraph import DependencyGraph
+from openmdao.main.statevector import StateVector
 
 from openmdao.util.graph import list_deriv_vars
 from openmdao.util.log import logger
@@ -138,6 +139,12 @@ class Assembly(Component):
                     desc='Patterns for variables to exclude from the recorders'
                          ' (only valid at top level).')
 
+    flat_transfer = Bool(False,
+                         desc='Set to True to hold connected float arrays in'
+                              ' a single state vector, shared between each'
+                              ' source and its targets, to speed up data'
+                              ' transfer.')
+
     def __init__(self):
 
         super(Assembly, self).__init__()
@@ -154,6 +161,7 @@ class Assembly(Component):
 
         self._exprmapper = ExprMapper(self)
         self._graph_loops = []
+        self._state_vector = None
         self.J_input_keys = None
         self.J_output_keys = None
 
@@ -741,6 +749,7 @@ class Assembly(Component):
 
         self._pre_driver = None
         self._graph_loops = None
+        self._state_vector = None
         self.J_input_keys = self.J_output_keys = None
 
     def _set_failed(self, path, value, index=None, force=False):
@@ -900,9 +909,13 @@ class Assembly(Component):
         """
         if graph is None:
             graph = self._depgraph
+        if self.flat_transfer and self._state_vector is None:
+            self._state_vector = StateVector(self)
+        state = self._state_vector if self.flat_transfer else None
         try:
             for vname in graph.list_inputs(compname, connected=True):
-                graph.update_destvar(self, vname)
+                if state is None or not state.update(vname):
+                    graph.update_destvar(self, vname)
         except Exception as err:
             self.raise_exception(str(err), type(err))
 
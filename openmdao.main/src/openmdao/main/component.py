@@ -154,6 +154,12 @@ class Component(Container):
 
     create_instance_dir = Bool(False)
 
+    # Complex step support. Set to True if execute() carries complex inputs
+    # through to complex outputs, so that array inputs can be complex
+    # stepped. Set to False if this component can't be complex stepped at
+    # all, in which case central difference is used instead.
+    complex_step_safe = None
+
     def __init__(self):
         super(Component, self).__init__()
 
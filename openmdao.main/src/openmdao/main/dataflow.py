@@ -49,6 +49,7 @@ class Dataflow(SequentialWorkflow):
         """
         super(Dataflow, self).config_changed()
         self._collapsed_graph = None
+        self._data_graph = None
         self._topsort = None
         self._duplicates = None
 
@@ -77,6 +78,43 @@ class Dataflow(SequentialWorkflow):
         if self._collapsed_graph:
             return self._collapsed_graph
 
+        collapsed_graph = self._get_data_graph().copy()
+
+        # now add some fake dependencies for degree 0 nodes in an attempt to
+        # mimic a SequentialWorkflow in cases where nodes aren't connected.
+        # Edges are added from each degree 0 node to all nodes after it in
+        # sequence order.
+        self._duplicates = set()
+        last = len(self._names)-1
+        if last > 0:
+            to_add = []
+            for i, cname in enumerate(self._names):
+                if collapsed_graph.degree(cname) == 0:
+                    if self._names.count(cname) > 1:
+                        # Don't introduce circular dependencies.
+                        self._duplicates.add(cname)
+                    else:
+                        if i < last:
+                            for n in self._names[i+1:]:
+                                to_add.append((cname, n))
+                        else:
+                            for n in self._names[0:i]:
+                                to_add.append((n, cname))
+            collapsed_graph.add_edges_from([(u, v) for u, v in to_add
+                                            if u in collapsed_graph and v in collapsed_graph])
+
+        self._collapsed_graph = collapsed_graph
+
+        return self._collapsed_graph
+
+    def _get_data_graph(self):
+        """Get the graph of our workflow components with edges only for
+        their actual data dependencies, including those of the
+        sub-workflows of any Driver components in our workflow.
+        """
+        if self._data_graph:
+            return self._data_graph
+
         to_add = []
         scope = self.scope
         graph = scope._depgraph
@@ -117,34 +155,9 @@ class Dataflow(SequentialWorkflow):
                         to_add.append((u, drv))
         collapsed_graph.add_edges_from(to_add)
 
-        collapsed_graph = collapsed_graph.subgraph(cnames-removes)
-
-        # now add some fake dependencies for degree 0 nodes in an attempt to
-        # mimic a SequentialWorkflow in cases where nodes aren't connected.
-        # Edges are added from each degree 0 node to all nodes after it in
-        # sequence order.
-        self._duplicates = set()
-        last = len(self._names)-1
-        if last > 0:
-            to_add = []
-            for i, cname in enumerate(self._names):
-                if collapsed_graph.degree(cname) == 0:
-                    if self._names.count(cname) > 1:
-                        # Don't introduce circular dependencies.
-                        self._duplicates.add(cname)
-                    else:
-                        if i < last:
-                            for n in self._names[i+1:]:
-                                to_add.append((cname, n))
-                        else:
-                            for n in self._names[0:i]:
-                                to_add.append((n, cname))
-            collapsed_graph.add_edges_from([(u, v) for u, v in to_add
-                                            if u in collapsed_graph and v in collapsed_graph])
-
-        self._collapsed_graph = collapsed_graph
+        self._data_graph = collapsed_graph.subgraph(cnames-removes)
 
-        return self._collapsed_graph
+        return self._data_graph
 
     def _insert_duplicates(self):
         """We have some duplicate unconnected components. Adjust order
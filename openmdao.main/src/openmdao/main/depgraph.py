@@ -1,4 +1,7 @@
+import re
+from ast import literal_eval
 from collections import deque
+from functools import partial
 from itertools import chain
 from ordereddict import OrderedDict
 
@@ -8,7 +11,9 @@ from openmdao.main.mp_support import has_interface
 from openmdao.main.interfaces import IDriver, IVariableTree, \
                                      IImplicitComponent, ISolver, \
                                      IAssembly, IComponent
+from openmdao.main.container import Container
 from openmdao.main.expreval import ConnectedExprEvaluator
+from openmdao.main.index import INDEX
 from openmdao.main.array_helpers import is_differentiable_var, is_differentiable_val
 from openmdao.main.pseudoassembly import PseudoAssembly, from_PA_var, to_PA_var
 from openmdao.main.case import flatteners
@@ -25,6 +30,11 @@ _metasrch = ['data_shape', 'deriv_ignore', 'framework_var']
 
 _missing = object()
 
+# a variable of the scope or of one of its children, optionally with
+# a constant index, e.g., comp.x[2] or comp.x[1, 3]
+_simple_ref = re.compile(r'^([A-Za-z_]\w*)(?:\.([A-Za-z_]\w*))?'
+                         r'(?:\[([-\d\s,]+)\])?$')
+
 
 def _is_expr(node):
     """Returns True if node is an expression that is not a simple
@@ -34,6 +44,37 @@ def _is_expr(node):
     return len(_exprchars.intersection(node)) > 0
 
 
+def _parse_simple_ref(graph, scope, path):
+    """Returns a tuple of the form (obj, name, index) for a connected
+    variable path that refers to a variable of scope or of one of its
+    components, with an optional constant index. Returns None for any other
+    path.
+    """
+    match = _simple_ref.match(path)
+    if match is None:
+        return None
+
+    objname, name, index = match.groups()
+    if name is None:
+        obj, name = scope, objname
+    elif is_comp_node(graph, objname):
+        obj = getattr(scope, objname)
+    else:
+        return None
+
+    if index is not None:
+        try:
+            index = literal_eval(index)
+        except (SyntaxError, ValueError):
+            return None
+
+    return obj, name, index
+
+
+def _get_indexed(obj, name, index):
+    return getattr(obj, name)[index]
+
+
 def _sub_or_super(s1, s2):
     """Returns True if s1 is a subvar or supervar of s2."""
     if s2.startswith(s1 + '.'):
@@ -898,30 +939,74 @@ class DependencyGraph(nx.DiGraph):
         """Update the value of the given variable in the
         given scope using upstream variables.
         """
-        tup = self._dstvars.get(vname)
-        if tup is None:
-            sexprs = []
-            dexprs = []
+        plan = self._dstvars.get(vname)
+        if plan is None:
+            plan = []
             for u,v,data in self.in_edges_iter(vname, data=True):
                 if 'conn' in data:
-                    dexprs.append(data['dexpr'])
-                    sexprs.append(data['sexpr'])
+                    plan.append(self._compile_transfer(scope, data))
                 else:
                     for uu,vv,ddata in self.in_edges_iter(u, data=True):
                         if 'conn' in ddata:
-                            dexprs.append(ddata['dexpr'])
-                            sexprs.append(ddata['sexpr'])
-            self._dstvars[vname] = (sexprs, dexprs)
-        else:
-            sexprs, dexprs = tup
+                            plan.append(self._compile_transfer(scope, ddata))
+            self._dstvars[vname] = plan
 
         try:
-            for sexpr, dexpr in zip(sexprs, dexprs):
-                dexpr.set(sexpr.evaluate(scope=scope), scope=scope)
+            for getter, setter, sexpr, dexpr in plan:
+                setter(getter())
         except Exception as err:
             raise err.__class__("cannot set '%s' from '%s': %s" %
                                  (dexpr.text, sexpr.text, str(err)))
 
+    def _compile_transfer(self, scope, data):
+        """Returns a tuple of the form (getter, setter, sexpr, dexpr) for
+        the connection edge with the given data. Simple variable references
+        are bound directly to the objects that own them, which is valid
+        until the next config_changed(). Anything else is evaluated through
+        the connection's expressions.
+        """
+        sexpr = data['sexpr']
+        dexpr = data['dexpr']
+        src = _parse_simple_ref(self, scope, sexpr.text)
+        dest = _parse_simple_ref(self, scope, dexpr.text)
+
+        if src is None:
+            getter = partial(sexpr.evaluate, scope=scope)
+        else:
+            obj, name, index = src
+            trait = obj.get_trait(name) if isinstance(obj, Container) else None
+            if index is not None:
+                getter = partial(_get_indexed, obj, name, index)
+            elif trait is not None and trait.copy:
+                # get_attr copies the value as the trait requires.
+                getter = partial(obj.get_attr, name)
+            else:
+                getter = partial(getattr, obj, name)
+
+        if dest is None:
+            setter = partial(dexpr.set, scope=scope)
+        else:
+            obj, name, index = dest
+            if not isinstance(obj, Container):
+                # PseudoComponents don't support indexing.
+                if index is None:
+                    setter = partial(obj.set, name)
+                else:
+                    setter = partial(dexpr.set, scope=scope)
+            elif index is not None:
+                setter = partial(obj._index_set, name, index=[(INDEX, index)])
+            else:
+                setter = partial(setattr, obj, name)
+
+        return getter, setter, sexpr, dexpr
+
+    def __getstate__(self):
+        """Return dict representing this graph's state. Compiled transfers
+        refer to the scope's objects and are rebuilt as needed."""
+        state = self.__dict__.copy()
+        state['_dstvars'] = {}
+        return state
+
     def edge_dict_to_comp_list(self, edges, implicit_edges=None):
         """Converts inner edge dict into an ordered dict whose keys
         are component names, and whose values are lists of relevant
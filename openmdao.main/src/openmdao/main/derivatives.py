@@ -8,8 +8,9 @@ from openmdao.main.pseudocomp import PseudoComponent
 from openmdao.util.graph import list_deriv_vars
 from openmdao.util.log import logger
 
-from numpy import zeros, vstack, hstack
-from scipy.sparse.linalg import gmres, LinearOperator
+from numpy import zeros, vstack, hstack, column_stack, sqrt, where
+from scipy.linalg import solve_triangular
+from scipy.sparse.linalg import gmres, splu, LinearOperator
 
 # pylint: disable=C0103
 
@@ -18,11 +19,6 @@ def calc_gradient(wflow, inputs, outputs, n_edge, shape):
     all passed inputs.
     """
 
-    # Size the problem
-    A = LinearOperator((n_edge, n_edge),
-                       matvec=wflow.matvecFWD,
-                       dtype=float)
-
     J = zeros(shape)
 
     # Each comp calculates its own derivatives at the current
@@ -33,10 +29,11 @@ def calc_gradient(wflow, inputs, outputs, n_edge, shape):
         return J
 
     dgraph = wflow._derivative_graph
-    options = wflow.parent.gradient_options
     bounds = wflow._bounds_cache
 
-    # Forward mode, solve linear system for each parameter
+    # Forward mode, solve linear system for each parameter. Collect the
+    # right-hand sides first so that they can be solved together.
+    rhs = []
     j = 0
     for param in inputs:
 
@@ -70,39 +67,24 @@ def calc_gradient(wflow, inputs, outputs, n_edge, shape):
             in_range = range(i1, i2)
 
         for irhs in in_range:
+            rhs.append((irhs, j, param))
+            j += 1
 
-            RHS = zeros((n_edge, 1))
-            RHS[irhs, 0] = 1.0
-
-            # Call GMRES to solve the linear system
-            dx, info = gmres(A, RHS,
-                             tol=options.gmres_tolerance,
-                             maxiter=options.gmres_maxiter)
-            if info > 0:
-                msg = "ERROR in calc_gradient in '%s': gmres failed to converge " \
-                      "after %d iterations for parameter '%s' at index %d"
-                logger.error(msg, wflow.parent.get_pathname(), info, param, irhs)
-            elif info < 0:
-                msg = "ERROR in calc_gradient in '%s': gmres failed " \
-                      "for parameter '%s' at index %d"
-                logger.error(msg, wflow.parent.get_pathname(), param, irhs)
-
-            i = 0
-            for item in outputs:
-                try:
-                    k1, k2 = bounds[item]
-                except KeyError:
-                    i += wflow.get_width(item)
-                    continue
-
-                if isinstance(k1, list):
-                    J[i:i+(len(k1)), j] = dx[k1]
-                    i += len(k1)
-                else:
-                    J[i:i+(k2-k1), j] = dx[k1:k2]
-                    i += k2-k1
+    for dx, (irhs, j, param) in _solve_linear(wflow, rhs, n_edge):
+        i = 0
+        for item in outputs:
+            try:
+                k1, k2 = bounds[item]
+            except KeyError:
+                i += wflow.get_width(item)
+                continue
 
-            j += 1
+            if isinstance(k1, list):
+                J[i:i+(len(k1)), j] = dx[k1]
+                i += len(k1)
+            else:
+                J[i:i+(k2-k1), j] = dx[k1:k2]
+                i += k2-k1
 
     #print inputs, '\n', outputs, '\n', J
     return J
@@ -112,10 +94,6 @@ def calc_gradient_adjoint(wflow, inputs, outputs, n_edge, shape):
     all passed inputs. Calculation is done in adjoint mode.
     """
 
-    # Size the problem
-    A = LinearOperator((n_edge, n_edge),
-                       matvec=wflow.matvecREV,
-                       dtype=float)
     J = zeros(shape)
 
     # Each comp calculates its own derivatives at the current
@@ -126,10 +104,11 @@ def calc_gradient_adjoint(wflow, inputs, outputs, n_edge, shape):
         return J
 
     dgraph = wflow._derivative_graph
-    options = wflow.parent.gradient_options
     bounds = wflow._bounds_cache
 
-    # Adjoint mode, solve linear system for each output
+    # Adjoint mode, solve linear system for each output. Collect the
+    # right-hand sides first so that they can be solved together.
+    rhs = []
     j = 0
     for output in outputs:
 
@@ -149,63 +128,261 @@ def calc_gradient_adjoint(wflow, inputs, outputs, n_edge, shape):
             out_range = range(i1, i2)
 
         for irhs in out_range:
+            rhs.append((irhs, j, output))
+            j += 1
 
-            RHS = zeros((n_edge, 1))
-            RHS[irhs, 0] = 1.0
-
-            # Call GMRES to solve the linear system
-            dx, info = gmres(A, RHS,
-                             tol=options.gmres_tolerance,
-                             maxiter=options.gmres_maxiter)
-
-            if info > 0:
-                msg = "ERROR in calc_gradient_adjoint in '%s': gmres failed to converge " \
-                      "after %d iterations for output '%s' at index %d"
-                logger.error(msg, wflow.parent.get_pathname(), info, output, irhs)
-            elif info < 0:
-                msg = "ERROR in calc_gradient_adjoint in '%s': gmres failed " \
-                      "for output '%s' at index %d"
-                logger.error(msg, wflow.parent.get_pathname(), output, irhs)
-
-            i = 0
-
-            for param in inputs:
-
-                # You can ask for derivatives of broadcast inputs in cases
-                # where some of the inputs aren't in the relevance graph.
-                # Find the one that is.
-                if isinstance(param, tuple):
-                    for bcast_param in param:
-                        if bcast_param in dgraph and 'bounds' in dgraph.node[bcast_param]:
-                            param = bcast_param
-                            break
-                    else:
-                        param = param[0]
-                        #raise RuntimeError("didn't find any of '%s' in derivative graph for '%s'" %
-                                           #(param, wflow.parent.get_pathname()))
-
-                try:
-                    k1, k2 = bounds[param]
-                except KeyError:
-                    # If you end up here, it is usually because you have a
-                    # tuple of broadcast inputs containing only non-relevant
-                    # variables. Derivative is zero, so take one and increment
-                    # by its width.
-                    i += wflow.get_width(param)
-                    continue
+    for dx, (irhs, j, output) in _solve_linear(wflow, rhs, n_edge,
+                                               adjoint=True):
+        i = 0
+
+        for param in inputs:
 
-                if isinstance(k1, list):
-                    J[j, i:i+(len(k1))] = dx[k1:k2]
-                    i += len(k1)
+            # You can ask for derivatives of broadcast inputs in cases
+            # where some of the inputs aren't in the relevance graph.
+            # Find the one that is.
+            if isinstance(param, tuple):
+                for bcast_param in param:
+                    if bcast_param in dgraph and 'bounds' in dgraph.node[bcast_param]:
+                        param = bcast_param
+                        break
                 else:
-                    J[j, i:i+(k2-k1)] = dx[k1:k2]
-                    i += k2-k1
+                    param = param[0]
+                    #raise RuntimeError("didn't find any of '%s' in derivative graph for '%s'" %
+                                       #(param, wflow.parent.get_pathname()))
+
+            try:
+                k1, k2 = bounds[param]
+            except KeyError:
+                # If you end up here, it is usually because you have a
+                # tuple of broadcast inputs containing only non-relevant
+                # variables. Derivative is zero, so take one and increment
+                # by its width.
+                i += wflow.get_width(param)
+                continue
 
-            j += 1
+            if isinstance(k1, list):
+                J[j, i:i+(len(k1))] = dx[k1]
+                i += len(k1)
+            else:
+                J[j, i:i+(k2-k1)] = dx[k1:k2]
+                i += k2-k1
 
     #print inputs, '\n', outputs, '\n', J, dx
     return J
 
+def _solve_linear(wflow, rhs, n_edge, adjoint=False):
+    """Generator that solves the workflow's linear system once for each
+    unit right-hand side in `rhs`, a list of tuples whose first entry is
+    the index of the nonzero. Yields (solution, rhs entry) pairs in order.
+    The transposed system is solved if `adjoint` is True.
+    """
+    options = wflow.parent.gradient_options
+
+    if adjoint:
+        matvec = wflow.matvecREV
+        caller, kind = 'calc_gradient_adjoint', 'output'
+    else:
+        matvec = wflow.matvecFWD
+        caller, kind = 'calc_gradient', 'parameter'
+
+    lin_solver = options.lin_solver
+
+    if lin_solver == 'sparse_lu':
+        A = wflow.assemble_jacobian()
+        if A is None:
+            logger.warning("'%s': can't assemble the workflow Jacobian "
+                           "because some components don't provide it, so "
+                           "falling back to scipy_gmres.",
+                           wflow.parent.get_pathname())
+            lin_solver = 'scipy_gmres'
+        else:
+            # One factorization, then cheap triangular solves.
+            lu = splu(A)
+            RHS = zeros((n_edge, len(rhs)))
+            for k, item in enumerate(rhs):
+                RHS[item[0], k] = 1.0
+
+            dx = lu.solve(RHS, trans='T' if adjoint else 'N')
+
+            for k, item in enumerate(rhs):
+                yield dx[:, k], item
+            return
+
+    precon = wflow.preconditioner(options.preconditioner, adjoint)
+
+    if lin_solver == 'block_gmres':
+        if precon is None:
+            matmat = matvec
+        else:
+            # Left preconditioning.
+            matmat = lambda arg: precon(matvec(arg))
+
+        size = options.gmres_block_size or len(rhs)
+        for start in range(0, len(rhs), size):
+            chunk = rhs[start:start+size]
+
+            RHS = zeros((n_edge, len(chunk)))
+            for k, item in enumerate(chunk):
+                RHS[item[0], k] = 1.0
+            if precon is not None:
+                RHS = precon(RHS)
+
+            dx, info = block_gmres(matmat, RHS,
+                                   tol=options.gmres_tolerance,
+                                   maxiter=options.gmres_maxiter)
+
+            for k, item in enumerate(chunk):
+                _log_solve_error(wflow, info[k], caller, kind, item)
+                yield dx[:, k], item
+        return
+
+    # Size the problem
+    A = LinearOperator((n_edge, n_edge),
+                       matvec=matvec,
+                       dtype=float)
+
+    if precon is None:
+        M = None
+    else:
+        M = LinearOperator((n_edge, n_edge),
+                           matvec=precon,
+                           dtype=float)
+
+    for item in rhs:
+
+        RHS = zeros((n_edge, 1))
+        RHS[item[0], 0] = 1.0
+
+        # Call GMRES to solve the linear system
+        dx, info = gmres(A, RHS, M=M,
+                         tol=options.gmres_tolerance,
+                         maxiter=options.gmres_maxiter)
+
+        _log_solve_error(wflow, info, caller, kind, item)
+        yield dx, item
+
+def _log_solve_error(wflow, info, caller, kind, item):
+    """Log a failed linear solve for the right-hand side `item`."""
+    irhs, _, name = item
+    if info > 0:
+        msg = "ERROR in %s in '%%s': gmres failed to converge " \
+              "after %%d iterations for %s '%%s' at index %%d" % (caller, kind)
+        logger.error(msg, wflow.parent.get_pathname(), info, name, irhs)
+    elif info < 0:
+        msg = "ERROR in %s in '%%s': gmres failed " \
+              "for %s '%%s' at index %%d" % (caller, kind)
+        logger.error(msg, wflow.parent.get_pathname(), name, irhs)
+
+def block_gmres(matmat, B, tol=1.0e-9, restart=20, maxiter=100):
+    """Solve A*X = B for all columns of B together. Each column gets its
+    own restarted GMRES iteration, but the iterations advance in lockstep
+    so that `matmat`, which multiplies A by a 2D array of column vectors,
+    is called only once per iteration. Columns drop out of the product as
+    soon as they converge.
+
+    As in scipy's gmres, the Krylov basis is discarded and rebuilt from
+    the current residual every `restart` iterations, so at most `restart`+1
+    blocks the size of B are stored, and `maxiter` is the maximum number
+    of restart cycles.
+
+    Returns the solution array and an array containing an info flag for
+    each column (0 for success, otherwise the number of iterations taken
+    without converging, as in scipy's gmres).
+    """
+    n_edge, nrhs = B.shape
+    X = zeros((n_edge, nrhs))
+    info = zeros(nrhs, dtype=int)
+    nit = zeros(nrhs, dtype=int)
+
+    beta = sqrt((B*B).sum(axis=0))
+    target = tol*beta
+    active = beta > 0.0
+    R = B
+    for cycle in range(maxiter):
+        if cycle:
+            # Restart the columns that haven't converged from their true
+            # residual.
+            cols = active.nonzero()[0]
+            R = zeros((n_edge, nrhs))
+            R[:, cols] = B[:, cols] - matmat(X[:, cols])
+            beta = sqrt((R*R).sum(axis=0))
+            active &= beta > target
+            if not active.any():
+                break
+
+        active = _block_gmres_cycle(matmat, R, beta, active, target,
+                                    restart, X, nit)
+        if not active.any():
+            break
+
+    info[active] = nit[active]
+    return X, info
+
+def _block_gmres_cycle(matmat, R, beta, active, target, restart, X, nit):
+    """Run up to `restart` lockstep GMRES iterations on the `active` columns
+    of the residual block `R`, whose column norms are `beta`, and add the
+    resulting corrections to `X`. `nit` counts each column's iterations.
+    Returns a mask of the columns that haven't converged.
+    """
+    n_edge, nrhs = R.shape
+    started = active
+    active = active.copy()
+
+    V = [R / where(active, beta, 1.0)]
+    H = zeros((restart+1, restart, nrhs))
+    cs = zeros((restart, nrhs))
+    sn = zeros((restart, nrhs))
+    g = zeros((restart+1, nrhs))
+    g[0] = beta
+    m = zeros(nrhs, dtype=int)
+
+    for j in range(restart):
+        cols = active.nonzero()[0]
+
+        W = zeros((n_edge, nrhs))
+        W[:, cols] = matmat(V[j][:, cols])
+
+        # Modified Gram-Schmidt, one column per Krylov space.
+        for i in range(j+1):
+            h = (V[i]*W).sum(axis=0)
+            H[i, j] = h
+            W -= h*V[i]
+
+        hnorm = sqrt((W*W).sum(axis=0))
+        H[j+1, j] = hnorm
+        V.append(W / where(hnorm > 0.0, hnorm, 1.0))
+
+        # Apply the previous Givens rotations to the new column of H.
+        for i in range(j):
+            temp = cs[i]*H[i, j] + sn[i]*H[i+1, j]
+            H[i+1, j] = -sn[i]*H[i, j] + cs[i]*H[i+1, j]
+            H[i, j] = temp
+
+        # Compute the new rotation and apply it to the residual vector.
+        denom = sqrt(H[j, j]**2 + H[j+1, j]**2)
+        denom = where(denom > 0.0, denom, 1.0)
+        cs[j] = H[j, j] / denom
+        sn[j] = H[j+1, j] / denom
+        H[j, j] = cs[j]*H[j, j] + sn[j]*H[j+1, j]
+        H[j+1, j] = 0.0
+        g[j+1] = -sn[j]*g[j]
+        g[j] = cs[j]*g[j]
+
+        m[cols] = j+1
+        active[cols] = abs(g[j+1, cols]) > target[cols]
+        if not active.any():
+            break
+
+    nit += m
+
+    # Back-substitute for each column's Krylov coefficients.
+    for k in started.nonzero()[0]:
+        y = solve_triangular(H[:m[k], :m[k], k], g[:m[k], k])
+        for i in range(m[k]):
+            X[:, k] += y[i]*V[i][:, k]
+
+    return active
+
 def pre_process_dicts(obj, key, arg_or_result, shape_cache):
     '''If the component supplies apply_deriv or applyMinv or their adjoint
     counterparts, it expects the contents to be shaped like the original
@@ -283,7 +460,7 @@ def applyJ(obj, arg, result, residual, shape_cache, J=None):
     # Speedhack, don't call component's derivatives if incoming vector is zero.
     nonzero = False
     for key, value in arg.iteritems():
-        if key not in result and any(value != 0):
+        if key not in result and value.any():
             nonzero = True
             break
 
@@ -294,6 +471,14 @@ def applyJ(obj, arg, result, residual, shape_cache, J=None):
     # 'apply_deriv' function instead of provideJ.
     if J is None and hasattr(obj, 'apply_deriv'):
 
+        # apply_deriv only knows about single vectors, so a block of them
+        # has to be fed in one column at a time.
+        ncol = _column_count(arg)
+        if ncol:
+            _apply_by_column(applyJ, obj, arg, result, residual,
+                             shape_cache, ncol)
+            return
+
         # The apply_deriv function expects the argument and result dicts for
         # each input and output to have the same shape as the input/output.
         resultkeys = sorted(result.keys())
@@ -385,7 +570,7 @@ def applyJT(obj, arg, result, residual, shape_cache, J=None):
     # Speedhack, don't call component's derivatives if incoming vector is zero.
     nonzero = False
     for key, value in arg.iteritems():
-        if any(value != 0):
+        if value.any():
             nonzero = True
             break
 
@@ -396,6 +581,14 @@ def applyJT(obj, arg, result, residual, shape_cache, J=None):
     # specify the 'apply_derivT' function instead of provideJ.
     if J is None and hasattr(obj, 'apply_derivT'):
 
+        # apply_derivT only knows about single vectors, so a block of them
+        # has to be fed in one column at a time.
+        ncol = _column_count(arg)
+        if ncol:
+            _apply_by_column(applyJT, obj, arg, result, residual,
+                             shape_cache, ncol)
+            return
+
         # The apply_deriv function expects the argument and
         # result dicts for each input and output to have the
         # same shape as the input/output.
@@ -479,6 +672,17 @@ def applyMinv(obj, inputs, shape_cache):
     arrays for each input and expand any needed array elements into full arrays.
     """
 
+    # The component only knows about single vectors, so precondition a
+    # block of them one column at a time.
+    ncol = _column_count(inputs)
+    if ncol:
+        cols = [applyMinv(obj, dict((key, value[:, k].copy())
+                                    for key, value in inputs.iteritems()),
+                          shape_cache)
+                for k in range(ncol)]
+        return dict((key, column_stack([col[key] for col in cols]))
+                    for key in inputs)
+
     inputkeys = sorted(inputs.keys())
     for key in inputkeys:
         pre_process_dicts(obj, key, inputs, shape_cache)
@@ -503,6 +707,17 @@ def applyMinvT(obj, inputs, shape_cache):
     arrays for each input and expand any needed array elements into full arrays.
     """
 
+    # The component only knows about single vectors, so precondition a
+    # block of them one column at a time.
+    ncol = _column_count(inputs)
+    if ncol:
+        cols = [applyMinvT(obj, dict((key, value[:, k].copy())
+                                    for key, value in inputs.iteritems()),
+                          shape_cache)
+                for k in range(ncol)]
+        return dict((key, column_stack([col[key] for col in cols]))
+                    for key in inputs)
+
     inputkeys = sorted(inputs.keys())
     for key in inputkeys:
         pre_process_dicts(obj, key, inputs, shape_cache)
@@ -522,6 +737,29 @@ def applyMinvT(obj, inputs, shape_cache):
 
     return inputs
 
+def _column_count(vecs):
+    """Returns the number of columns if the arrays in the dict `vecs` hold
+    a block of vectors, or 0 if they hold a single vector."""
+    for value in vecs.itervalues():
+        if value.ndim > 1:
+            return value.shape[1]
+        break
+    return 0
+
+def _apply_by_column(func, obj, arg, result, residual, shape_cache, ncol):
+    """Call `func` (applyJ or applyJT) once per column of a block of
+    vectors, poking each column of the product back into `result`."""
+    for k in range(ncol):
+        col_arg = dict((key, value[:, k].copy())
+                       for key, value in arg.iteritems())
+        col_result = dict((key, value[:, k].copy())
+                          for key, value in result.iteritems())
+
+        func(obj, col_arg, col_result, residual, shape_cache)
+
+        for key in result:
+            result[key][:, k] = col_result[key]
+
 def get_bounds(obj, input_keys, output_keys, J):
     """ Returns a pair of dictionaries that contain the stop and end index
     for each input and output in a pair of lists.
@@ -58,6 +58,26 @@ class GradientOptions(VariableTree):
                               "should be finite-differenced together.",
                               framework_var=True)
 
+    fd_servers = Int(1, low=1,
+                     desc="Maximum number of servers used to evaluate "
+                     "finite difference steps concurrently. Servers are "
+                     "obtained from the ResourceAllocationManager and each "
+                     "one runs a copy of the model. Set to 1 to evaluate "
+                     "the steps sequentially in this process.",
+                     framework_var=True)
+
+    fd_coloring = Enum('none', ['none', 'probe', 'declared'],
+                       desc="Compressed finite difference. Columns of the "
+                       "Jacobian that share no nonzero rows are perturbed "
+                       "together. With 'probe' the sparsity pattern is "
+                       "the union of full finite differences at the first "
+                       "two distinct points, so a derivative that is zero "
+                       "at both is assumed to be zero everywhere. With "
+                       "'declared' it comes from the connections between "
+                       "components and their list_deriv_vars. Set to "
+                       "'none' to perturb one input at a time.",
+                       framework_var=True)
+
     # KTM - story up for this one.
     #fd_blocks = List([], desc='User can specify nondifferentiable blocks '
     #                          'by adding sets of component names.')
@@ -65,8 +85,43 @@ class GradientOptions(VariableTree):
     # Analytic solution with GMRES
     gmres_tolerance = Float(1.0e-9, desc='Tolerance for GMRES',
                             framework_var=True)
-    gmres_maxiter = Int(100, desc='Maximum number of iterations for GMRES',
+    gmres_maxiter = Int(100, desc='Maximum number of restart cycles for '
+                        'GMRES. Both GMRES solvers restart every 20 '
+                        'iterations.',
                         framework_var=True)
+    lin_solver = Enum('scipy_gmres',
+                      ['scipy_gmres', 'block_gmres', 'sparse_lu'],
+                      desc="Linear solver used for the analytic gradient. "
+                      "'scipy_gmres' solves one right-hand side at a time. "
+                      "'block_gmres' solves all right-hand sides together, "
+                      "so each iteration makes one batched pass through the "
+                      "workflow's components. 'sparse_lu' assembles the "
+                      "workflow Jacobian into a sparse matrix and factors it "
+                      "once; it requires every component to provide its "
+                      "Jacobian and falls back to 'scipy_gmres' otherwise.",
+                      framework_var=True)
+    gmres_block_size = Int(0, low=0,
+                           desc="Maximum number of right-hand sides solved "
+                           "together when lin_solver is 'block_gmres'. Set "
+                           "to 0 to solve them all at once. Each right-hand "
+                           "side in a block keeps up to 21 Krylov vectors, "
+                           "so memory use grows with the block size.",
+                           framework_var=True)
+    preconditioner = Enum('component',
+                          ['component', 'none', 'block_jacobi',
+                           'block_gauss_seidel'],
+                          desc="Preconditioner for the GMRES solvers. "
+                          "'component' uses applyMinv (applyMinvT in "
+                          "adjoint) on the components that supply it. "
+                          "'block_jacobi' also inverts the diagonal block "
+                          "of the workflow Jacobian for every other "
+                          "component. 'block_gauss_seidel' additionally "
+                          "sweeps each block's result through the "
+                          "components that follow it in the workflow. The "
+                          "block preconditioners require every component "
+                          "to provide its Jacobian and fall back to "
+                          "'component' otherwise.",
+                          framework_var=True)
     derivative_direction = Enum('auto',
                                 ['auto', 'forward', 'adjoint'],
                                 desc="Direction for derivative calculation. "
@@ -307,6 +362,13 @@ class Driver(Component):
         self.workflow.reset()
         super(Driver, self).run(ffd_order, case_uuid)
 
+        # Write out cases that recorders may have buffered.
+        scope = self.parent
+        if scope is not None and scope.parent is None:
+            for recorder in getattr(scope, 'recorders', None) or ():
+                if hasattr(recorder, 'flush'):
+                    recorder.flush()
+
     @rbac(('owner', 'user'))
     def configure_recording(self, includes, excludes):
         """Called at start of top-level run to configure case recording.
@@ -391,6 +453,13 @@ class Driver(Component):
         if self.workflow is not None:
             self.workflow.config_changed()
 
+    def pre_delete(self):
+        """Release any servers kept by our workflow before the model is
+        deleted."""
+        super(Driver, self).pre_delete()
+        if self.workflow is not None:
+            self.workflow.release_servers()
+
     def get_workflow(self):
         """ Get the driver info and the list of components that make up the
             driver's workflow; recurse on nested drivers.
@@ -2,13 +2,177 @@
 """
 
 # pylint: disable=E0611,F0401
+import copy
+import gc
+import itertools
+import os
+import Queue
+import sys
+import threading
 from sys import float_info
 
 from openmdao.main.array_helpers import flattened_size, flattened_value
-from openmdao.main.interfaces import IVariableTree
+from openmdao.main.interfaces import IAssembly, IDriver, IVariableTree
 from openmdao.main.mp_support import has_interface
-
-from numpy import ndarray, zeros, ones, unravel_index, complex128
+from openmdao.main.rbac import get_credentials, set_credentials
+from openmdao.main.resource import ResourceAllocationManager as RAM
+from openmdao.main.resource import LocalAllocator
+from openmdao.util.filexfer import filexfer
+from openmdao.util.log import logger
+
+from numpy import ndarray, zeros, ones, unravel_index, complex128, where, \
+                  array_equal
+
+_UNKNOWN = object()
+_REPLICANTS = itertools.count(1)  # Keeps egg names unique.
+
+
+def color_columns(sparsity):
+    """Return a list of lists of column indices of the boolean `sparsity`
+    matrix such that no two columns in a list have a nonzero in the same
+    row. Columns are colored greedily, densest first."""
+
+    order = sorted(range(sparsity.shape[1]),
+                   key=lambda col: -sparsity[:, col].sum())
+    groups = []
+    used = []
+    for col in order:
+        for group, rows in zip(groups, used):
+            if not (rows & sparsity[:, col]).any():
+                group.append(col)
+                rows |= sparsity[:, col]
+                break
+        else:
+            groups.append([col])
+            used.append(sparsity[:, col].copy())
+
+    return groups
+
+
+def complex_step_safe(scope, comps):
+    """Return the complex step safety of the named components in scope.
+    This is False if any of them can't be complex stepped, True if all of
+    them declare that complex array inputs are carried through execute,
+    and None otherwise."""
+
+    safe = True
+    for name in comps:
+        comp_safe = getattr(scope.get(name), 'complex_step_safe', None)
+        if comp_safe is False:
+            return False
+        elif comp_safe is None:
+            safe = None
+    return safe
+
+
+def _is_array(scope, srcs):
+    """Return True if the variable underlying srcs is an array."""
+
+    # Parameter groups all have the same kind of value.
+    if not isinstance(srcs, basestring):
+        srcs = srcs[0]
+    return isinstance(scope.get(srcs.partition('[')[0]), ndarray)
+
+
+def promote_complex(scope, srcs):
+    """Replace each real array underlying the given sources with a complex
+    copy, so that an imaginary step isn't discarded by in-place array
+    editing. Returns a list of (path, value) pairs that restore the original
+    arrays."""
+
+    saved = []
+    for src in srcs:
+        base_src = src.partition('[')[0]
+        if base_src in [path for path, val in saved]:
+            continue
+        val = scope.get(base_src)
+        if isinstance(val, ndarray) and val.dtype != complex128:
+            saved.append((base_src, val))
+            scope.set(base_src, val.astype(complex128), force=True)
+    return saved
+
+
+class _ServerPool(object):
+    """ Servers kept for concurrent finite difference, along with the egg
+    of the replicated model they load and the state of the model when it
+    was replicated. """
+
+    def __init__(self, egg_file, resources, signature, values):
+        self.egg_file = egg_file
+        self.resources = resources
+        self.signature = signature
+        self.values = values
+        self.servers = []  # (server, server_info, tlo)
+        self._lock = threading.Lock()
+
+    def add(self, entry):
+        """Add a ``(server, server_info, tlo)`` `entry` to the pool."""
+        with self._lock:
+            self.servers.append(entry)
+
+    def remove(self, entry):
+        """Release the server of a pool `entry`."""
+        with self._lock:
+            if entry not in self.servers:
+                return
+            self.servers.remove(entry)
+        try:
+            RAM.release(entry[0])
+        except Exception as exc:
+            logger.warning('FD server %r release failed: %s',
+                           entry[1]['name'], exc)
+
+    def release(self):
+        """Release all servers and remove the egg file."""
+        for entry in list(self.servers):
+            self.remove(entry)
+        if os.path.exists(self.egg_file):
+            os.remove(self.egg_file)
+
+
+def _model_value(scope, path):
+    """Return a copy of the value of `path` in `scope`."""
+    try:
+        value = scope.get(path)
+        if isinstance(value, ndarray) or has_interface(value, IVariableTree):
+            return value.copy()
+        return copy.deepcopy(value)
+    except Exception:
+        return _UNKNOWN
+
+
+def _same_value(value, other):
+    """Return True if `value` is known to be the same as `other`."""
+    if isinstance(value, ndarray) or isinstance(other, ndarray):
+        return isinstance(value, ndarray) and isinstance(other, ndarray) and \
+               value.dtype == other.dtype and array_equal(value, other)
+    if has_interface(value, IVariableTree):
+        if type(other) is not type(value):
+            return False
+        items = dict(value.items())
+        other_items = dict(other.items())
+        if sorted(items) != sorted(other_items):
+            return False
+        for name, val in items.items():
+            if not _same_value(val, other_items[name]):
+                return False
+        return True
+    try:
+        return bool(value == other)
+    except Exception:
+        return False
+
+
+def _assembly_inputs(assembly, prefix, values):
+    """Add unconnected inputs of components within `assembly` to `values`,
+    keyed by path starting with `prefix`."""
+    graph = assembly._depgraph
+    for name in assembly.list_components():
+        for path in graph.list_inputs(name, connected=False):
+            values[prefix+path] = _model_value(assembly, path)
+        comp = getattr(assembly, name)
+        if has_interface(comp, IAssembly):
+            _assembly_inputs(comp, prefix+name+'.', values)
 
 
 class FiniteDifference(object):
@@ -38,6 +202,14 @@ class FiniteDifference(object):
         self.step_type = options.fd_step_type
         self.step_type_custom = {}
         self.relative_threshold = 1.0e-4
+        self.fd_servers = options.fd_servers
+        self._pool = None  # Servers kept for concurrent evaluation.
+        self.coloring = options.fd_coloring
+        self.sparsity = None
+        self.sparsity_threshold = 1.0e-8
+        self.sparsity_probes = 2
+        self._probed = []  # Points where the sparsity has been probed.
+        self.complex_safe = complex_step_safe(self.scope, pa.comps)
 
         dgraph = self.scope._depgraph
         driver_params = []
@@ -144,130 +316,132 @@ class FiniteDifference(object):
         self.y = zeros((out_size,))
         self.y2 = zeros((out_size,))
 
+    def __getstate__(self):
+        """Kept servers are not copied with the model."""
+        state = self.__dict__.copy()
+        state['_pool'] = None
+        return state
+
     def calculate(self):
         """Return Jacobian for all inputs and outputs."""
         self.get_outputs(self.y_base)
 
-        for j, src, in enumerate(self.inputs):
+        steps = self._get_steps()
 
-            # Users can customize the FD per variable
-            if j in self.form_custom:
-                form = self.form_custom[j]
-            else:
-                form = self.form
-            if j in self.step_type_custom:
-                step_type = self.step_type_custom[j]
-            else:
-                step_type = self.step_type
+        # Compressed finite difference perturbs structurally independent
+        # columns together.
+        if self.coloring == 'declared' and self.sparsity is None:
+            self.sparsity = self._declared_sparsity()
+        probing = self.coloring == 'probe' and \
+                  len(self._probed) < self.sparsity_probes
+        if self.sparsity is not None and not probing:
+            groups = self._get_groups(steps)
+        else:
+            groups = [[step] for step in steps]
 
-            if isinstance(src, basestring):
-                i1, i2 = self.in_bounds[src]
-            else:
-                i1, i2 = self.in_bounds[src[0]]
+        if self.fd_servers > 1:
+            groups = self._calculate_concurrent(groups)
 
-            for i in range(i1, i2):
+        for group in groups:
+            form = group[0][5]
 
-                # Relative stepsizing
-                fd_step = self.fd_step[j]
-                current_val = self.get_value(src, i1, i2, i)
-                if step_type == 'relative':
-                    if current_val > self.relative_threshold:
-                        fd_step = fd_step*current_val
+            #--------------------
+            # Forward difference
+            #--------------------
+            if form == 'forward':
 
-                # Switch to forward if we get near the low boundary
-                if self.low[j] is not None:
-                    if isinstance(self.low[j], (list, ndarray)):
-                        bound_val = self.low[j][i]
-                    else:
-                        bound_val = self.low[j]
-                    if current_val - fd_step < bound_val:
-                        form = 'forward'
+                # Step
+                self._step(group, 1.0)
 
-                # Switch to backward if we get near the high boundary
-                if self.high[j] is not None:
-                    if isinstance(self.high[j], (list, ndarray)):
-                        bound_val = self.high[j][i]
-                    else:
-                        bound_val = self.high[j]
-                    if current_val + fd_step > bound_val:
-                        form = 'backward'
+                self.pa.run(ffd_order=1)
+                self.get_outputs(self.y)
 
-                #--------------------
                 # Forward difference
-                #--------------------
-                if form == 'forward':
+                self._set_columns(group, self.y - self.y_base)
 
-                    # Step
-                    self.set_value(src, fd_step, i1, i2, i)
+                # Undo step
+                self._step(group, -1.0)
 
-                    self.pa.run(ffd_order=1)
-                    self.get_outputs(self.y)
+            #--------------------
+            # Backward difference
+            #--------------------
+            elif form == 'backward':
 
-                    # Forward difference
-                    self.J[:, i] = (self.y - self.y_base)/fd_step
+                # Step
+                self._step(group, -1.0)
 
-                    # Undo step
-                    self.set_value(src, -fd_step, i1, i2, i)
+                self.pa.run(ffd_order=1)
+                self.get_outputs(self.y)
 
-                #--------------------
                 # Backward difference
-                #--------------------
-                elif form == 'backward':
-
-                    # Step
-                    self.set_value(src, -fd_step, i1, i2, i)
+                self._set_columns(group, self.y_base - self.y)
 
-                    self.pa.run(ffd_order=1)
-                    self.get_outputs(self.y)
+                # Undo step
+                self._step(group, 1.0)
 
-                    # Backward difference
-                    self.J[:, i] = (self.y_base - self.y)/fd_step
+            #--------------------
+            # Central difference
+            #--------------------
+            elif form == 'central':
 
-                    # Undo step
-                    self.set_value(src, fd_step, i1, i2, i)
+                # Forward Step
+                self._step(group, 1.0)
 
-                #--------------------
-                # Central difference
-                #--------------------
-                elif form == 'central':
+                self.pa.run(ffd_order=1)
+                self.get_outputs(self.y)
 
-                    # Forward Step
-                    self.set_value(src, fd_step, i1, i2, i)
+                # Backward Step
+                self._step(group, -2.0)
 
-                    self.pa.run(ffd_order=1)
-                    self.get_outputs(self.y)
+                self.pa.run(ffd_order=1)
+                self.get_outputs(self.y2)
 
-                    # Backward Step
-                    self.set_value(src, -2.0*fd_step, i1, i2, i)
-
-                    self.pa.run(ffd_order=1)
-                    self.get_outputs(self.y2)
+                # Central difference
+                self._set_columns(group, (self.y - self.y2)/2.0)
 
-                    # Central difference
-                    self.J[:, i] = (self.y - self.y2)/(2.0*fd_step)
+                # Undo step
+                self._step(group, 1.0)
 
-                    # Undo step
-                    self.set_value(src, fd_step, i1, i2, i)
+            #--------------------
+            # Complex Step
+            #--------------------
+            elif form == 'complex_step':
 
-                #--------------------
-                # Complex Step
-                #--------------------
-                elif form == 'complex_step':
+                yc = zeros(len(self.y), dtype=complex128)
 
-                    complex_step = fd_step*1j
-                    yc = zeros(len(self.y), dtype=complex128)
+                # Array inputs must hold complex values to take the step.
+                saved = promote_complex(self.scope, self._group_srcs(group))
 
-                    # Step
-                    self.set_value(src, complex_step, i1, i2, i)
+                # Step
+                self._step(group, 1j)
 
-                    self.pa.run(ffd_order=1)
-                    self.get_outputs(yc)
+                self.pa.run(ffd_order=1)
+                self.get_outputs(yc)
 
-                    # Forward difference
-                    self.J[:, i] = (yc/fd_step).imag
+                # Forward difference
+                self._set_columns(group, yc.imag)
+
+                # Undo step
+                self._step(group, -1j, undo_complex=True)
+                for path, val in saved:
+                    self.scope.set(path, val, force=True)
+
+        # Full passes at the first few distinct points give us the sparsity
+        # pattern for later calls, so a derivative that happens to vanish at
+        # one of them is still kept. Entries that are tiny compared to the
+        # rest of their row are roundoff.
+        if probing:
+            row_max = abs(self.J).max(axis=1).reshape((-1, 1))
+            pattern = abs(self.J) > self.sparsity_threshold*row_max
+            if self.sparsity is None:
+                self.sparsity = pattern
+            else:
+                self.sparsity |= pattern
 
-                    # Undo step
-                    self.set_value(src, -fd_step, i1, i2, i, undo_complex=True)
+            point = [self.get_value(step[1], step[2], step[3], step[4])
+                     for step in steps]
+            if point not in self._probed:
+                self._probed.append(point)
 
         # Return outputs to a clean state.
         for src in self.outputs:
@@ -306,18 +480,471 @@ class FiniteDifference(object):
         #print 'after FD', self.pa.name, self.J
         return self.J
 
-    def get_outputs(self, x):
-        """Return matrix of flattened values from output edges."""
+    def _get_steps(self):
+        """Return a list of (j, src, i1, i2, i, form, fd_step) tuples, one
+        for each column of the Jacobian."""
+
+        steps = []
+        for j, src, in enumerate(self.inputs):
+
+            # Users can customize the FD per variable
+            if j in self.form_custom:
+                form = self.form_custom[j]
+            else:
+                form = self.form
+            if j in self.step_type_custom:
+                step_type = self.step_type_custom[j]
+            else:
+                step_type = self.step_type
+
+            if isinstance(src, basestring):
+                i1, i2 = self.in_bounds[src]
+            else:
+                i1, i2 = self.in_bounds[src[0]]
+
+            # Complex step is only used on array inputs if our components
+            # say they can carry the complex values through.
+            if form == 'complex_step' and self.complex_safe is not True:
+                if self.complex_safe is False or _is_array(self.scope, src):
+                    form = 'central'
+
+            for i in range(i1, i2):
+
+                # Relative stepsizing
+                fd_step = self.fd_step[j]
+                current_val = self.get_value(src, i1, i2, i)
+                if step_type == 'relative':
+                    if current_val > self.relative_threshold:
+                        fd_step = fd_step*current_val
+
+                # Switch to forward if we get near the low boundary
+                if self.low[j] is not None:
+                    if isinstance(self.low[j], (list, ndarray)):
+                        bound_val = self.low[j][i]
+                    else:
+                        bound_val = self.low[j]
+                    if current_val - fd_step < bound_val:
+                        form = 'forward'
+
+                # Switch to backward if we get near the high boundary
+                if self.high[j] is not None:
+                    if isinstance(self.high[j], (list, ndarray)):
+                        bound_val = self.high[j][i]
+                    else:
+                        bound_val = self.high[j]
+                    if current_val + fd_step > bound_val:
+                        form = 'backward'
+
+                steps.append((j, src, i1, i2, i, form, fd_step))
+
+        return steps
+
+    def _get_groups(self, steps):
+        """Return the steps divided into groups of columns that don't share
+        any nonzero rows in our sparsity pattern, so that each group can be
+        evaluated with a single perturbation."""
+
+        forms = {}
+        for step in steps:
+            forms.setdefault(step[5], []).append(step)
+
+        groups = []
+        for form_steps in forms.values():
+            cols = [step[4] for step in form_steps]
+            for colors in color_columns(self.sparsity[:, cols]):
+                groups.append([form_steps[k] for k in colors])
+
+        return groups
+
+    def _declared_sparsity(self):
+        """Return the sparsity pattern of our Jacobian implied by the
+        connections between our components and their declared derivative
+        variables. Every element of a connected variable is assumed to be
+        nonzero. Returns None if there are drivers among our components."""
+
+        graph = self.pa._depgraph
+        for name in self.pa.comps:
+            if has_interface(self.scope.get(name), IDriver):
+                return None
+
+        sparsity = zeros(self.J.shape, dtype=bool)
+        for srcs in self.inputs:
+
+            # Support for parameter groups
+            if isinstance(srcs, basestring):
+                srcs = [srcs]
+
+            i1, i2 = self.in_bounds[srcs[0]]
+            bases = [graph.base_var(src) for src in srcs]
+            if not all([base in graph for base in bases]):
+                sparsity[:, i1:i2] = True
+                continue
+
+            reached = set()
+            for base in bases:
+                reached.update(self._downstream(graph, base))
+
+            for src in self.outputs:
+                if src in reached or graph.base_var(src) in reached or \
+                   graph.base_var(src) not in graph:
+                    o1, o2 = self.out_bounds[src]
+                    sparsity[o1:o2, i1:i2] = True
+
+        return sparsity
+
+    def _downstream(self, graph, node):
+        """Return the set of nodes in graph that can be affected by node.
+        Inputs and outputs left out of a component's list_deriv_vars are
+        not followed."""
+
+        from openmdao.main.depgraph import is_comp_node
+
+        reached = set([node])
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            for succ in graph.successors(node):
+                if succ in reached:
+                    continue
+                if is_comp_node(graph, succ):
+                    ins, outs = self._deriv_vars(succ)
+                    if ins and node.partition('.')[2] not in ins:
+                        continue
+                elif is_comp_node(graph, node):
+                    ins, outs = self._deriv_vars(node)
+                    if outs and succ.partition('.')[2] not in outs:
+                        continue
+                reached.add(succ)
+                stack.append(succ)
+
+        return reached
+
+    def _deriv_vars(self, cname):
+        """Return the derivative inputs and outputs declared by the named
+        component, or empty tuples if it doesn't declare any."""
+
+        comp = self.scope.get(cname)
+        if not hasattr(comp, 'list_deriv_vars'):
+            return (), ()
+        return comp.list_deriv_vars()
+
+    def _group_srcs(self, group):
+        """Return a list of all sources perturbed by the columns in
+        group."""
+
+        srcs = []
+        for step in group:
+            if isinstance(step[1], basestring):
+                srcs.append(step[1])
+            else:
+                srcs.extend(step[1])
+        return srcs
+
+    def _step(self, group, scale, undo_complex=False):
+        """Perturb each column in group by scale times its stepsize."""
+
+        for j, src, i1, i2, i, form, fd_step in group:
+            self.set_value(src, scale*fd_step, i1, i2, i,
+                           undo_complex=undo_complex)
+
+    def _set_columns(self, group, delta):
+        """Fill in the Jacobian columns for group from the change in the
+        outputs, which is divided by each column's stepsize. When several
+        columns were perturbed together, each one only takes the rows in
+        its sparsity pattern."""
+
+        for j, src, i1, i2, i, form, fd_step in group:
+            if len(group) > 1:
+                self.J[:, i] = where(self.sparsity[:, i], delta/fd_step, 0.0)
+            else:
+                self.J[:, i] = delta/fd_step
+
+    def _calculate_concurrent(self, groups):
+        """Evaluate the perturbed models for the given groups on servers
+        obtained from the ResourceAllocationManager, filling in the
+        corresponding columns of the Jacobian. Returns the groups that must
+        still be evaluated in this process.
+
+        The servers and their loaded models are kept for the next call.
+        Values which have changed since the model was replicated are sent
+        to the kept models, and the model is only replicated again if its
+        structure has changed."""
+
+        # Each perturbed evaluation is a case keyed on (group, direction).
+        cases = []
+        local = []
+        for n, group in enumerate(groups):
+            form = group[0][5]
+            if form == 'complex_step':
+                continue
+            if form in ('forward', 'central'):
+                cases.append(((n, 1), self._get_case(group, 1.0)))
+            if form in ('backward', 'central'):
+                cases.append(((n, -1), self._get_case(group, -1.0)))
+
+        resources = {'python_version': sys.version[:3]}
+        n_servers = min(self.fd_servers, len(cases),
+                        RAM.max_servers(resources))
+        if n_servers < 2:
+            return groups
+
+        # If only local host will be used, we can skip determining
+        # distributions required by the egg.
+        need_reqs = False
+        for allocator in RAM.list_allocators():
+            if not isinstance(allocator, LocalAllocator):
+                need_reqs = True
+                break
+
+        signature, values = self._model_state(need_reqs)
+        pool = self._pool
+        if pool is not None and signature != pool.signature:
+            logger.debug('FD model structure changed, replicating model')
+            self.release_servers()
+            pool = None
+
+        if pool is None:
+            pool = self._replicate(signature, values, need_reqs)
+            patch = []
+        else:
+            patch = [(path, value) for path, value in sorted(values.items())
+                     if not _same_value(value, pool.values[path])]
+            pool.values = values
+
+            # Kept servers we won't use this time would miss the patch.
+            for entry in pool.servers[n_servers:]:
+                pool.remove(entry)
+
+        case_q = Queue.Queue()
+        for case in cases:
+            case_q.put(case)
+        results = {}
+
+        credentials = get_credentials()
+        threads = []
+        try:
+            for n in range(n_servers):
+                if n < len(pool.servers):
+                    entry = pool.servers[n]
+                else:
+                    entry = None
+                server_thread = threading.Thread(target=self._service_loop,
+                                                 args=(pool, entry, patch,
+                                                       credentials, case_q,
+                                                       results))
+                server_thread.daemon = True
+                server_thread.start()
+                threads.append(server_thread)
+        finally:
+            for server_thread in threads:
+                server_thread.join()
+
+        # Assemble the columns. Anything the servers didn't complete is
+        # evaluated here.
+        for n, group in enumerate(groups):
+            form = group[0][5]
+            if form == 'forward' and (n, 1) in results:
+                self._set_columns(group, results[(n, 1)] - self.y_base)
+            elif form == 'backward' and (n, -1) in results:
+                self._set_columns(group, self.y_base - results[(n, -1)])
+            elif form == 'central' and (n, 1) in results and \
+                 (n, -1) in results:
+                self._set_columns(group,
+                                  (results[(n, 1)] - results[(n, -1)])/2.0)
+            else:
+                local.append(group)
+
+        return local
+
+    def _replicate(self, signature, values, need_reqs):
+        """Save a copy of the model, with a driver that only runs our
+        components, to an egg. Returns a new :class:`_ServerPool` for it."""
+
+        from openmdao.main.driver import Driver
+
+        replicant = self.scope.copy()
+        driver = replicant.add('driver', Driver())
+        driver.workflow.add(self._replicant_comps())
+        version = 'replicant.%d' % next(_REPLICANTS)
+        egg_info = replicant.save_to_egg('fd', version,
+                                         need_requirements=need_reqs)
+        replicant = driver = None  # Release objects.
+        gc.collect()  # Collect/compact before possible fork.
+
+        resources = {'python_version': sys.version[:3],
+                     'required_distributions': egg_info[1],
+                     'orphan_modules': [name for name, path in egg_info[2]]}
+        self._pool = _ServerPool(os.path.abspath(egg_info[0]), resources,
+                                 signature, values)
+        return self._pool
+
+    def _replicant_comps(self):
+        """Return names of the components run by the replicated model."""
+        return [name for name in self.pa.itercomps
+                if not name.startswith('_pseudo_')]
+
+    def _model_state(self, need_reqs):
+        """Return ``(signature, values)`` describing the parts of the model
+        used by the replicated model. `signature` describes the model
+        structure, and `values` holds copies of the sources of our
+        components' connected inputs and of their unconnected inputs, keyed
+        by path."""
+
+        scope = self.scope
+        graph = scope._depgraph
+        names = self._replicant_comps()
+
+        values = {}
+        for name in names:
+            for path in graph.list_inputs(name, connected=True):
+                for src in graph.get_sources(path):
+                    src = graph.base_var(src)
+                    if src.split('.')[0] not in names:
+                        values[src] = _model_value(scope, src)
+            for path in graph.list_inputs(name, connected=False):
+                values[path] = _model_value(scope, path)
+            comp = getattr(scope, name)
+            if has_interface(comp, IAssembly):
+                _assembly_inputs(comp, name+'.', values)
+
+        signature = (names, sorted(graph.list_connections()),
+                     sorted(values), need_reqs)
+
+        # Values which can't be copied can't be sent to the kept models.
+        values = dict([(path, value) for path, value in values.items()
+                       if value is not _UNKNOWN])
+        return (signature, values)
+
+    def release_servers(self):
+        """Release servers kept for concurrent evaluation, and remove the egg
+        file of the replicated model."""
+        pool = self._pool
+        self._pool = None
+        if pool is not None:
+            pool.release()
+
+    def _get_case(self, group, scale):
+        """Return a tuple of (inputs, restore) lists of (path, value) pairs
+        that perturb each column in group by scale times its stepsize and
+        then return the model to its current state. The model in this
+        process is not modified."""
+
+        values = {}
+        restore = []
+        for j, srcs, i1, i2, index, form, fd_step in group:
+
+            # Support for Parameter Groups:
+            if isinstance(srcs, basestring):
+                srcs = [srcs]
+
+            val = scale*fd_step
+            for src in srcs:
+                base_src, _, idx = src.partition('[')
+                if base_src not in values:
+                    old_val = self.scope.get(base_src)
+                    restore.append((base_src, old_val))
+                    if isinstance(old_val, ndarray):
+                        old_val = old_val.copy()
+                    values[base_src] = old_val
+
+                new_val = values[base_src]
+                if isinstance(new_val, ndarray):
+                    if idx:
+                        exec('sub_val = new_val[%s' % idx)
+                        if isinstance(sub_val, ndarray):
+                            sub_val = sub_val.copy()
+                            sub_val.flat[index-i1] += val
+                        else:
+                            sub_val += val
+                        exec('new_val[%s = sub_val' % idx)
+                    else:
+                        new_val.flat[index-i1] += val
+                else:
+                    values[base_src] = new_val + val
+
+        inputs = [(path, values[path]) for path, old_val in restore]
+        return inputs, restore
+
+    def _service_loop(self, pool, entry, patch, credentials, case_q,
+                      results):
+        """ Each server has an associated thread executing this. `entry` is
+        a ``(server, server_info, tlo)`` tuple for a server kept in `pool`,
+        or None to allocate a new server. """
+        set_credentials(credentials)
+
+        if entry is None:
+            try:
+                server, server_info = RAM.allocate(pool.resources)
+            except Exception as exc:
+                logger.warning('FD server allocation failed: %s', exc)
+                return
+            if server is None:
+                return
+
+            try:
+                egg_file = os.path.basename(pool.egg_file)
+                filexfer(None, pool.egg_file, server, egg_file, 'b')
+                tlo = server.load_model(egg_file)
+            except Exception as exc:
+                logger.error('FD server %r failed: %s',
+                             server_info['name'], exc)
+                RAM.release(server)
+                return
+            entry = (server, server_info, tlo)
+            pool.add(entry)
+        else:
+            server, server_info, tlo = entry
+            try:
+                for path, val in patch:
+                    tlo.set(path, val, force=True)
+            except Exception as exc:
+                logger.error('FD server %r update of %r failed: %s',
+                             server_info['name'], path, exc)
+                pool.remove(entry)
+                return
+
+        while True:
+            try:
+                key, (inputs, restore) = case_q.get_nowait()
+            except Queue.Empty:
+                break
+
+            try:
+                for path, val in inputs:
+                    tlo.set(path, val, force=True)
+                tlo.run()
+
+                y = zeros(self.y.shape)
+                self.get_outputs(y, tlo)
+
+                for path, val in restore:
+                    tlo.set(path, val, force=True)
+            except Exception as exc:
+                # The case will be evaluated locally instead, and the server
+                # isn't trusted to be at the base point any more.
+                logger.error('FD step %s on %r failed: %s', key,
+                             server_info['name'], exc)
+                pool.remove(entry)
+                break
+            else:
+                results[key] = y
+
+    def get_outputs(self, x, scope=None):
+        """Return matrix of flattened values from output edges. Values are
+        taken from `scope` if given, otherwise from our own scope."""
+
+        if scope is None:
+            scope = self.scope
 
         for src in self.outputs:
 
             # Speedhack: getting an indexed var in OpenMDAO is slow
             if '[' in src:
                 basekey, _, index = src.partition('[')
-                base = self.scope.get(basekey)
+                base = scope.get(basekey)
                 exec("src_val = base[%s" % index)
             else:
-                src_val = self.scope.get(src)
+                src_val = scope.get(src)
 
             src_val = flattened_value(src, src_val)
             i1, i2 = self.out_bounds[src]
@@ -484,6 +1111,15 @@ class DirectionalFD(object):
         fd_step = options.fd_step
         form = options.fd_form
 
+        # Complex step is only used on array inputs if our components say
+        # they can carry the complex values through.
+        if form == 'complex_step':
+            safe = complex_step_safe(self.scope, self.pa.comps)
+            if safe is False or (safe is None and
+                                 any([_is_array(self.scope, src)
+                                      for src in self.inputs])):
+                form = 'central'
+
         #--------------------
         # Forward difference
         #--------------------
@@ -549,6 +1185,15 @@ class DirectionalFD(object):
             complex_step = fd_step*1j
             yc = zeros(len(self.y), dtype=complex128)
 
+            # Array inputs must hold complex values to take the step.
+            srcs = []
+            for src in self.inputs:
+                if isinstance(src, basestring):
+                    srcs.append(src)
+                else:
+                    srcs.extend(src)
+            saved = promote_complex(self.scope, srcs)
+
             # Step
             self.set_value(complex_step, arg)
 
@@ -559,7 +1204,9 @@ class DirectionalFD(object):
             mv_prod = (yc/fd_step).imag
 
             # Undo step
-            self.set_value(-fd_step, arg, undo_complex=True)
+            self.set_value(-complex_step, arg, undo_complex=True)
+            for path, val in saved:
+                self.scope.set(path, val, force=True)
 
         # Return outputs to a clean state.
         for j, src in enumerate(self.outputs):
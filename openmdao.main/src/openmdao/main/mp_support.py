@@ -15,7 +15,9 @@ is used between the Proxy and Server:
    is quicker than public/private key encryption).
 
 If `authkey` is not 'PublicKey', then the above session protocol is not used,
-and channel data is in the clear.
+and channel data is in the clear. In this case large numeric arrays are sent
+as raw buffers rather than being pickled, or via shared memory if the Proxy
+and Server are on the same host, see :meth:`send_message`.
 
 Public methods of an object are determined by a role-based access control
 attribute associated with the method. The server will verify that the current
@@ -61,9 +63,10 @@ if sys.platform == 'win32':  #pragma no cover
 from traits.trait_handlers import TraitDictObject
 
 from openmdao.main.interfaces import obj_has_interface
-from openmdao.main.mp_util import decrypt, encrypt, is_legal_connection, \
+from openmdao.main.mp_util import answer_shared_request, is_legal_connection, \
                                   keytype, make_typeid, public_methods, \
-                                  tunnel_address, SPECIALS
+                                  request_shared_memory, send_message, \
+                                  tunnel_address, unpack_message, SPECIALS
 from openmdao.main.rbac import AccessController, RoleError, check_role, \
                                need_proxy, Credentials, \
                                get_credentials, set_credentials
@@ -388,7 +391,6 @@ class OpenMDAO_Server(Server):
         self._logger.log(LOG_DEBUG2, 'starting server thread to service %r, %s',
                          threading.current_thread().name, keytype(self._authkey))
         recv = conn.recv
-        send = conn.send
         id_to_obj = self.id_to_obj
         id_to_controller = self._id_to_controller
 
@@ -397,6 +399,7 @@ class OpenMDAO_Server(Server):
         else:
             client_key = ''
             session_key = ''
+        shared = False  # Set if client is on this host.
 
         while not self.stop:
 
@@ -404,8 +407,13 @@ class OpenMDAO_Server(Server):
                 ident = methodname = args = kwds = credentials = None
                 obj = exposed = gettypeid = None
                 data = recv()
+                if not session_key:
+                    reply = answer_shared_request(data, conn)
+                    if reply is not None:
+                        shared = reply
+                        continue
                 try:
-                    request = decrypt(data, session_key)
+                    request = unpack_message(data, conn, session_key)
                 except Exception as exc:
                     trace = traceback.format_exc()
                     msg = "Can't decrypt/unpack request. This could be the" \
@@ -524,9 +532,10 @@ class OpenMDAO_Server(Server):
 
             try:
                 try:
-                    send(encrypt(msg, session_key))
+                    send_message(conn, msg, session_key, shared)
                 except Exception:
-                    send(encrypt(('#UNSERIALIZABLE', repr(msg)), session_key))
+                    send_message(conn, ('#UNSERIALIZABLE', repr(msg)),
+                                 session_key)
             # Just being defensive, this should never happen.
             except Exception as exc: #pragma no cover
                 self._logger.error('exception in thread serving %r',
@@ -1262,8 +1271,10 @@ class OpenMDAO_Proxy(BaseProxy):
             conn = self._tls.connection
             if self._authkey == 'PublicKey':
                 self._init_session(conn)
+                self._tls.shared = False
             else:
                 self._tls.session_key = ''
+                self._tls.shared = request_shared_memory(conn)
 
         session_key = self._tls.session_key
 
@@ -1281,15 +1292,16 @@ class OpenMDAO_Proxy(BaseProxy):
                 new_args.append(arg)
 
         try:
-            conn.send(encrypt((self._id, methodname, new_args, kwds,
-                               get_credentials().encode()), session_key))
+            send_message(conn, (self._id, methodname, new_args, kwds,
+                                get_credentials().encode()), session_key,
+                         self._tls.shared)
         except IOError as exc:
             msg = "Can't send to server at %r for %r: %r" \
                   % (self._token.address, methodname, exc)
             logging.error(msg)
             raise RuntimeError(msg)
 
-        kind, result = decrypt(conn.recv(), session_key)
+        kind, result = unpack_message(conn.recv(), conn, session_key)
 
         if kind == '#RETURN':
             return result
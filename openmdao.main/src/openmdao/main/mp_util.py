@@ -5,18 +5,24 @@ Multiprocessing support utilities.
 import ConfigParser
 import copy
 import cPickle
+import cStringIO
 import errno
 import getpass
 import inspect
 import logging
+import mmap
 import os.path
 import re
 import socket
+import stat
 import sys
+import tempfile
 import time
 
 from Crypto.Cipher import AES
 
+from numpy import empty, frombuffer, ndarray
+
 from multiprocessing import current_process, connection
 from multiprocessing.managers import BaseProxy
 
@@ -29,6 +35,21 @@ from openmdao.util.shellproc import ShellProc, STDOUT, PIPE
 # Names of attribute access methods requiring special handling.
 SPECIALS = ('__getattribute__', '__getattr__', '__setattr__', '__delattr__')
 
+# Arrays at least this size are sent as raw buffers on unencrypted channels.
+_MIN_BUFFER_SIZE = 1 << 16
+
+# Maximum size of a single raw buffer message.
+_BUFFER_CHUNK = 1 << 26
+
+# Directory for files used to pass arrays via shared memory.
+_SHARED_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+# Alignment of arrays within a shared memory file.
+_SHARED_ALIGN = 64
+
+# Prefix of the names of shared memory files.
+_SHARED_PREFIX = 'omdao-'
+
 
 # Mapping from remote addresses to local tunnel addresses.
 _TUNNEL_MAP = {}
@@ -422,6 +443,269 @@ def decrypt(msg, session_key):
         return msg
 
 
+def is_local_connection(conn):
+    """
+    Returns True if `conn` appears to be a socket connection to a process
+    on this host. Tunneled connections also appear local, so this is only a
+    hint, see :meth:`request_shared_memory`.
+
+    conn: :class:`multiprocessing.connection.Connection`
+        Connection to check.
+    """
+    try:
+        sock = socket.fromfd(conn.fileno(), socket.AF_INET, socket.SOCK_STREAM)
+    # Not supported on Windows.
+    except Exception:  #pragma no cover
+        return False
+    try:
+        local = sock.getsockname()
+        peer = sock.getpeername()
+    # Just being defensive, this should never happen.
+    except socket.error:  #pragma no cover
+        return False
+    finally:
+        sock.close()
+
+    if isinstance(peer, basestring):  # AF_UNIX
+        return True
+    return peer[0] == local[0]
+
+
+def request_shared_memory(conn):
+    """
+    Returns True if the process at the other end of `conn` can access files
+    in the shared memory directory created by this process. The other end
+    must reply using :meth:`answer_shared_request`.
+
+    conn: :class:`multiprocessing.connection.Connection`
+        Connection to check.
+    """
+    if _SHARED_DIR is None or not is_local_connection(conn):
+        return False
+
+    token = os.urandom(16).encode('hex')
+    try:
+        fd, path = tempfile.mkstemp(prefix=_SHARED_PREFIX, dir=_SHARED_DIR)
+    # Just being defensive, this should never happen.
+    except OSError:  #pragma no cover
+        return False
+    try:
+        os.write(fd, token)
+        os.close(fd)
+        conn.send(('#SHARED_REQUEST', path, token))
+        return conn.recv() is True
+    finally:
+        os.remove(path)
+
+
+def answer_shared_request(msg, conn):
+    """
+    If `msg` is from :meth:`request_shared_memory`, reply on `conn` and
+    return True if shared memory may be used, else False. Returns None if
+    `msg` is something else.
+
+    msg: object
+        Message received from `conn`.
+
+    conn: :class:`multiprocessing.connection.Connection`
+        Connection `msg` was received on.
+    """
+    if type(msg) is not tuple or len(msg) != 3 or \
+       msg[0] != '#SHARED_REQUEST':
+        return None
+
+    path, token = msg[1:]
+    shared = False
+    if _is_shared_file(path) and isinstance(token, str):
+        try:
+            with open(path, 'rb') as inp:
+                shared = inp.read(len(token)+1) == token
+        except IOError:  # Different host or user.
+            pass
+    conn.send(shared)
+    return shared
+
+
+def _is_shared_file(path):
+    """
+    Returns True if `path` is a regular file in the shared memory directory
+    with a name as created by this module. Paths received from the other
+    end of a connection are checked before being opened or removed.
+    """
+    if _SHARED_DIR is None or not isinstance(path, basestring) or \
+       os.path.dirname(path) != _SHARED_DIR or \
+       not os.path.basename(path).startswith(_SHARED_PREFIX):
+        return False
+    try:
+        return stat.S_ISREG(os.lstat(path).st_mode)
+    except OSError:
+        return False
+
+
+def send_message(conn, obj, session_key, shared=False):
+    """
+    Send `obj` on `conn`. If `session_key` is specified, `obj` is encrypted
+    (see :meth:`encrypt`). Otherwise any large contiguous numeric arrays
+    in `obj` are sent separately from the header containing the remainder
+    of `obj`, avoiding copies of the array data. If `shared` is True the
+    arrays are written to a shared memory file which the receiver maps,
+    otherwise they are sent on `conn` as raw buffers.
+
+    conn: :class:`multiprocessing.connection.Connection`
+        Connection to send on.
+
+    obj: object
+        Object to be sent.
+
+    session_key: string
+        Key used for encryption.
+
+    shared: bool
+        If True, the receiver is on this host,
+        see :meth:`request_shared_memory`.
+    """
+    if session_key:
+        conn.send(encrypt(obj, session_key))
+        return
+
+    buffers = []
+    specs = []
+    pids = {}
+    def persistent_id(item):
+        if type(item) is not ndarray or item.nbytes < _MIN_BUFFER_SIZE or \
+           item.dtype.hasobject:
+            return None
+        try:
+            return pids[id(item)]
+        except KeyError:
+            pass
+        if item.flags.c_contiguous:
+            buffers.append(item)
+            specs.append((item.dtype, item.shape, False))
+        elif item.flags.f_contiguous:
+            buffers.append(item.T)
+            specs.append((item.dtype, item.shape, True))
+        else:
+            return None
+        pid = pids[id(item)] = len(buffers) - 1
+        return pid
+
+    stream = cStringIO.StringIO()
+    pickler = cPickle.Pickler(stream, cPickle.HIGHEST_PROTOCOL)
+    pickler.inst_persistent_id = persistent_id  # Not called for basic types.
+    pickler.dump(obj)
+    if not buffers:
+        conn.send_bytes(stream.getvalue())  # Same as conn.send(obj).
+        return
+
+    if shared:
+        _send_shared(conn, stream.getvalue(), buffers, specs)
+        return
+
+    conn.send(('#BUFFERS', stream.getvalue(), specs))
+    for data in buffers:
+        nbytes = data.nbytes
+        for offset in range(0, nbytes, _BUFFER_CHUNK):
+            conn.send_bytes(data, offset, min(_BUFFER_CHUNK, nbytes - offset))
+
+
+def unpack_message(msg, conn, session_key):
+    """
+    Returns object from `msg` received on `conn`. If `session_key` is
+    specified, `msg` is decrypted (see :meth:`decrypt`). Otherwise any raw
+    array buffers sent by :meth:`send_message` are received from `conn`
+    directly into the arrays returned, or arrays sent via shared memory are
+    returned as views of the mapped file.
+
+    msg: object
+        Message received from `conn`.
+
+    conn: :class:`multiprocessing.connection.Connection`
+        Connection `msg` was received on.
+
+    session_key: string
+        Key used for encryption.
+    """
+    if session_key:
+        return decrypt(msg, session_key)
+
+    if type(msg) is not tuple or len(msg) < 3:
+        return msg
+    if msg[0] == '#SHARED' and len(msg) == 4:
+        return _unpack_shared(msg[1], msg[2], msg[3])
+    if msg[0] != '#BUFFERS' or len(msg) != 3:
+        return msg
+
+    arrays = []
+    for dtype, shape, fortran in msg[2]:
+        if fortran:
+            array = empty(shape[::-1], dtype).T
+            data = array.T
+        else:
+            array = data = empty(shape, dtype)
+        arrays.append(array)
+        nbytes = data.nbytes
+        offset = 0
+        while offset < nbytes:
+            offset += conn.recv_bytes_into(data, offset)
+
+    unpickler = cPickle.Unpickler(cStringIO.StringIO(msg[1]))
+    unpickler.persistent_load = arrays.__getitem__
+    return unpickler.load()
+
+
+def _send_shared(conn, text, buffers, specs):
+    """ Write `buffers` to a shared memory file and send header on `conn`. """
+    fd, path = tempfile.mkstemp(prefix=_SHARED_PREFIX, dir=_SHARED_DIR)
+    sent = False
+    try:
+        shared_specs = []
+        offset = 0
+        with os.fdopen(fd, 'wb') as out:
+            for data, spec in zip(buffers, specs):
+                pad = -offset % _SHARED_ALIGN
+                if pad:
+                    out.write('\0' * pad)
+                    offset += pad
+                shared_specs.append(spec + (offset,))
+                data.tofile(out)
+                offset += data.nbytes
+        conn.send(('#SHARED', text, path, shared_specs))
+        sent = True
+    finally:
+        if not sent:  # The receiver won't remove it.
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _unpack_shared(text, path, specs):
+    """ Return object from `text` with arrays mapped from file `path`. """
+    if not _is_shared_file(path):
+        raise RuntimeError('Invalid shared memory file %r' % (path,))
+    try:
+        with open(path, 'r+b') as inp:
+            # Private mapping, received arrays may be modified.
+            data = mmap.mmap(inp.fileno(), 0, access=mmap.ACCESS_COPY)
+    finally:
+        os.remove(path)
+
+    arrays = []
+    for dtype, shape, fortran, offset in specs:
+        count = reduce(lambda x, y: x * y, shape, 1)
+        array = frombuffer(data, dtype, count, offset)
+        if fortran:
+            array = array.reshape(shape[::-1]).T
+        else:
+            array = array.reshape(shape)
+        arrays.append(array)
+
+    unpickler = cPickle.Unpickler(cStringIO.StringIO(text))
+    unpickler.persistent_load = arrays.__getitem__
+    return unpickler.load()
+
+
 def public_methods(obj):
     """
     Returns a list of names of the methods of `obj` to be exposed.
@@ -0,0 +1,170 @@
+""" A workflow where components that don't depend on each other are
+run concurrently."""
+
+import Queue
+import sys
+import threading
+
+from openmdao.main.dataflow import Dataflow
+from openmdao.main.exceptions import RunStopped
+from openmdao.main.interfaces import IAssembly, IDriver
+from openmdao.main.mp_support import has_interface
+from openmdao.main.pseudocomp import PseudoComponent
+from openmdao.main.publisher import Publisher
+from openmdao.main.rbac import get_credentials, set_credentials
+
+__all__ = ['ParallelWorkflow']
+
+
+class ParallelWorkflow(Dataflow):
+    """
+    A Dataflow whose Components are grouped into levels, where no Component
+    depends on another in the same level. The inputs of all Components in a
+    level are updated, and then the Components are run concurrently in
+    threads.
+
+    Running in threads pays off for Components that spend their time
+    outside of the Python interpreter, such as external codes or numerical
+    libraries that release the GIL.
+
+    Only the running itself is done in threads. Inputs are updated and
+    iteration coordinates are set for the whole level beforehand, in this
+    thread. A threaded Component must only change its own variables while
+    it runs, and not those of its parent or of other Components. Components
+    that can't keep to that are run one at a time after the rest of their
+    level: Assemblies and Drivers, which run workflows of their own and
+    record cases, PseudoComponents, and Components that have a `directory`,
+    which change the working directory of the whole process while they run.
+    If a Publisher is active, everything is run one at a time.
+    """
+
+    def __init__(self, parent=None, members=None, max_threads=None):
+        """ Create an empty flow.
+
+        max_threads: int (optional)
+            The maximum number of Components to run at the same time.
+            The default is to run all Components of a level at once.
+        """
+        super(ParallelWorkflow, self).__init__(parent, members)
+        self.max_threads = max_threads
+
+    def config_changed(self):
+        """Notifies the Workflow that its configuration (dependencies, etc.)
+        has changed.
+        """
+        super(ParallelWorkflow, self).config_changed()
+        self._levels = None
+
+    def get_levels(self):
+        """Return a list of lists of Component names, in the order they
+        will run. Components only depend on Components in earlier lists.
+        """
+        if self._levels is None:
+            graph = self._get_data_graph()
+            latest = {}
+            levels = []
+            for name in self._get_topsort():
+                # A Component that occurs more than once in the workflow
+                # must not run concurrently with itself.
+                level = latest.get(name, -1) + 1
+                for pred in graph.predecessors(name):
+                    if pred in latest:
+                        level = max(level, latest[pred] + 1)
+                latest[name] = level
+                if level == len(levels):
+                    levels.append([])
+                levels[level].append(name)
+            self._levels = levels
+        return [level[:] for level in self._levels]
+
+    def _run_components(self, iterbase, ffd_order, case_uuid):
+        """Run each level of our Components."""
+        scope = self.scope
+        for level in self.get_levels():
+            comps = [getattr(scope, name) for name in level]
+            for comp in comps:
+                scope.update_inputs(comp.name, graph=self._var_graph)
+
+            threaded = []
+            serial = []
+            for comp in comps:
+                if self._threadable(comp):
+                    threaded.append(comp)
+                else:
+                    serial.append(comp)
+
+            if len(threaded) > 1:
+                for comp in threaded:
+                    comp.set_itername('%s-%s' % (iterbase, comp.name))
+                self._run_threaded(threaded, iterbase, ffd_order, case_uuid)
+            else:
+                serial = threaded + serial
+
+            for comp in serial:
+                self._run_component(comp, iterbase, ffd_order, case_uuid)
+                if self._stop:
+                    raise RunStopped('Stop requested')
+
+            if self._stop:
+                raise RunStopped('Stop requested')
+
+    @staticmethod
+    def _threadable(comp):
+        """Return True if `comp` may be run in a thread."""
+        # PseudoComponents are too cheap to be worth a thread.
+        if isinstance(comp, PseudoComponent) or \
+           getattr(comp, 'directory', '') or \
+           has_interface(comp, IAssembly, IDriver):
+            return False
+
+        # Publishing isn't thread safe.
+        return Publisher.get_instance() is None
+
+    def _run_threaded(self, comps, iterbase, ffd_order, case_uuid):
+        """Run the given Components concurrently. If any of them fail, the
+        error from the first failed Component in the list is raised."""
+        comp_q = Queue.Queue()
+        for comp in comps:
+            comp_q.put(comp)
+        errors = {}
+
+        n_threads = len(comps)
+        if self.max_threads:
+            n_threads = min(n_threads, self.max_threads)
+
+        credentials = get_credentials()
+        threads = []
+        try:
+            for i in range(n_threads):
+                thread = threading.Thread(target=self._service_loop,
+                                          args=(credentials, comp_q, errors,
+                                                iterbase, ffd_order,
+                                                case_uuid))
+                thread.daemon = True
+                thread.start()
+                threads.append(thread)
+        finally:
+            for thread in threads:
+                thread.join()
+
+        for comp in comps:
+            if comp.name in errors:
+                err = errors[comp.name]
+                raise err[0], err[1], err[2]
+
+    def _service_loop(self, credentials, comp_q, errors,
+                      iterbase, ffd_order, case_uuid):
+        """ Each thread executes this until there are no more Components to
+        run, a Component fails, or a stop is requested. """
+        set_credentials(credentials)
+
+        while not (errors or self._stop):
+            try:
+                comp = comp_q.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                # Our iteration coordinates have already been set.
+                comp.run(ffd_order=ffd_order, case_uuid=case_uuid)
+            except Exception:
+                errors[comp.name] = sys.exc_info()
@@ -92,6 +92,7 @@ class PseudoComponent(object):
 
         # Flags and caching used by the derivatives calculation
         self.force_fd = False
+        self.complex_step_safe = True
         self._provideJ_bounds = None
 
         self._pseudo_type = pseudo_type  # a string indicating the type of pseudocomp
@@ -476,6 +476,28 @@ class ResourceAllocationManager(object):
             self._logger.error("Can't release %r: %r", server_info['name'], exc)
         server._close.cancel()
 
+    @staticmethod
+    def check_load(server):
+        """
+        Returns False if the host of `server` is currently loaded beyond the
+        limits of the allocator which deployed it, True otherwise.
+        Used to avoid sending more work to a server on an overloaded host.
+
+        server: :class:`OpenMDAO_Proxy`
+            Server returned by :meth:`allocate`.
+        """
+        ram = ResourceAllocationManager._get_instance()
+        return ram._check_load(server)
+
+    def _check_load(self, server):
+        """ Check load on host of `server`. """
+        # No lock, _allocate() may hold it for some time.
+        try:
+            allocator = self._deployed_servers[id(server)][0]
+        except KeyError:
+            return True
+        return allocator.check_load(server)
+
     @staticmethod
     def add_remotes(server, prefix=''):
         """
@@ -949,6 +971,17 @@ class ResourceAllocator(object):
         """
         raise NotImplementedError('release')
 
+    def check_load(self, server):
+        """
+        Return False if the host of `server` is currently loaded beyond the
+        limits of this allocator. Like :meth:`release`, this must be
+        multithread-safe. The default implementation returns True.
+
+        server: :class:`ObjServer`
+            Server previously deployed by this allocator.
+        """
+        return True
+
 
 class FactoryAllocator(ResourceAllocator):
     """
@@ -1245,6 +1278,27 @@ class LocalAllocator(FactoryAllocator):
         else:  #pragma no cover
             return (-1, criteria)  # Try again later.
 
+    @rbac('*')
+    def check_load(self, server):
+        """
+        Returns False if the load average exceeds both `total_cpus` *
+        `max_load` and the number of deployed servers by at least one.
+
+        server: :class:`ObjServer`
+            Server previously deployed by this allocator.
+        """
+        try:
+            loadavgs = os.getloadavg()
+        # Not available on Windows.
+        except AttributeError:  #pragma no cover
+            return True
+
+        limit = max(self.total_cpus * self.max_load,
+                    len(self._deployed_servers))
+        self._logger.debug('loadavgs %.2f, %.2f, %.2f, limit %.2f',
+                           loadavgs[0], loadavgs[1], loadavgs[2], limit)
+        return loadavgs[0] < limit + 1
+
     def check_compatibility(self, resource_desc):
         """
         Check compatibility with resource attributes.
@@ -1337,6 +1391,12 @@ class RemoteAllocator(ResourceAllocator):
         with self._lock:  # Proxies are not thread-safe.
             self._remote.release(server)
 
+    @rbac(('owner', 'user'))
+    def check_load(self, server):
+        """ Check load of a remotely allocated server. """
+        with self._lock:  # Proxies are not thread-safe.
+            return self._remote.check_load(server)
+
 
 # Cluster allocation requires ssh configuration and multiple hosts.
 class ClusterAllocator(ResourceAllocator):  #pragma no cover
@@ -2046,6 +2106,25 @@ class ClusterAllocator(ResourceAllocator):  #pragma no cover
             self._logger.error("Can't release %r: %r", server, exc)
         server._close.cancel()
 
+    def check_load(self, server):
+        """
+        Check load on the host `server` was deployed on.
+
+        server: :class:`OpenMDAO_Proxy`
+            Server previously deployed.
+        """
+        try:
+            host = self._deployed_servers[id(server)][0]
+        except KeyError:
+            self._logger.error('server %r not found', server)
+            return True
+
+        try:
+            return host.allocator.check_load(server)
+        except Exception as exc:
+            self._logger.error("Can't check load for %r: %r", server, exc)
+            return True
+
     def shutdown(self):
         """ Shutdown, releasing resources. """
         if self.cluster is not None:
@@ -12,10 +12,13 @@ from types import NoneType
 from openmdao.main.array_helpers import flattened_size, \
                                         flatten_slice, is_differentiable_val
 from openmdao.main.derivatives import calc_gradient, calc_gradient_adjoint, \
-                                      applyJ, applyJT, applyMinvT
+                                      applyJ, applyJT, applyMinv, applyMinvT, \
+                                      get_bounds, reduce_jacobian
 
 from openmdao.main.exceptions import RunStopped
+from openmdao.main.finite_difference import FiniteDifference
 from openmdao.main.pseudoassembly import PseudoAssembly, to_PA_var, from_PA_var
+from openmdao.main.pseudocomp import PseudoComponent
 from openmdao.main.vartree import VariableTree
 
 from openmdao.main.workflow import Workflow
@@ -30,12 +33,28 @@ from openmdao.util.graph import edges_to_dict, list_deriv_vars, \
 from openmdao.util.decorators import method_accepts
 from openmdao.util.debug import strict_chk_config
 
-from numpy import ndarray, zeros
+from numpy import ndarray, zeros, ones, identity, asarray
+from numpy.linalg import inv, LinAlgError
+from scipy.sparse import coo_matrix
 
 _missing = object()
 
 __all__ = ['SequentialWorkflow']
 
+# Attributes holding the structure used to calculate derivatives. These are
+# saved and restored together for each set of requested inputs and outputs.
+_DERIV_STRUCTURE = ('_derivative_graph', '_edges', '_comp_edges', 'res',
+                    '_bounds_cache', '_shape_cache', '_width_cache')
+
+
+def _freeze(names):
+    """Return a hashable version of a list of variable names, which may
+    contain tuples for parameter groups."""
+    if names is None:
+        return None
+    return tuple([name if isinstance(name, basestring) else tuple(name)
+                  for name in names])
+
 
 class SequentialWorkflow(Workflow):
     """A Workflow that is a simple sequence of components."""
@@ -45,13 +64,15 @@ class SequentialWorkflow(Workflow):
         self._explicit_names = []  # names the user adds
         self._names = None   # names the user adds plus names required
                              # for params, objectives, and constraints
+        self._config_generation = 0
         super(SequentialWorkflow, self).__init__(parent, members)
 
         # Bookkeeping
         self._edges = None
         self._comp_edges = None
         self._derivative_graph = None
-        self._upscoped = False
+        self._deriv_key = None
+        self._deriv_structures = {}
         self._J_cache = {}
         self._bounds_cache = {}
         self._shape_cache = {}
@@ -84,12 +105,15 @@ class SequentialWorkflow(Workflow):
         has changed.
         """
         super(SequentialWorkflow, self).config_changed()
+        self.release_servers()
 
+        self._config_generation += 1
         self._edges = None
         self._comp_edges = None
         self._derivative_graph = None
+        self._deriv_key = None
+        self._deriv_structures = {}
         self.res = None
-        self._upscoped = False
         self._names = None
         self._J_cache = {}
         self._bounds_cache = {}
@@ -98,6 +122,22 @@ class SequentialWorkflow(Workflow):
         self._iternames = None
         self._initnames = None
 
+    def release_servers(self):
+        """Release servers kept for concurrent finite difference by the
+        pseudo-assemblies in our derivative structures."""
+        # Configuration may change before our bookkeeping is initialized.
+        graphs = [getattr(self, '_derivative_graph', None)]
+        graphs.extend([structure['_derivative_graph'] for structure
+                       in getattr(self, '_deriv_structures', {}).values()])
+        for dgraph in graphs:
+            if dgraph is None:
+                continue
+            for node, data in dgraph.nodes_iter(data=True):
+                pa = data.get('pa_object')
+                if pa is not None and \
+                   isinstance(getattr(pa, 'fd', None), FiniteDifference):
+                    pa.fd.release_servers()
+
     def check_config(self, strict=False):
         super(SequentialWorkflow, self).check_config(strict=strict)
         self.get_names()
@@ -502,10 +542,12 @@ class SequentialWorkflow(Workflow):
 
     def matvecFWD(self, arg):
         '''Callback function for performing the matrix vector product of the
-        workflow's full Jacobian with an incoming vector arg.'''
+        workflow's full Jacobian with an incoming vector arg. If arg is 2D,
+        each of its columns is multiplied in a single pass.'''
 
         comps = self._comp_edge_list()
-        result = zeros(len(arg))
+        result = zeros(arg.shape)
+        ncol = arg.shape[1:]
 
         # We can call applyJ on each component one-at-a-time, and poke the
         # results into the result vector.
@@ -538,13 +580,13 @@ class SequentialWorkflow(Workflow):
 
                 if isinstance(i1, list):
                     if varname in comp_residuals:
-                        outputs[varname] = zeros((1, 1))
+                        outputs[varname] = zeros((len(i1),) + ncol)
                     else:
                         inputs[varname] = arg[i1].copy()
                         outputs[varname] = arg[i1].copy()
                 else:
                     if varname in comp_residuals:
-                        outputs[varname] = zeros((i2-i1))
+                        outputs[varname] = zeros((i2-i1,) + ncol)
                     else:
                         inputs[varname] = arg[i1:i2].copy()
                         outputs[varname] = arg[i1:i2].copy()
@@ -554,13 +596,6 @@ class SequentialWorkflow(Workflow):
             else:
                 comp = self.scope.get(compname)
 
-            # Preconditioning
-            # Currently not implemented in forward mode, mostly because this
-            # mode requires post multiplication of the result by the M after
-            # you have the final gradient.
-            #if hasattr(comp, 'applyMinv'):
-                #inputs = applyMinv(comp, inputs, self._shape_cache)
-
             applyJ(comp, inputs, outputs, comp_residuals,
                    self._shape_cache.get(compname), self._J_cache.get(compname))
             #print inputs, outputs
@@ -589,11 +624,13 @@ class SequentialWorkflow(Workflow):
 
     def matvecREV(self, arg):
         '''Callback function for performing the matrix vector product of the
-        workflow's full Jacobian with an incoming vector arg.'''
+        workflow's full Jacobian with an incoming vector arg. If arg is 2D,
+        each of its columns is multiplied in a single pass.'''
 
         dgraph = self._derivative_graph
         comps = self._comp_edge_list()
-        result = zeros(len(arg))
+        result = zeros(arg.shape)
+        ncol = arg.shape[1:]
 
         # We can call applyJ on each component one-at-a-time, and poke the
         # results into the result vector.
@@ -621,12 +658,12 @@ class SequentialWorkflow(Workflow):
                 if isinstance(i1, list):
                     inputs[varname] = arg[i1].copy()
                     if varname not in comp_residuals:
-                        outputs[varname] = zeros(len(i1))
+                        outputs[varname] = zeros((len(i1),) + ncol)
                         out_bounds.append((varname, i1, i2))
                 else:
                     inputs[varname] = arg[i1:i2].copy()
                     if varname not in comp_residuals:
-                        outputs[varname] = zeros(i2-i1)
+                        outputs[varname] = zeros((i2-i1,) + ncol)
                         out_bounds.append((varname, i1, i2))
 
             for varname in comp_inputs:
@@ -634,9 +671,9 @@ class SequentialWorkflow(Workflow):
 
                 i1, i2 = self.get_bounds(node)
                 if isinstance(i1, list):
-                    outputs[varname] = zeros(len(i1))
+                    outputs[varname] = zeros((len(i1),) + ncol)
                 else:
-                    outputs[varname] = zeros(i2-i1)
+                    outputs[varname] = zeros((i2-i1,) + ncol)
                 out_bounds.append((varname, i1, i2))
 
             if '~' in compname:
@@ -644,10 +681,6 @@ class SequentialWorkflow(Workflow):
             else:
                 comp = self.scope.get(compname)
 
-            # Preconditioning
-            if hasattr(comp, 'applyMinvT'):
-                inputs = applyMinvT(comp, inputs, self._shape_cache)
-
             applyJT(comp, inputs, outputs, comp_residuals,
                     self._shape_cache, self._J_cache.get(compname))
             #print inputs, outputs
@@ -670,6 +703,265 @@ class SequentialWorkflow(Workflow):
         #print arg, result
         return result
 
+    def assemble_jacobian(self):
+        """Returns the workflow's full Jacobian (the matrix that matvecFWD
+        multiplies by) as a scipy.sparse CSC matrix, or None if some
+        component in the derivative graph doesn't provide its Jacobian
+        explicitly (i.e., it only has apply_deriv). The rows and columns
+        follow the layout in the bounds cache. Must be called after
+        calc_derivatives."""
+
+        comps = self._comp_edge_list()
+        n_edge = len(self.res)
+
+        def indices(node):
+            """Global indices in the residual vector for a node."""
+            i1, i2 = self.get_bounds(node)
+            if isinstance(i1, list):
+                return i1
+            return range(i1, i2)
+
+        # Like matvecFWD, later rows overwrite earlier ones.
+        row_data = {}
+
+        for compname, data in comps.iteritems():
+
+            comp_inputs = data['inputs']
+            comp_outputs = data['outputs']
+            comp_residuals = data['residuals']
+
+            if not comp_inputs or not comp_outputs:
+                continue
+
+            J = self._J_cache.get(compname)
+            if J is None:
+                return None
+
+            if '~' in compname:
+                comp = self._derivative_graph.node[compname]['pa_object']
+            else:
+                comp = self.scope.get(compname)
+
+            arg = {}
+            result = {}
+            for varname in comp_inputs:
+                arg[varname] = indices('%s.%s' % (compname, varname))
+            for varname in comp_outputs:
+                result[varname] = indices('%s.%s' % (compname, varname))
+                if varname not in comp_residuals:
+                    arg[varname] = result[varname]
+
+            input_keys, output_keys = list_deriv_vars(comp)
+            if comp._provideJ_bounds is None:
+                comp._provideJ_bounds = get_bounds(comp, input_keys,
+                                                   output_keys, J)
+            ibounds, obounds = comp._provideJ_bounds
+
+            # Same traversal as applyJ, but we keep the sub-Jacobians
+            # instead of multiplying by them.
+            for okey, rows in result.iteritems():
+
+                odx = None
+                if okey in obounds:
+                    o1, o2, osh = obounds[okey]
+                else:
+                    basekey, _, odx = okey.partition('[')
+                    o1, o2, osh = obounds[basekey]
+
+                blocks = []
+                if okey not in comp_residuals:
+                    blocks.append((rows, -identity(len(rows))))
+
+                used = set()
+                for ikey, cols in arg.iteritems():
+                    if ikey in result:
+                        continue
+
+                    idx = None
+                    if ikey in ibounds:
+                        i1, i2, ish = ibounds[ikey]
+                        if (i1, i2) in used:
+                            continue
+                        used.add((i1, i2))
+                    else:
+                        basekey, _, idx = ikey.partition('[')
+                        i1, i2, ish = ibounds[basekey]
+                        if (i1, i2, idx) in used or (i1, i2) in used:
+                            continue
+                        used.add((i1, i2, idx))
+
+                    Jsub = reduce_jacobian(J, i1, i2, idx, ish,
+                                           o1, o2, odx, osh)
+
+                    # unit pseudocomps scale the whole arg
+                    if isinstance(comp, PseudoComponent) and \
+                       comp._pseudo_type == 'units' and Jsub.shape == (1, 1):
+                        Jsub = Jsub[0][0] * identity(len(cols))
+
+                    blocks.append((cols, asarray(Jsub).reshape(len(rows),
+                                                               len(cols))))
+
+                for k, row in enumerate(rows):
+                    row_data[row] = [(bcols, block[k])
+                                     for bcols, block in blocks]
+
+        # Each parameter adds an equation
+        for src, targets in self._edges.iteritems():
+            if src.startswith('@in'):
+                if not isinstance(targets, list):
+                    targets = [targets]
+
+                for target in targets:
+                    for row in indices(target):
+                        row_data[row] = [([row], ones(1))]
+
+        rows = []
+        cols = []
+        vals = []
+        for row, entries in row_data.iteritems():
+            for icols, ivals in entries:
+                nonzero = ivals.nonzero()[0]
+                rows.extend([row]*len(nonzero))
+                cols.extend(asarray(icols)[nonzero])
+                vals.extend(ivals[nonzero])
+
+        return coo_matrix((vals, (rows, cols)),
+                          shape=(n_edge, n_edge)).tocsc()
+
+    def preconditioner(self, kind, adjoint=False):
+        """Returns a function that applies a preconditioner for the linear
+        system solved by calc_gradient (or its transpose, which is solved by
+        calc_gradient_adjoint, if `adjoint` is True) to a vector or a 2D
+        block of column vectors. Returns None if there is nothing to
+        precondition. Must be called after calc_derivatives.
+
+        kind: str
+            'component' applies the applyMinv (applyMinvT in adjoint)
+            function of each component that supplies one to the rows of its
+            outputs and leaves the other rows alone. 'block_jacobi' does the
+            same for the components that supply one, and inverts the
+            diagonal block of the workflow Jacobian for the rest.
+            'block_gauss_seidel' also carries each block's result into the
+            blocks of the components that run after it (before it, in
+            adjoint). The block kinds need every component to provide its
+            Jacobian, and fall back to 'component' otherwise. 'none'
+            returns None.
+        """
+
+        if kind == 'none':
+            return None
+
+        A = None
+        if kind != 'component':
+            A = self.assemble_jacobian()
+            if A is None:
+                self.parent._logger.warning("can't assemble the workflow "
+                                            "Jacobian because some components "
+                                            "don't provide it, so falling "
+                                            "back to the 'component' "
+                                            "preconditioner.")
+                kind = 'component'
+            else:
+                A = A.T.tocsr() if adjoint else A.tocsr()
+
+        ranks = dict((name, i)
+                     for i, name in enumerate(self.get_names(full=True)))
+        owned = set()
+        blocks = []
+
+        for compname, data in self._comp_edge_list().iteritems():
+
+            if not data['inputs'] or not data['outputs']:
+                continue
+
+            if '~' in compname:
+                comp = self._derivative_graph.node[compname]['pa_object']
+                rank = min([ranks.get(name, len(ranks))
+                            for name in comp.comps] or [len(ranks)])
+            else:
+                comp = self.scope.get(compname)
+                rank = ranks.get(compname, len(ranks))
+
+            varlist = []
+            rows = []
+            for varname in data['outputs']:
+                i1, i2 = self.get_bounds('%s.%s' % (compname, varname))
+                if not isinstance(i1, list):
+                    i1 = range(i1, i2)
+                varlist.append((varname, len(rows), len(rows) + len(i1)))
+                rows.extend(i1)
+
+            minv = 'applyMinvT' if adjoint else 'applyMinv'
+            if hasattr(comp, minv):
+                solve = self._minv_block(comp, compname, varlist, adjoint)
+            elif A is not None:
+                rows = sorted(set(rows))
+                try:
+                    solve = inv(A[rows][:, rows].toarray()).dot
+                except LinAlgError:
+                    continue
+            else:
+                continue
+
+            owned.update(rows)
+            blocks.append((rank, rows, solve))
+
+        if not blocks:
+            return None
+
+        # The rows nobody owns are mostly the parameter equations, which are
+        # just the identity.
+        blocks.sort(key=lambda block: block[0])
+        free = [i for i in range(A.shape[0]) if i not in owned] \
+               if A is not None else []
+        if free:
+            blocks.insert(0, (-1, free, lambda arg: arg))
+        if adjoint:
+            blocks.reverse()
+
+        if kind != 'block_gauss_seidel':
+
+            def apply_minv(arg):
+                """Apply the block diagonal preconditioner to arg."""
+                result = arg.copy()
+                for _, rows, solve in blocks:
+                    result[rows] = solve(arg[rows])
+                return result
+
+            return apply_minv
+
+        sub_rows = [A[rows] for _, rows, _ in blocks]
+
+        def apply_minv(arg):
+            """Apply the block Gauss-Seidel preconditioner to arg."""
+            result = zeros(arg.shape)
+            for (_, rows, solve), A_rows in zip(blocks, sub_rows):
+                result[rows] = solve(arg[rows] - A_rows.dot(result))
+            return result
+
+        return apply_minv
+
+    def _minv_block(self, comp, compname, varlist, adjoint):
+        """Returns a function that applies the applyMinv (or applyMinvT)
+        of `comp` to the part of a vector that belongs to its outputs.
+        `varlist` contains the name and the position in that part of each
+        output."""
+
+        func = applyMinvT if adjoint else applyMinv
+        shape_cache = self._shape_cache.get(compname)
+
+        def solve(arg):
+            """Apply the component's preconditioner to arg."""
+            inputs = dict((varname, arg[i1:i2].copy())
+                          for varname, i1, i2 in varlist)
+            inputs = func(comp, inputs, shape_cache)
+            result = zeros(arg.shape)
+            for varname, i1, i2 in varlist:
+                result[i1:i2] = inputs[varname].reshape(result[i1:i2].shape)
+            return result
+
+        return solve
+
     def derivative_graph(self, inputs=None, outputs=None, fd=False,
                          severed=None, group_nondif=True, add_implicit=True):
         """Returns the local graph that we use for derivatives.
@@ -1008,6 +1300,33 @@ class SequentialWorkflow(Workflow):
                 raise RunStopped('Stop requested')
         return comps
 
+    def _set_deriv_key(self, key):
+        """Switch the structure used for derivatives to the one for `key`,
+        saving the current one. The structure is rebuilt on demand if we
+        haven't seen `key` before."""
+
+        if key == self._deriv_key:
+            return
+
+        if self._deriv_key is not None:
+            self._deriv_structures[self._deriv_key] = \
+                dict([(name, getattr(self, name)) for name in _DERIV_STRUCTURE])
+
+        structure = self._deriv_structures.pop(key, None)
+        if structure is None:
+            self._derivative_graph = None
+            self._edges = None
+            self._comp_edges = None
+            self.res = None
+            self._bounds_cache = {}
+            self._shape_cache = {}
+            self._width_cache = {}
+        else:
+            for name, value in structure.items():
+                setattr(self, name, value)
+
+        self._deriv_key = key
+
     def calc_gradient(self, inputs=None, outputs=None, upscope=False, mode='auto'):
         """Returns the gradient of the passed outputs with respect to
         all passed inputs.
@@ -1026,7 +1345,8 @@ class SequentialWorkflow(Workflow):
         upscope: boolean
             This is set to True when our workflow is part of a subassembly that
             lies in a workflow that needs a gradient with respect to variables
-            outside of this workflow, so that the caches can be reset.
+            outside of this workflow. The caches for each set of inputs and
+            outputs are kept separately, so this no longer forces a reset.
 
         mode: string
             Set to 'forward' for forward mode, 'adjoint' for adjoint mode,
@@ -1043,14 +1363,13 @@ class SequentialWorkflow(Workflow):
             mode = 'fd'
 
         # This function can be called from a parent driver's workflow for
-        # assembly recursion. We have to clear our cache if that happens.
-        # We also have to clear it next time we arrive back in our workflow.
-        if upscope or self._upscoped:
-            self._derivative_graph = None
-            self._edges = None
-            self._comp_edges = None
-            self.res = None
-            self._upscoped = upscope
+        # assembly recursion, which asks for different inputs and outputs
+        # than our own driver does. The derivative graph, edges and residual
+        # layout are kept for each request until our configuration changes,
+        # so only the Jacobians are recalculated. As before, a structure built
+        # for one mode is reused by the other until the configuration changes.
+        self._set_deriv_key((_freeze(inputs), _freeze(outputs),
+                             self._config_generation))
 
         dgraph = self.derivative_graph(inputs, outputs, fd=(mode == 'fd'))
 
@@ -0,0 +1,127 @@
+""" A flat state vector for transferring array data between the components
+of an Assembly.
+"""
+
+import re
+
+# pylint: disable=E0611,F0401
+from numpy import ndarray, zeros
+
+from openmdao.main.interfaces import IComponent
+from openmdao.main.mp_support import has_interface
+
+# Connections that can live in the state vector are plain variables of
+# a child (or boundary variables, for sources).
+_SIMPLE_PATH = re.compile(r'^[A-Za-z_]\w*(\.[A-Za-z_]\w*)?$')
+
+
+class StateVector(object):
+    """A single contiguous array holding the values of the connected float
+    arrays in `scope`. Each source and all of its targets are set to the
+    same view into the array, so a transfer along one of these connections
+    costs nothing while the source component updates its output in place,
+    and a slice copy when it assigns a new array.
+
+    Since targets share storage with their source, a component must not
+    modify its connected array inputs in place.
+    """
+
+    def __init__(self, scope):
+        self.scope = scope
+        self._transfers = {}
+
+        graph = scope._depgraph
+        sources = {}
+        order = []
+        for src, dest, data in graph.edges_iter(data=True):
+            if 'conn' not in data or not self._can_transfer(graph, src, dest):
+                continue
+            if src not in sources:
+                obj, name = self._split(src)
+                sources[src] = (obj, name, getattr(obj, name), [])
+                order.append(src)
+            sources[src][3].append(dest)
+
+        self.data = zeros(sum([sources[src][2].size for src in order]))
+
+        offset = 0
+        for src in order:
+            obj, name, val, dests = sources[src]
+            view = self.data[offset:offset+val.size].reshape(val.shape)
+            offset += val.size
+            view[...] = val
+            setattr(obj, name, view)
+
+            for dest in dests:
+                dest_obj, dest_name = self._split(dest)
+                try:
+                    setattr(dest_obj, dest_name, view)
+                except Exception:
+                    continue
+                self._transfers[dest] = (obj, name, dest_obj, dest_name, view)
+
+    def update(self, path):
+        """Transfer data into the target variable `path` from its source.
+        Returns False if this can't be done through the state vector, in
+        which case the regular data transfer should be used."""
+
+        try:
+            obj, name, dest_obj, dest_name, view = self._transfers[path]
+        except KeyError:
+            return False
+
+        val = getattr(obj, name)
+        if val is not view:
+            if not isinstance(val, ndarray) or val.shape != view.shape or \
+               val.dtype != view.dtype:
+                return False
+            view[...] = val
+
+        # The target may have been set to something else since the last
+        # transfer.
+        if getattr(dest_obj, dest_name) is not view:
+            setattr(dest_obj, dest_name, view)
+        else:
+            # In-place array editing, by us or by the source, doesn't
+            # activate callback, so we must do it manually.
+            dest_obj._input_updated(dest_name)
+
+        return True
+
+    def _split(self, path):
+        """Return the object and attribute name referred to by `path`."""
+
+        cname, _, name = path.partition('.')
+        if name:
+            return getattr(self.scope, cname), name
+        return self.scope, cname
+
+    def _can_transfer(self, graph, src, dest):
+        """Return True if the connection from `src` to `dest` can be held
+        in the state vector."""
+
+        if not (_SIMPLE_PATH.match(src) and _SIMPLE_PATH.match(dest)):
+            return False
+        if '.' not in dest or graph.in_degree(dest) != 1 or \
+           graph.node[dest].get('iotype') != 'in':
+            return False
+
+        # Pseudocomponents do their own data handling.
+        for path in (src, dest):
+            cname = path.partition('.')[0]
+            if '.' in path and (cname.startswith('_pseudo_') or not
+                    has_interface(getattr(self.scope, cname), IComponent)):
+                return False
+
+        val = getattr(*self._split(src))
+        if not isinstance(val, ndarray) or val.dtype != float or \
+           val.size == 0:
+            return False
+
+        # Unit conversion needs the regular transfer.
+        src_units = self.scope.get_metadata(src, 'units')
+        dest_units = self.scope.get_metadata(dest, 'units')
+        if src_units and dest_units and src_units != dest_units:
+            return False
+
+        return True
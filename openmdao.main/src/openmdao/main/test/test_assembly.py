@@ -6,6 +6,8 @@ import shutil
 import unittest
 import logging
 
+from numpy import array, may_share_memory, ones, zeros
+
 from openmdao.main.api import Assembly, Component, Driver, SequentialWorkflow, \
                               set_as_top, SimulationRoot
 from openmdao.main.datatypes.api import Float, Instance, Int, Str, List, Array
@@ -96,6 +98,35 @@ class SimpleListComp(Component):
         self.d = [a-b for a, b in zip(self.a, self.b)]
 
 
+class ArrayInPlace(Component):
+
+    x = Array(zeros(3), iotype='in')
+    y = Array(zeros(3), iotype='out')
+
+    def execute(self):
+        self.y[:] = 2.0*self.x
+
+
+class ArrayAssign(Component):
+
+    x = Array(zeros(3), iotype='in')
+    y = Array(zeros(3), iotype='out')
+
+    def execute(self):
+        self.y = self.x + 1.0
+
+
+class ArrayUpdates(ArrayAssign):
+
+    def __init__(self):
+        super(ArrayUpdates, self).__init__()
+        self.updated = []
+
+    def _input_updated(self, name, fullpath=None):
+        super(ArrayUpdates, self)._input_updated(name, fullpath)
+        self.updated.append(name)
+
+
 class DummyComp(Component):
 
     r = Float(iotype='in')
@@ -956,6 +987,67 @@ subassy.comp3: ReRun.2-driverB.2-subassy.2-comp3"""
         self.assertEqual([c.name for c in asm.sub.driver.workflow],
                          ['newcomp2', 'newcomp3'])
 
+    def test_flat_transfer(self):
+        top = set_as_top(Assembly())
+        top.flat_transfer = True
+        top.add('comp1', ArrayInPlace())
+        top.add('comp2', ArrayAssign())
+        top.add('comp3', ArrayAssign())
+        top.add('comp4', ArrayInPlace())
+        top.driver.workflow.add(['comp1', 'comp2', 'comp3', 'comp4'])
+        top.connect('comp1.y', 'comp2.x')
+        top.connect('comp1.y', 'comp3.x')
+        top.connect('comp2.y', 'comp4.x')
+        top.comp1.x = ones(3)
+        top.run()
+
+        data = top._state_vector.data
+        self.assertEqual(data.shape, (6,))
+        self.assertTrue(top.comp2.x is top.comp1.y)
+        self.assertTrue(top.comp3.x is top.comp1.y)
+        self.assertTrue(may_share_memory(top.comp1.y, data))
+        self.assertTrue(may_share_memory(top.comp4.x, data))
+        self.assertFalse(may_share_memory(top.comp2.y, data))
+        self.assertEqual(list(top.comp3.y), [3., 3., 3.])
+        self.assertEqual(list(top.comp4.y), [6., 6., 6.])
+
+        top.comp1.x = array([1., 2., 3.])
+        top.run()
+        self.assertEqual(list(top.comp3.y), [3., 5., 7.])
+        self.assertEqual(list(top.comp4.y), [6., 10., 14.])
+
+        # Targets set elsewhere get put back into the state vector.
+        top.comp4.set('x', zeros(3), force=True)
+        top.run()
+        self.assertTrue(may_share_memory(top.comp4.x, data))
+        self.assertEqual(list(top.comp4.y), [6., 10., 14.])
+
+        # Configuration changes rebuild the state vector.
+        top.disconnect('comp1.y', 'comp3.x')
+        self.assertEqual(top._state_vector, None)
+        top.run()
+        self.assertFalse(top._state_vector.data is data)
+        self.assertEqual(list(top.comp4.y), [6., 10., 14.])
+
+    def test_flat_transfer_in_place(self):
+        top = set_as_top(Assembly())
+        top.flat_transfer = True
+        top.add('comp1', ArrayInPlace())
+        top.add('comp2', ArrayUpdates())
+        top.driver.workflow.add(['comp1', 'comp2'])
+        top.connect('comp1.y', 'comp2.x')
+        top.comp1.x = ones(3)
+        top.run()
+        self.assertTrue(top.comp2.x is top.comp1.y)
+
+        # The source edits the shared view in place, so the target must be
+        # told its input was updated.
+        top.comp2.updated = []
+        top.comp1.x = array([1., 2., 3.])
+        top.run()
+        self.assertEqual(top.comp2.updated, ['x'])
+        self.assertEqual(list(top.comp2.y), [3., 5., 7.])
+
 
 def pseudo_edges(index, num_inputs):
     pname = '_pseudo_%d' % index
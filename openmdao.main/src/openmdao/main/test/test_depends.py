@@ -475,6 +475,38 @@ class DependsTestCase2(unittest.TestCase):
         self.assertEqual(top.sub.aout[1], 176.)
         self.assertEqual(top.c3.ain[1], 176.)
 
+    def test_transfer_plan(self):
+        top = set_as_top(Assembly())
+        top.add('c1', ArrSimple())
+        top.add('c2', ArrSimple())
+        top.add('c3', ArrSimple())
+        top.driver.workflow.add(['c1', 'c2', 'c3'])
+        top.connect('c1.aout', 'c2.ain')
+        top.connect('c2.aout[3]', 'c3.ain[0]')
+        top.connect('c2.aout[1]+c1.aout[1]', 'c3.ain[1]')
+
+        top.run()
+        self.assertEqual(list(top.c3.ain), [12., 6., 2., 3.])
+        self.assertTrue(len(top._depgraph._dstvars) > 0)
+
+        # Replacing a component must not leave transfers bound to the old one.
+        top.add('c2', ArrSimple())
+        top.connect('c1.aout', 'c2.ain')
+        top.connect('c2.aout[3]', 'c3.ain[0]')
+        top.connect('c2.aout[1]+c1.aout[1]', 'c3.ain[1]')
+        top.driver.workflow.add('c2', index=1)
+        top.c1.ain = [1., 2., 3., 4.]
+        top.run()
+        self.assertEqual(list(top.c3.ain), [16., 12., 2., 3.])
+
+        # Compiled transfers aren't copied.
+        cpy = top.copy()
+        self.assertEqual(cpy._depgraph._dstvars, {})
+        cpy.c1.ain = [2., 2., 2., 2.]
+        cpy.run()
+        self.assertEqual(list(cpy.c3.ain), [8., 12., 2., 3.])
+        self.assertEqual(list(top.c3.ain), [16., 12., 2., 3.])
+
 
     def test_units(self):
         top = self.top
@@ -8,7 +8,7 @@ import re
 import unittest
 from mock import Mock
 
-from numpy import zeros, array, identity, random
+from numpy import zeros, array, identity, random, diag, arange, ones
 
 from openmdao.lib.architectures.api import MDF, CO
 from openmdao.lib.optproblems.api import UnitScalableProblem
@@ -16,7 +16,7 @@ from openmdao.lib.optproblems.api import UnitScalableProblem
 import openmdao.main.derivatives
 from openmdao.main.api import Component, VariableTree, Driver, Assembly, set_as_top
 from openmdao.main.datatypes.api import Array, Float, VarTree, Int
-from openmdao.main.derivatives import applyJ, applyJT
+from openmdao.main.derivatives import applyJ, applyJT, block_gmres
 from openmdao.main.hasparameters import HasParameters
 from openmdao.main.hasobjective import HasObjective
 from openmdao.main.hasconstraints import HasConstraints
@@ -3224,12 +3224,10 @@ class Testcase_preconditioning(unittest.TestCase):
                                               outputs=['comp.y1', 'comp.y2'],
                                               mode='forward')
 
-        print J
-        # TODO: transform back to original coords
-        #assert_rel_error(self, J[0, 0], 2.0, 0.0001)
-        #assert_rel_error(self, J[0, 1], 7.0, 0.0001)
-        #assert_rel_error(self, J[1, 0], 13.0, 0.0001)
-        #assert_rel_error(self, J[1, 1], -3.0, 0.0001)
+        assert_rel_error(self, J[0, 0], 2.0, 0.0001)
+        assert_rel_error(self, J[0, 1], 7.0, 0.0001)
+        assert_rel_error(self, J[1, 0], 13.0, 0.0001)
+        assert_rel_error(self, J[1, 1], -3.0, 0.0001)
 
         J = top.driver.workflow.calc_gradient(inputs=['comp.x1', 'comp.x2'],
                                               outputs=['comp.y1', 'comp.y2'],
@@ -3258,7 +3256,8 @@ class Testcase_preconditioning(unittest.TestCase):
         top.run()
 
         J = top.driver.workflow.calc_gradient(mode='forward')
-        print J
+        assert_rel_error(self, J[0, 0], 82.0, 0.0001)
+        assert_rel_error(self, J[0, 1], 93.0, 0.0001)
 
         top.driver.workflow.config_changed()
         J = top.driver.workflow.calc_gradient(mode='adjoint')
@@ -3369,6 +3368,68 @@ class Testcase_preconditioning(unittest.TestCase):
         assert_rel_error(self, J[1, 0], 2457.0, 0.0001)
         assert_rel_error(self, J[1, 1], -82.0, 0.0001)
 
+    def test_block_preconditioners(self):
+
+        top = set_as_top(Assembly())
+        for name in ('comp1', 'comp2', 'comp3'):
+            top.add(name, Comp2())
+        top.connect('comp1.y1', 'comp2.x1')
+        top.connect('comp1.y2', 'comp2.x2')
+        top.connect('comp2.y1', 'comp3.x1')
+        top.connect('comp2.y2', 'comp3.x2')
+        top.driver.workflow.add(['comp1', 'comp2', 'comp3'])
+        top.run()
+
+        wflow = top.driver.workflow
+        calls = []
+        for name in ('matvecFWD', 'matvecREV'):
+            func = getattr(wflow, name)
+            def counted(arg, func=func):
+                calls.append(arg)
+                return func(arg)
+            setattr(wflow, name, counted)
+
+        inputs = ['comp1.x1', 'comp1.x2']
+        outputs = ['comp3.y1', 'comp3.y2']
+        Jbase = wflow.calc_gradient(inputs, outputs, mode='forward')
+
+        for mode in ('forward', 'adjoint'):
+            for lin_solver in ('scipy_gmres', 'block_gmres'):
+                counts = {}
+                for precon in ('none', 'block_jacobi', 'block_gauss_seidel'):
+                    top.driver.gradient_options.lin_solver = lin_solver
+                    top.driver.gradient_options.preconditioner = precon
+                    wflow.config_changed()
+                    calls[:] = []
+                    J = wflow.calc_gradient(inputs, outputs, mode=mode)
+                    diff = abs(J - Jbase)
+                    assert_rel_error(self, diff.max(), 0.0, 1e-6)
+                    counts[precon] = len(calls)
+
+                # Gauss-Seidel solves a feed-forward chain exactly.
+                self.assertTrue(counts['block_gauss_seidel'] < counts['none'])
+                if lin_solver == 'block_gmres':
+                    self.assertEqual(counts['block_gauss_seidel'], 1)
+
+    def test_block_fallback(self):
+
+        top = set_as_top(Assembly())
+        top.add('comp1', Comp2())
+        top.add('comp2', ArrayComp2D_der())
+        top.driver.workflow.add(['comp1', 'comp2'])
+        top.connect('comp1.y1', 'comp2.x[0, 0]')
+        top.driver.gradient_options.preconditioner = 'block_gauss_seidel'
+        top.run()
+
+        wflow = top.driver.workflow
+        self.assertEqual(wflow.preconditioner('none'), None)
+
+        J = wflow.calc_gradient(['comp1.x1'], ['comp2.y[0, 0]'],
+                                mode='forward')
+        self.assertEqual(wflow.preconditioner('block_jacobi'), None)
+        self.assertEqual(wflow.preconditioner('component'), None)
+        assert_rel_error(self, J[0, 0], 6.0, 0.0001)
+
 
 class TestMultiDriver(unittest.TestCase):
 
@@ -3450,6 +3511,257 @@ class TestMultiDriver(unittest.TestCase):
         assert_rel_error(self, diff.max(), 0.0, .001)
 
 
+class Testcase_block_gmres(unittest.TestCase):
+    """ Unit test for solving all right-hand sides together """
+
+    def test_block_gmres(self):
+
+        A = array([[4.0, 1.0, 0.0],
+                   [1.0, 3.0, -1.0],
+                   [0.0, -1.0, 5.0]])
+        B = identity(3)
+        B[:, 2] = 0.0
+
+        X, info = block_gmres(A.dot, B)
+
+        self.assertEqual(list(info), [0, 0, 0])
+        diff = A.dot(X) - B
+        assert_rel_error(self, abs(diff).max(), 0.0, 1e-8)
+
+    def test_block_gmres_restart(self):
+
+        n = 30
+        A = diag(arange(1.0, n+1.0)) + 0.1*ones((n, n))
+        B = identity(n)[:, :4]
+
+        # Restarting every 3 iterations still converges, just more slowly.
+        X, info = block_gmres(A.dot, B, restart=3, maxiter=200)
+        self.assertEqual(list(info), [0, 0, 0, 0])
+        diff = A.dot(X) - B
+        assert_rel_error(self, abs(diff).max(), 0.0, 1e-8)
+
+        # Too few cycles reports the number of iterations taken.
+        X, info = block_gmres(A.dot, B, restart=3, maxiter=2)
+        self.assertEqual(list(info), [6, 6, 6, 6])
+
+    def test_two_comp(self):
+
+        top = set_as_top(Assembly())
+
+        top.add('comp1', PreComp())
+        top.add('comp2', Paraboloid())
+        top.connect('comp1.y1', 'comp2.x')
+        top.connect('comp1.y2', 'comp2.y')
+
+        top.add('driver', SimpleDriver())
+        top.driver.workflow.add(['comp1', 'comp2'])
+        top.driver.add_parameter('comp1.x1', low=-10, high=10)
+        top.driver.add_parameter('comp1.x2', low=-10, high=10)
+        top.driver.add_objective('comp2.f_xy')
+        top.driver.add_constraint('comp1.y1 < 3.0')
+
+        top.run()
+
+        for mode in ('forward', 'adjoint'):
+            top.driver.gradient_options.lin_solver = 'scipy_gmres'
+            top.driver.workflow.config_changed()
+            Jbase = top.driver.workflow.calc_gradient(mode=mode)
+
+            top.driver.gradient_options.lin_solver = 'block_gmres'
+            top.driver.workflow.config_changed()
+            J = top.driver.workflow.calc_gradient(mode=mode)
+
+            diff = abs(J - Jbase)
+            assert_rel_error(self, diff.max(), 0.0, 1e-8)
+
+            top.driver.gradient_options.gmres_block_size = 1
+            top.driver.workflow.config_changed()
+            J = top.driver.workflow.calc_gradient(mode=mode)
+
+            diff = abs(J - Jbase)
+            assert_rel_error(self, diff.max(), 0.0, 1e-8)
+            top.driver.gradient_options.gmres_block_size = 0
+
+    def test_apply_deriv(self):
+
+        top = set_as_top(Assembly())
+        top.add('comp1', ArrayComp2D_der())
+        top.driver.workflow.add(['comp1'])
+        top.driver.gradient_options.lin_solver = 'block_gmres'
+
+        top.run()
+        inputs = ['comp1.x[0, 0]', 'comp1.x[0, 1]']
+        outputs = ['comp1.y[1, 0]', 'comp1.y[1, 1]']
+
+        for mode in ('forward', 'adjoint'):
+            top.driver.workflow.config_changed()
+            J = top.driver.workflow.calc_gradient(inputs=inputs,
+                                                  outputs=outputs,
+                                                  mode=mode)
+            Jsub = top.comp1.J[2:4, 0:2]
+            diff = J - Jsub
+            assert_rel_error(self, diff.max(), 0.0, .000001)
+
+
+class Testcase_sparse_lu(unittest.TestCase):
+    """ Unit test for the assembled Jacobian and direct solve """
+
+    def _compare(self, top, inputs, outputs):
+
+        for mode in ('forward', 'adjoint'):
+            top.driver.gradient_options.lin_solver = 'scipy_gmres'
+            top.driver.workflow.config_changed()
+            Jbase = top.driver.workflow.calc_gradient(inputs=inputs,
+                                                      outputs=outputs,
+                                                      mode=mode)
+
+            top.driver.gradient_options.lin_solver = 'sparse_lu'
+            top.driver.workflow.config_changed()
+            J = top.driver.workflow.calc_gradient(inputs=inputs,
+                                                  outputs=outputs,
+                                                  mode=mode)
+
+            diff = abs(J - Jbase)
+            assert_rel_error(self, diff.max(), 0.0, 1e-8)
+
+    def test_assemble_jacobian(self):
+
+        top = set_as_top(Assembly())
+        top.add('comp1', Comp2())
+        top.add('comp2', Comp2())
+        top.connect('comp1.y1', 'comp2.x1')
+        top.driver.workflow.add(['comp1', 'comp2'])
+
+        src = ['comp1.x1', 'comp1.x2']
+        resp = ['comp2.y1', 'comp2.y2']
+        top.driver.workflow.calc_gradient(src, resp, mode='forward')
+
+        A = top.driver.workflow.assemble_jacobian().todense()
+
+        arg = zeros((5, ))
+        for j in range(5):
+            arg[j] = 1.0
+            col = top.driver.workflow.matvecFWD(arg)
+            arg[j] = 0.0
+            diff = abs(A[:, j].flatten() - col)
+            self.assertEqual(diff.max(), 0.0)
+
+    def test_arrays_units(self):
+
+        top = set_as_top(Assembly())
+        top.add('comp1', ArrayComp1_ft())
+        top.add('comp2', ArrayComp1_inch())
+        top.driver.workflow.add(['comp1', 'comp2'])
+        top.connect('comp1.y', 'comp2.x')
+        top.run()
+
+        self._compare(top, ['comp1.x'], ['comp2.y'])
+        self._compare(top, ['comp1.x[1]'], ['comp2.y[0]'])
+
+    def test_slices(self):
+
+        top = set_as_top(Assembly())
+        top.add('comp1', ArrayComp2D())
+        top.add('comp2', ArrayComp2D())
+        top.connect('comp1.y', 'comp2.x')
+        top.add('driver', SimpleDriver())
+        top.driver.workflow.add(['comp1', 'comp2'])
+        top.run()
+
+        self._compare(top, ['comp1.x[0, 1]', 'comp1.x[1, 0]'],
+                      ['comp2.y[1, 0]', 'comp2.y[0, 0]'])
+
+    def test_nested(self):
+
+        top = set_as_top(Assembly())
+        top.add('nest', Assembly())
+        top.nest.add('comp', ArrayComp2D())
+        top.driver.workflow.add(['nest'])
+        top.nest.driver.workflow.add(['comp'])
+        top.nest.create_passthrough('comp.x')
+        top.nest.create_passthrough('comp.y')
+        top.run()
+
+        self._compare(top, ['nest.x'], ['nest.y'])
+
+    def test_fallback(self):
+
+        top = set_as_top(Assembly())
+        top.add('comp1', ArrayComp2D_der())
+        top.driver.workflow.add(['comp1'])
+        top.run()
+
+        self._compare(top, ['comp1.x[0, 0]', 'comp1.x[0, 1]'],
+                      ['comp1.y[1, 0]', 'comp1.y[1, 1]'])
+
+
+class Testcase_deriv_cache(unittest.TestCase):
+    """ Unit test for reusing the derivative structure between calls """
+
+    def test_switch_requests(self):
+
+        top = set_as_top(Assembly())
+        top.add('comp', Paraboloid())
+        top.driver.workflow.add('comp')
+        top.comp.x = 3.0
+        top.comp.y = 5.0
+        top.run()
+        wflow = top.driver.workflow
+
+        J = wflow.calc_gradient(inputs=['comp.x', 'comp.y'],
+                                outputs=['comp.f_xy'])
+        assert_rel_error(self, J[0, 0], 5.0, 0.0001)
+        assert_rel_error(self, J[0, 1], 21.0, 0.0001)
+        dgraph = wflow._derivative_graph
+
+        J = wflow.calc_gradient(inputs=['comp.y'], outputs=['comp.f_xy'])
+        self.assertEqual(J.shape, (1, 1))
+        assert_rel_error(self, J[0, 0], 21.0, 0.0001)
+        self.assertTrue(wflow._derivative_graph is not dgraph)
+
+        # Back to the first request, with a new operating point.
+        top.comp.x = 4.0
+        top.run()
+        J = wflow.calc_gradient(inputs=['comp.x', 'comp.y'],
+                                outputs=['comp.f_xy'], upscope=True)
+        self.assertTrue(wflow._derivative_graph is dgraph)
+        assert_rel_error(self, J[0, 0], 7.0, 0.0001)
+        assert_rel_error(self, J[0, 1], 22.0, 0.0001)
+
+        wflow.config_changed()
+        J = wflow.calc_gradient(inputs=['comp.x', 'comp.y'],
+                                outputs=['comp.f_xy'])
+        self.assertTrue(wflow._derivative_graph is not dgraph)
+        assert_rel_error(self, J[0, 0], 7.0, 0.0001)
+
+    def test_nested(self):
+
+        top = set_as_top(Assembly())
+        top.add('nest', Assembly())
+        top.nest.add('comp', Paraboloid())
+        top.nest.driver.workflow.add('comp')
+        top.nest.create_passthrough('comp.x')
+        top.nest.create_passthrough('comp.y')
+        top.nest.create_passthrough('comp.f_xy')
+        top.driver.workflow.add('nest')
+        top.nest.x = 3.0
+        top.nest.y = 5.0
+        top.run()
+
+        J = top.driver.workflow.calc_gradient(inputs=['nest.x', 'nest.y'],
+                                              outputs=['nest.f_xy'])
+        assert_rel_error(self, J[0, 0], 5.0, 0.0001)
+        dgraph = top.nest.driver.workflow._derivative_graph
+
+        top.nest.x = 4.0
+        top.run()
+        J = top.driver.workflow.calc_gradient(inputs=['nest.x', 'nest.y'],
+                                              outputs=['nest.f_xy'])
+        assert_rel_error(self, J[0, 0], 7.0, 0.0001)
+        assert_rel_error(self, J[0, 1], 22.0, 0.0001)
+        self.assertTrue(top.nest.driver.workflow._derivative_graph is dgraph)
+
+
 if __name__ == '__main__':
     import nose
     import sys
@@ -32,6 +32,10 @@ class SimpleCompArray(Component):
                         [2.0, 5.0, 1.5, 2.0]])
         self.y = self.J.dot(self.x.flatten()).reshape((2, 2))
 
+class SimpleCompArraySafe(SimpleCompArray):
+
+    complex_step_safe = True
+
 
 class TreeWithFloat(VariableTree):
 
@@ -302,6 +306,68 @@ class Testcase_ComplexStep_Derivatives(unittest.TestCase):
         assert_rel_error(self, diff, 0.0, .0001)
         self.assertTrue(J[0, 0] is not complex)
 
+    def test_simple_float_restored(self):
+
+        model = set_as_top(Assembly())
+        model.add('comp', SimpleCompFloat())
+        model.driver.workflow.add('comp')
+        model.driver.gradient_options.fd_form = 'complex_step'
+        model.driver.gradient_options.fd_step = 0.1
+        model.run()
+
+        J = model.driver.workflow.calc_gradient(inputs=['comp.x'],
+                                                outputs=['comp.y'])
+
+        assert_rel_error(self, J[0, 0], 2.0, .000001)
+        self.assertEqual(model.comp.x, 3.0)
+
+    def test_array_complex_safe(self):
+
+        model = set_as_top(Assembly())
+        model.add('comp', SimpleCompArraySafe())
+        model.driver.workflow.add('comp')
+        model.driver.gradient_options.fd_form = 'complex_step'
+        model.run()
+        x = model.comp.x.copy()
+
+        J = model.driver.workflow.calc_gradient(inputs=['comp.x'],
+                                                outputs=['comp.y'])
+
+        diff = abs(J - model.comp.J).max()
+        assert_rel_error(self, diff, 0.0, 1e-12)
+        self.assertEqual(model.comp.x.dtype, x.dtype)
+        self.assertTrue((model.comp.x == x).all())
+
+        # Indexed inputs and directional derivatives.
+        model.driver.gradient_options.directional_fd = True
+        model.driver.workflow.config_changed()
+        J = model.driver.workflow.calc_gradient(inputs=['comp.x[0, 1]'],
+                                                outputs=['comp.y'])
+
+        diff = abs(J[:, 0] - model.comp.J[:, 1]).max()
+        assert_rel_error(self, diff, 0.0, 1e-12)
+        self.assertEqual(model.comp.x.dtype, x.dtype)
+        self.assertTrue((model.comp.x == x).all())
+
+    def test_array_fallback(self):
+
+        # Undeclared components don't get complex arrays, so we should fall
+        # back to central difference.
+        model = set_as_top(Assembly())
+        model.add('comp', SimpleCompArray())
+        model.driver.workflow.add('comp')
+        model.driver.gradient_options.fd_form = 'complex_step'
+        model.run()
+        x = model.comp.x.copy()
+
+        J = model.driver.workflow.calc_gradient(inputs=['comp.x'],
+                                                outputs=['comp.y'])
+
+        diff = abs(J - model.comp.J).max()
+        assert_rel_error(self, diff, 0.0, .0001)
+        self.assertEqual(model.comp.x.dtype, x.dtype)
+        assert_rel_error(self, abs(model.comp.x - x).max(), 0.0, 1e-12)
+
     def test_mixed_CS_FD(self):
 
         model = set_as_top(Assembly())
@@ -2,12 +2,20 @@
 Specific unit testing for finite difference.
 """
 
+import glob
+import os
+import shutil
+import tempfile
+import threading
 import unittest
 
 import numpy as np
+from mock import patch
 
-from openmdao.main.api import Component, VariableTree, Driver, Assembly, set_as_top
+from openmdao.main.api import Component, VariableTree, Driver, Assembly, \
+                              Container, SimulationRoot, set_as_top
 from openmdao.main.datatypes.api import Float, Array
+from openmdao.main.finite_difference import color_columns
 from openmdao.main.test.test_derivatives import SimpleDriver, ArrayComp2D
 from openmdao.test.execcomp import ExecCompWithDerivatives, ExecComp
 from openmdao.util.testutil import assert_rel_error
@@ -77,6 +85,92 @@ class ArrayParaboloid(Component):
         x = self.x
         self.f_x = (x[0][0]-3.0)**2 + x[0][0]*x[0][1] + (x[0][1]+4.0)**2 - 3.0
 
+class BandedComp(Component):
+    """ Each output depends on its neighboring inputs. """
+
+    x = Array(np.ones(6), iotype='in')
+    y = Array(np.zeros(6), iotype='out')
+
+    def execute(self):
+        x = self.x
+        y = 3.0*x**2
+        y[1:] += 2.0*x[:-1]
+        y[:-1] += x[1:]
+        self.y = y
+
+    def expected_J(self):
+        x = self.x
+        return np.diag(6.0*x) + np.diag(2.0*np.ones(5), -1) + \
+               np.diag(np.ones(5), 1)
+
+
+_SERVER_LOCK = threading.Lock()
+
+
+class _InProcessModel(object):
+    """ Stands in for a model loaded into a server. """
+
+    def __init__(self, tlo):
+        self.tlo = tlo
+
+    def get(self, path):
+        return self.tlo.get(path)
+
+    def set(self, path, value, force=False):
+        self.tlo.set(path, value, force=force)
+
+    def run(self):
+        # Components change directory when they run, which would disturb
+        # loading or running in other threads.
+        with _SERVER_LOCK:
+            self.tlo.run()
+
+
+class _InProcessServer(object):
+    """ Stands in for a server from the ResourceAllocationManager. """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def load_model(self, egg_file):
+        # Components change directory when they run, so don't depend on the
+        # current directory.
+        with _SERVER_LOCK:
+            orig_dir = os.getcwd()
+            os.chdir(self.directory)
+            try:
+                return _InProcessModel(Container.load_from_eggfile(egg_file))
+            finally:
+                os.chdir(orig_dir)
+
+
+class _InProcessRAM(object):
+    """ Hands out in-process servers so concurrent FD can be tested without
+    starting server processes. """
+
+    allocated = 0
+    released = 0
+    max_count = 4
+    directory = None
+
+    @staticmethod
+    def max_servers(resource_desc):
+        return _InProcessRAM.max_count
+
+    @staticmethod
+    def list_allocators():
+        return []
+
+    @staticmethod
+    def allocate(resource_desc):
+        _InProcessRAM.allocated += 1
+        return _InProcessServer(_InProcessRAM.directory), {'name': 'fd_server'}
+
+    @staticmethod
+    def release(server):
+        _InProcessRAM.released += 1
+
+
 class TestFiniteDifference(unittest.TestCase):
 
     def test_fd_step(self):
@@ -350,6 +444,193 @@ class TestFiniteDifference(unittest.TestCase):
         assert_rel_error(self, J[0, 2], 6.0, 0.001)
         assert_rel_error(self, J[0, 3], 5.0, 0.001)
 
+    def test_fd_servers(self):
+
+        def build():
+            top = set_as_top(Assembly())
+            top.add('comp', ArrayComp2D())
+            top.add('comp2', MyComp())
+            top.add('driver', SimpleDriver())
+            top.driver.workflow.add(['comp', 'comp2'])
+            top.comp.force_fd = True
+            top.comp2.force_fd = True
+
+            top.driver.add_parameter('comp.x', low=-100, high=100)
+            top.driver.add_parameter('comp2.x1', low=-100, high=100)
+            top.driver.add_parameter('comp2.x3', low=-100, high=100)
+            top.driver.add_constraint('comp.y[0][-1] < 1.0')
+            top.driver.add_constraint('sum(comp.y) < 4.0')
+            top.driver.add_constraint('comp2.y < 4.0')
+            top.comp.x = np.array([[1.0, 2.0], [3.0, 4.0]])
+            return top
+
+        top = build()
+        top.run()
+        expected = top.driver.workflow.calc_gradient(mode='forward')
+
+        top = build()
+        top.driver.gradient_options.fd_servers = 4
+        top.run()
+
+        _InProcessRAM.allocated = 0
+        _InProcessRAM.released = 0
+        orig_dir = os.getcwd()
+        tmp_dir = os.path.realpath(tempfile.mkdtemp())
+        # The in-process servers share our SimulationRoot.
+        SimulationRoot.chroot(tmp_dir)
+        _InProcessRAM.directory = tmp_dir
+        try:
+            with patch('openmdao.main.finite_difference.RAM', _InProcessRAM), \
+                 patch('openmdao.main.finite_difference.filexfer'):
+                J = top.driver.workflow.calc_gradient(mode='forward')
+
+                self.assertEqual(_InProcessRAM.allocated, 7)
+                self.assertEqual(_InProcessRAM.released, 0)
+                np.testing.assert_allclose(J, expected, rtol=1e-6)
+
+                # The local model is left at its base point.
+                self.assertEqual(top.comp.x[1][0], 3.0)
+                assert_rel_error(self, top.comp2.x1, 1.0, 1e-12)
+
+                # Servers and their models are kept, and changed inputs are
+                # sent to them.
+                base = build()
+                for model in (base, top):
+                    model.comp.x = np.array([[2.0, -1.0], [0.5, 3.0]])
+                    model.comp2.x1 = 2.5
+                    model.run()
+                expected = base.driver.workflow.calc_gradient(mode='forward')
+                J = top.driver.workflow.calc_gradient(mode='forward')
+
+                self.assertEqual(_InProcessRAM.allocated, 7)
+                self.assertEqual(_InProcessRAM.released, 0)
+                np.testing.assert_allclose(J, expected, rtol=1e-6)
+                self.assertEqual(len(glob.glob('fd-replicant*.egg')), 2)
+
+                # Kept servers that aren't used by a call are released, since
+                # they would miss its changed inputs.
+                _InProcessRAM.max_count = 2
+                for model in (base, top):
+                    model.comp.x = np.array([[-1.0, 0.5], [1.5, 2.0]])
+                    model.comp2.x1 = -1.5
+                    model.run()
+                expected = base.driver.workflow.calc_gradient(mode='forward')
+                J = top.driver.workflow.calc_gradient(mode='forward')
+
+                self.assertEqual(_InProcessRAM.allocated, 7)
+                self.assertEqual(_InProcessRAM.released, 3)
+                np.testing.assert_allclose(J, expected, rtol=1e-6)
+
+                _InProcessRAM.max_count = 4
+                for model in (base, top):
+                    model.comp2.x1 = 0.5
+                    model.run()
+                expected = base.driver.workflow.calc_gradient(mode='forward')
+                J = top.driver.workflow.calc_gradient(mode='forward')
+
+                self.assertEqual(_InProcessRAM.allocated, 10)
+                np.testing.assert_allclose(J, expected, rtol=1e-6)
+
+                # A configuration change releases them.
+                top.driver.remove_constraint('comp2.y < 4.0')
+                self.assertEqual(_InProcessRAM.released, 10)
+                self.assertEqual(glob.glob('fd-replicant*.egg'), [])
+
+                top.run()
+                top.driver.workflow.calc_gradient(mode='forward')
+                allocated = _InProcessRAM.allocated
+                self.assertTrue(allocated > 10)
+
+                # As does deleting the model.
+                top.pre_delete()
+                self.assertEqual(_InProcessRAM.released, allocated)
+                self.assertEqual(glob.glob('fd-replicant*.egg'), [])
+        finally:
+            _InProcessRAM.max_count = 4
+            SimulationRoot.chroot(orig_dir)
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def test_color_columns(self):
+
+        sparsity = np.array([[1, 1, 0, 0],
+                             [0, 1, 1, 0],
+                             [0, 0, 1, 1],
+                             [1, 0, 0, 0]], dtype=bool)
+        groups = color_columns(sparsity)
+        self.assertEqual(sorted([sorted(group) for group in groups]),
+                         [[0, 2], [1, 3]])
+
+        groups = color_columns(np.ones((3, 3), dtype=bool))
+        self.assertEqual(len(groups), 3)
+
+    def test_fd_coloring_probe(self):
+
+        top = set_as_top(Assembly())
+        top.add('comp', BandedComp())
+        top.driver.workflow.add('comp')
+        top.driver.gradient_options.fd_coloring = 'probe'
+
+        def calc(x, runs, atol=1e-4):
+            top.comp.x = np.array(x)
+            top.run()
+            count = top.comp.exec_count
+            J = top.driver.workflow.calc_gradient(inputs=['comp.x'],
+                                                  outputs=['comp.y'],
+                                                  mode='fd')
+            self.assertEqual(top.comp.exec_count - count, runs)
+            np.testing.assert_allclose(J, top.comp.expected_J(), atol=atol)
+
+        # The first calls probe the sparsity pattern with full passes. The
+        # diagonal entry for x[2] vanishes at the first point, but not at
+        # the second.
+        calc([1.0, 2.0, 0.0, 4.0, 5.0, 6.0], 6)
+        calc([1.0, 2.0, 0.0, 4.0, 5.0, 6.0], 6)
+        calc([2.0, 1.0, 4.0, 3.0, 6.0, 5.0], 6)
+
+        # Later calls only need one run per color.
+        calc([3.0, 2.0, 1.0, 2.0, 3.0, 4.0], 3)
+
+        top.driver.gradient_options.fd_form = 'central'
+        top.driver.workflow.config_changed()
+        calc([1.0, 2.0, 3.0, 4.0, 5.0, 6.0], 12, 1e-6)
+        calc([2.0, 1.0, 4.0, 3.0, 6.0, 5.0], 12, 1e-6)
+        calc([3.0, 2.0, 1.0, 2.0, 3.0, 4.0], 6, 1e-6)
+
+    def test_fd_coloring_declared(self):
+
+        top = set_as_top(Assembly())
+        for name in ('c1', 'c2', 'c3'):
+            top.add(name, MyComp())
+        top.add('driver', SimpleDriver())
+        top.driver.workflow.add(['c1', 'c2', 'c3'])
+        top.driver.gradient_options.fd_coloring = 'declared'
+        for name in ('c1', 'c2', 'c3'):
+            top.driver.add_parameter(name+'.x1', low=-100, high=100)
+            top.driver.add_parameter(name+'.x2', low=-100, high=100)
+            top.driver.add_constraint(name+'.y < 10.0')
+        top.run()
+
+        count = top.c1.exec_count
+        J = top.driver.workflow.calc_gradient(mode='fd')
+        self.assertEqual(top.c1.exec_count - count, 2)
+
+        expected = np.zeros((3, 6))
+        for k in range(3):
+            expected[k, 2*k] = 4.0
+            expected[k, 2*k+1] = 4.2
+        np.testing.assert_allclose(J, expected, rtol=1e-4)
+
+        # A connection between components shows up in the pattern.
+        top.connect('c1.y', 'c3.x3')
+        top.run()
+        J = top.driver.workflow.calc_gradient(mode='fd')
+        self.assertNotEqual(J[2, 0], 0.0)
+
+        top.driver.gradient_options.fd_coloring = 'none'
+        top.driver.workflow.config_changed()
+        expected = top.driver.workflow.calc_gradient(mode='fd')
+        np.testing.assert_allclose(J, expected, rtol=1e-6)
+
 if __name__ == '__main__':
     import nose
     import sys
@@ -2,15 +2,24 @@
 Test mp_util.py
 """
 
+import glob
 import logging
 import os.path
 import socket
 import sys
+import tempfile
+import threading
 import unittest
 import nose
 
+from multiprocessing import Pipe
+
+from numpy import arange, asfortranarray, ones
+
 from openmdao.main.mp_util import read_server_config, read_allowed_hosts, \
-                                  is_legal_connection
+                                  is_legal_connection, send_message, \
+                                  unpack_message, request_shared_memory, \
+                                  answer_shared_request, _SHARED_DIR
 
 from openmdao.util.publickey import make_private, HAVE_PYWIN32
 from openmdao.util.testutil import assert_raises
@@ -125,6 +134,122 @@ class TestCase(unittest.TestCase):
             finally:
                 os.remove('hosts.allow')
 
+    def test_send_message(self):
+        logging.debug('')
+        logging.debug('test_send_message')
+
+        sender, receiver = Pipe()
+
+        def transfer(obj, session_key='', shared=False):
+            received = []
+            def receive():
+                msg = receiver.recv()
+                received.append(unpack_message(msg, receiver, session_key))
+            thread = threading.Thread(target=receive)
+            thread.start()
+            send_message(sender, obj, session_key, shared)
+            thread.join()
+            return received[0]
+
+        # Small messages are unchanged.
+        self.assertEqual(transfer(('#RETURN', [1, 2.5, 'a'])),
+                         ('#RETURN', [1, 2.5, 'a']))
+
+        big = arange(100000.).reshape((500, 200))
+        fortran = asfortranarray(big)
+        strided = big[:, ::2]
+        small = ones(10)
+        result = transfer(('#RETURN', [big, fortran, strided, small, big]))
+        self.assertEqual(result[0], '#RETURN')
+        result = result[1]
+        for received, sent in zip(result, (big, fortran, strided, small)):
+            self.assertEqual(received.shape, sent.shape)
+            self.assertEqual(received.dtype, sent.dtype)
+            self.assertTrue((received == sent).all())
+        self.assertTrue(result[1].flags.f_contiguous)
+        self.assertTrue(result[4] is result[0])
+
+        # Arrays are pickled within encrypted messages.
+        result = transfer(('#RETURN', big), session_key='0123456789abcdef')
+        self.assertTrue((result[1] == big).all())
+
+        # Check for shared memory access.
+        replies = []
+        def answer():
+            replies.append(answer_shared_request(receiver.recv(), receiver))
+        thread = threading.Thread(target=answer)
+        thread.start()
+        self.assertTrue(request_shared_memory(sender))
+        thread.join()
+        self.assertEqual(replies, [True])
+
+        sender.send(('#SHARED_REQUEST', 'no-such-file', 'token'))
+        self.assertFalse(answer_shared_request(receiver.recv(), receiver))
+        self.assertFalse(sender.recv())
+        self.assertEqual(answer_shared_request(('#RETURN', 1), receiver), None)
+
+        # Only regular files in the shared directory are read, and only
+        # as much as the token.
+        def answered(path, token):
+            sender.send(('#SHARED_REQUEST', path, token))
+            reply = answer_shared_request(receiver.recv(), receiver)
+            self.assertEqual(sender.recv(), reply)
+            return reply
+
+        with open('omdao-token', 'w') as out:
+            out.write('token')
+        try:
+            self.assertFalse(answered(os.path.abspath('omdao-token'), 'token'))
+            if _SHARED_DIR is not None:
+                fd, path = tempfile.mkstemp(prefix='omdao-', dir=_SHARED_DIR)
+                os.write(fd, 'token')
+                os.close(fd)
+                link = path + '-link'
+                os.symlink(os.path.abspath('omdao-token'), link)
+                try:
+                    self.assertTrue(answered(path, 'token'))
+                    self.assertFalse(answered(path, 'tok'))
+                    self.assertFalse(answered(link, 'token'))
+                    self.assertFalse(answered(path.replace('omdao-', 'x-'),
+                                              'token'))
+                finally:
+                    os.remove(path)
+                    os.remove(link)
+
+            # Files named in received messages aren't mapped or removed.
+            msg = ('#SHARED', '', os.path.abspath('omdao-token'), [])
+            self.assertRaises(RuntimeError, unpack_message, msg, receiver, '')
+            self.assertTrue(os.path.exists('omdao-token'))
+        finally:
+            os.remove('omdao-token')
+
+        # Arrays via shared memory are views of the mapped file.
+        result = transfer(('#RETURN', [big, fortran, strided, small, big]),
+                          shared=True)[1]
+        for received, sent in zip(result, (big, fortran, strided, small)):
+            self.assertEqual(received.shape, sent.shape)
+            self.assertEqual(received.dtype, sent.dtype)
+            self.assertTrue((received == sent).all())
+        self.assertTrue(result[1].flags.f_contiguous)
+        self.assertTrue(result[4] is result[0])
+        self.assertFalse(result[0].flags.owndata)
+        result[0][0, 0] = -1.
+        self.assertEqual(big[0, 0], 0.)
+
+        # The sender removes the file if the message can't be sent.
+        class BrokenConnection(object):
+            def send(self, obj):
+                raise IOError('broken')
+        if _SHARED_DIR is not None:
+            pattern = os.path.join(_SHARED_DIR, 'omdao-*')
+            before = set(glob.glob(pattern))
+            self.assertRaises(IOError, send_message, BrokenConnection(),
+                              ('#RETURN', big), '', True)
+            self.assertEqual(set(glob.glob(pattern)), before)
+
+        sender.close()
+        receiver.close()
+
 
 if __name__ == '__main__':
     sys.argv.append('--cover-package=openmdao.main')
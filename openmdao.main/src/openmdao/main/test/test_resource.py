@@ -558,6 +558,28 @@ max_load: 100
         assert_raises(self, "allocator.release(None)",
                       globals(), locals(), NotImplementedError, 'release')
 
+        self.assertTrue(allocator.check_load(None))
+
+    def test_check_load(self):
+        logging.debug('')
+        logging.debug('test_check_load')
+
+        # Servers not allocated by RAM aren't checked.
+        self.assertTrue(RAM.check_load(None))
+
+        if not hasattr(os, 'getloadavg'):  # Not available on Windows.
+            return
+
+        local = LocalAllocator('Loaded', total_cpus=2, max_load=1.0)
+        orig_getloadavg = os.getloadavg
+        try:
+            os.getloadavg = lambda: (2.5, 2.0, 2.0)
+            self.assertTrue(local.check_load(None))
+            os.getloadavg = lambda: (3.5, 2.0, 2.0)
+            self.assertFalse(local.check_load(None))
+        finally:
+            os.getloadavg = orig_getloadavg
+
     def test_request(self):
         logging.debug('')
         logging.debug('test_request')
@@ -0,0 +1,146 @@
+"""
+Test of ParallelWorkflow.
+"""
+
+import threading
+import time
+import unittest
+
+from openmdao.main.api import Assembly, Component, ParallelWorkflow, \
+                              set_as_top
+from openmdao.main.datatypes.api import Bool, Float
+
+
+class Tracker(object):
+    """ Keeps track of how many components are running at once. """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+
+    def enter(self):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+
+    def leave(self):
+        with self.lock:
+            self.active -= 1
+
+
+class Slow(Component):
+
+    x = Float(1.0, iotype='in')
+    y = Float(iotype='out')
+    fail = Bool(False, iotype='in')
+
+    def __init__(self, tracker, factor=2.0):
+        super(Slow, self).__init__()
+        self.tracker = tracker
+        self.factor = factor
+
+    def execute(self):
+        self.tracker.enter()
+        try:
+            time.sleep(0.05)
+            if self.fail:
+                self.raise_exception('failed', RuntimeError)
+            self.y = self.factor*self.x
+        finally:
+            self.tracker.leave()
+
+
+class Sum(Component):
+
+    a = Float(iotype='in')
+    b = Float(iotype='in')
+    c = Float(iotype='in')
+    y = Float(iotype='out')
+
+    def execute(self):
+        self.y = self.a + self.b + self.c
+
+
+class ParallelWorkflowTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tracker = Tracker()
+        top = self.top = set_as_top(Assembly())
+        top.driver.workflow = ParallelWorkflow()
+        top.add('pre', Slow(self.tracker))
+        top.add('c1', Slow(self.tracker, 2.0))
+        top.add('c2', Slow(self.tracker, 3.0))
+        top.add('c3', Slow(self.tracker, 4.0))
+        top.add('post', Sum())
+        top.driver.workflow.add(['pre', 'c1', 'c2', 'c3', 'post'])
+        for name in ('c1', 'c2', 'c3'):
+            top.connect('pre.y', name+'.x')
+        top.connect('c1.y', 'post.a')
+        top.connect('c2.y', 'post.b')
+        top.connect('c3.y', 'post.c')
+
+    def test_levels(self):
+        levels = self.top.driver.workflow.get_levels()
+        self.assertEqual(levels[0], ['pre'])
+        self.assertEqual(sorted(levels[1]), ['c1', 'c2', 'c3'])
+        self.assertEqual(levels[2], ['post'])
+
+        self.top.disconnect('pre.y', 'c3.x')
+        levels = self.top.driver.workflow.get_levels()
+        self.assertEqual(sorted(levels[0]), ['c3', 'pre'])
+
+    def test_run(self):
+        self.top.pre.x = 2.0
+        self.top.run()
+        self.assertEqual(self.top.post.y, 36.0)
+        self.assertEqual(self.tracker.max_active, 3)
+        self.assertEqual([self.top.get(name).exec_count
+                          for name in ('pre', 'c1', 'c2', 'c3', 'post')],
+                         [1, 1, 1, 1, 1])
+
+    def test_max_threads(self):
+        self.top.driver.workflow.max_threads = 2
+        self.top.run()
+        self.assertEqual(self.top.post.y, 18.0)
+        self.assertEqual(self.tracker.max_active, 2)
+
+    def test_directory(self):
+        self.top.c2.directory = '.'
+        self.top.run()
+        self.assertEqual(self.top.post.y, 18.0)
+        self.assertEqual(self.tracker.max_active, 2)
+
+    def test_assembly(self):
+        # Assemblies run workflows of their own, so they aren't threaded.
+        sub = self.top.add('sub', Assembly())
+        sub.add('inner', Slow(self.tracker, 5.0))
+        sub.driver.workflow.add('inner')
+        sub.create_passthrough('inner.x')
+        sub.create_passthrough('inner.y')
+        self.top.driver.workflow.add('sub')
+        self.top.connect('pre.y', 'sub.x')
+
+        levels = self.top.driver.workflow.get_levels()
+        self.assertEqual(sorted(levels[1]), ['c1', 'c2', 'c3', 'sub'])
+
+        self.top.run()
+        self.assertEqual(self.top.sub.y, 10.0)
+        self.assertEqual(self.tracker.max_active, 3)
+        self.assertEqual([self.top.get(name).get_itername()
+                          for name in ('c1', 'c2', 'c3', 'sub')],
+                         ['1-c1', '1-c2', '1-c3', '1-sub'])
+
+    def test_failure(self):
+        self.top.c2.fail = True
+        try:
+            self.top.run()
+        except RuntimeError as err:
+            self.assertEqual(str(err), 'c2 (1-c2): failed')
+        else:
+            self.fail('RuntimeError expected')
+        self.assertEqual(self.top.post.exec_count, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
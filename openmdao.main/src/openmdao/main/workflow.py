@@ -128,19 +128,8 @@ class Workflow(object):
             record_case = False
 
         err = None
-        scope = self.scope
         try:
-            for comp in self:
-                # before the workflow runs each component, update that
-                # component's inputs based on the graph
-                scope.update_inputs(comp.name, graph=self._var_graph)
-                if isinstance(comp, PseudoComponent):
-                    comp.run(ffd_order=ffd_order)
-                else:
-                    comp.set_itername('%s-%s' % (iterbase, comp.name))
-                    comp.run(ffd_order=ffd_order, case_uuid=case_uuid)
-                if self._stop:
-                    raise RunStopped('Stop requested')
+            self._run_components(iterbase, ffd_order, case_uuid)
         except Exception:
             err = sys.exc_info()
 
@@ -158,6 +147,25 @@ class Workflow(object):
             # the parts of the tuple.
             raise err[0], err[1], err[2]
 
+    def _run_components(self, iterbase, ffd_order, case_uuid):
+        """Run each of our Components in turn."""
+        scope = self.scope
+        for comp in self:
+            # before the workflow runs each component, update that
+            # component's inputs based on the graph
+            scope.update_inputs(comp.name, graph=self._var_graph)
+            self._run_component(comp, iterbase, ffd_order, case_uuid)
+            if self._stop:
+                raise RunStopped('Stop requested')
+
+    def _run_component(self, comp, iterbase, ffd_order, case_uuid):
+        """Run a single Component whose inputs have been updated."""
+        if isinstance(comp, PseudoComponent):
+            comp.run(ffd_order=ffd_order)
+        else:
+            comp.set_itername('%s-%s' % (iterbase, comp.name))
+            comp.run(ffd_order=ffd_order, case_uuid=case_uuid)
+
     def configure_recording(self, includes, excludes):
         """Called at start of top-level run to configure case recording.
         Returns set of paths for changing inputs."""
@@ -385,6 +393,10 @@ class Workflow(object):
         """
         self._var_graph = None
 
+    def release_servers(self):
+        """Release any servers kept for evaluating derivatives."""
+        pass
+
     def remove(self, comp):
         """Remove a component from this Workflow by name."""
         raise NotImplementedError("This Workflow has no 'remove' function")